@@ -1,15 +1,18 @@
-from system.file_management import Statements, Jdict
+from system.file_management import Statements, Jdict, Aggregates
 
 """ a module for working with classified data.
 It uses data from classified.xlsx and removes
 any transactions with blank type for consitency """
 
-classified = Statements("classified")
-unclassified = classified.get_attr("Type").isna()
-classified.filter(~unclassified, inplace=True)
-
-def get_classified():
-    """ Return classified data"""
+def get_classified(start=None, end=None):
+    """ Return classified data without transactions with
+    blank type. Only transactions dated between start and
+    end, inclusive, are returned if either is given. """
+    classified = Statements("classified")
+    if start is not None or end is not None:
+        classified = classified.select_dates(start, end)
+    unclassified = classified.get_attr("Type").isna()
+    classified.filter(~unclassified, inplace=True)
     return classified
 
 def add_date_cols(df):
@@ -22,6 +25,7 @@ def add_date_cols(df):
     df.set_values("Week", date_col.map(lambda dt: dt.isocalendar()[1]))
     df.set_values("YearMonth", date_col.map(lambda dt: dt.replace(day=1)))
     df.set_values("Year", date_col.map(lambda dt: dt.replace(month=1,day=1)))
+    df.downcast(["delta", "Week"])
 
 def remove_blacklist(data):
     """ Remove blacklisted data from dataframe"""
@@ -29,3 +33,19 @@ def remove_blacklist(data):
     blacklist = categories.lookup("BLACKLIST")
     bad_data = data.get_attr("Type").isin(blacklist)
     data.filter(~bad_data, inplace=True)
+    types = data.get_attr("Type")
+    if types.dtype.name == "category":
+        # Blacklisted categories would still show up in pivot tables
+        data.set_values("Type", types.cat.remove_unused_categories())
+
+def get_totals(timeframe, data=None):
+    """ Return a pivot table of total amounts of each category
+    for each "Month" or "Year", without blacklisted categories.
+    Categories are in the index and timeframes in columns. It
+    is read from the aggregate cube of classified data, or
+    built from data if only some transactions are used. """
+    cube = None if data is None else Aggregates.build(data.df)
+    totals = Aggregates().summarize(timeframe, cube=cube)["Total"]
+    blacklist = Jdict("u_categories").lookup("BLACKLIST") or []
+    types = totals.index.get_level_values("Type")
+    return totals[~types.isin(blacklist)].unstack(fill_value=0)
@@ -0,0 +1,157 @@
+import os
+import re
+import pandas as pd
+from system.file_management import Jdict
+
+""" Import bank statements exported as CSV, OFX or QIF
+files straight into a dataframe with Date, Description,
+Extra and Amount columns, the same as raw.xlsx.
+
+Bank specific settings are kept in profiles in u_banks.json.
+Each profile can override any of the default settings below.
+"columns" maps Date, Description, Extra and Amount columns to
+columns in CSV files or tags in OFX files. Optional "credit"
+column is subtracted from Amount. Amounts are multiplied by
+"sign": the app expects spending to be positive. """
+
+COLUMNS = ["Date", "Description", "Extra", "Amount"]
+
+DEFAULT_PROFILES = {
+    ".csv": {
+        "columns": {"Date": "Date", "Description": "Description",
+                    "Extra": "Extra", "Amount": "Amount"},
+        "credit": None,
+        "date_format": "%d/%m/%Y",
+        "delimiter": ",",
+        "decimal": ".",
+        "thousands": None,
+        "skiprows": 0,
+        "encoding": "utf-8",
+        "sign": 1
+    },
+    ".ofx": {
+        "columns": {"Date": "DTPOSTED", "Description": "NAME",
+                    "Extra": None, "Amount": "TRNAMT"},
+        "date_format": "%Y%m%d",
+        "encoding": "latin-1",
+        "sign": -1
+    },
+    ".qif": {
+        "columns": {"Date": "D", "Description": "P",
+                    "Extra": None, "Amount": "T"},
+        "date_format": "%d/%m/%Y",
+        "encoding": "utf-8",
+        "sign": -1
+    }
+}
+DEFAULT_PROFILES[".qfx"] = DEFAULT_PROFILES[".ofx"]
+
+def extensions():
+    """ Return file extensions that can be imported """
+    return tuple(DEFAULT_PROFILES.keys())
+
+def get_profile(extension, name=None):
+    """ Return import settings for a file extension. Settings
+    from profile name in u_banks.json override the defaults. """
+    profile = dict(DEFAULT_PROFILES[extension])
+    if name is None:
+        return profile
+
+    user_profile = Jdict("u_banks").lookup(name)
+    if user_profile is None:
+        raise ValueError("Bank profile {} not found in u_banks.json".format(name))
+    columns = dict(profile["columns"])
+    columns.update(user_profile.get("columns", {}))
+    profile.update(user_profile)
+    profile["columns"] = columns
+    return profile
+
+def read(fp, profile=None):
+    """ Read a statement file based on its extension """
+    extension = os.path.splitext(fp)[1].lower()
+    readers = {".csv": read_csv, ".ofx": read_ofx,
+               ".qfx": read_ofx, ".qif": read_qif}
+    if extension not in readers:
+        raise ValueError("Cannot import {} files".format(extension))
+    return readers[extension](fp, get_profile(extension, profile))
+
+def read_csv(fp, profile):
+    """ Read CSV file with pandas C parser. Only mapped
+    columns are read and their types are set up front. """
+    columns = {k: v for k, v in profile["columns"].items() if v}
+    amounts = [columns["Amount"]]
+    if profile.get("credit"):
+        amounts.append(profile["credit"])
+
+    dtypes = {col: str for key, col in columns.items() if key != "Amount"}
+    dtypes.update({col: "float64" for col in amounts})
+    df = pd.read_csv(fp, sep=profile["delimiter"], usecols=list(dtypes),
+                     dtype=dtypes, decimal=profile["decimal"],
+                     thousands=profile["thousands"], engine="c",
+                     skiprows=profile["skiprows"],
+                     encoding=profile["encoding"])
+
+    data = {key: df[col] for key, col in columns.items()}
+    if profile.get("credit"):
+        credit = df[profile["credit"]].fillna(0)
+        data["Amount"] = data["Amount"].fillna(0) - credit
+    return to_statement(data, profile)
+
+def read_ofx(fp, profile):
+    """ Read transactions from OFX file. OFX files can be
+    SGML without closing tags, so each tag is read up to the
+    end of the line or the next tag. """
+    tag_pattern = re.compile(r"<([A-Z0-9.]+)>([^<\r\n]*)", re.IGNORECASE)
+    tags = [tag for tag in profile["columns"].values() if tag]
+    records = []
+    record = None
+    with open(fp, encoding=profile["encoding"]) as file:
+        for line in file:
+            for tag, value in tag_pattern.findall(line):
+                tag = tag.upper()
+                if tag == "STMTTRN":
+                    record = {}
+                elif record is not None and tag in tags:
+                    record[tag] = value.strip()
+            if record is not None and "</STMTTRN>" in line.upper():
+                records.append(record)
+                record = None
+
+    data = {key: [r.get(tag) for r in records] if tag else None
+            for key, tag in profile["columns"].items()}
+    # Dates can have time and time zone after the date
+    data["Date"] = [d[:8] if d else d for d in data["Date"]]
+    return to_statement(data, profile)
+
+def read_qif(fp, profile):
+    """ Read transactions from QIF file. Each line starts
+    with a field code and transactions end with "^". """
+    codes = [code for code in profile["columns"].values() if code]
+    records = []
+    record = {}
+    with open(fp, encoding=profile["encoding"]) as file:
+        for line in file:
+            line = line.rstrip("\r\n")
+            if line.startswith("^"):
+                records.append(record)
+                record = {}
+            elif line and not line.startswith("!") and line[0] in codes:
+                record[line[0]] = line[1:].strip()
+
+    data = {key: [r.get(code) for r in records] if code else None
+            for key, code in profile["columns"].items()}
+    data["Amount"] = [a.replace(",", "") if a else a for a in data["Amount"]]
+    return to_statement(data, profile)
+
+def to_statement(data, profile):
+    """ Convert columns to a dataframe with Date,
+    Description, Extra and Amount columns """
+    df = pd.DataFrame({col: data.get(col) for col in COLUMNS
+                       if data.get(col) is not None})
+    for col in COLUMNS:
+        if col not in df.columns:
+            df[col] = ""
+
+    df["Date"] = pd.to_datetime(df["Date"], format=profile["date_format"])
+    df["Amount"] = pd.to_numeric(df["Amount"]) * profile["sign"]
+    return df[COLUMNS]
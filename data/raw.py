@@ -1,58 +1,197 @@
+import os
+import sys
+import time
+import bisect
+import numpy as np
+import pandas as pd
 from pandas.api.types import is_numeric_dtype
 from system.file_management import File
 from system.file_management import Jdict
+from system.file_management import Mappings
 from system.file_management import Excel
-from user_input.commands.info import get_transactions_summary
+from system.file_management import Statements
+from system.file_management import Writers
+from system.matching import KeywordRules
+from data.suggestions import build_index
+from data.suggestions import add_suggestions
+from data.summary import get_transactions_summary
 
 """ Process and validate data from raw.xlsx.
 Convert it into useable format by merging description
 and extra columns into info, removing blacklisted
 transactions and classifying data where possible. """
 
+RAW_COLUMNS = ['Date', 'Description', 'Extra', 'Amount']
+compiled_rules = {}
+
 def migrate():
     """ Import data from raw.xlsx, tidy it up
     and classify transactions based on the known,
-    classified transactions """
+    classified transactions. Only rows that changed
+    since the last run are processed if possible. """
 
     raw_data = Excel("raw", read_file=True)
     if raw_data.is_blank():
         print(" >> {} is empty".format(raw_data.filename))
         return
 
-    mand_columns = ['Date', 'Description', 'Extra', 'Amount']
-    raw_data.drop_columns(mand_columns)
-    remove_xlsx_files("Excluded returns.xlsx", "unclassified.xlsx",
-                      "classified.xlsx")
+    raw_data.drop_columns(RAW_COLUMNS)
+    raw_data.set_index_name('ID')
 
-    validate(raw_data)
+    ledger = get_ledger()
+    fingerprints = get_fingerprints(raw_data)
+    changes = find_changes(ledger, fingerprints)
+    if changes is None:
+        remove_xlsx_files("Excluded returns.xlsx", "unclassified.xlsx",
+                          "classified.xlsx")
+        excluded = validate(raw_data)
+    else:
+        excluded = migrate_changes(raw_data, changes, ledger)
+    update_ledger(ledger, fingerprints, excluded)
 
-def validate(raw_data):
-    """ Validate and clean input data, remove expense-return
-    transaction pairs and classify each transaction. """
+def migrate_changes(raw_data, changes, ledger):
+    """ Process new and changed rows from raw.xlsx and merge
+    them into existing classified and unclassified data.
+    Rows removed or changed in raw.xlsx are removed from
+    existing data first. Returns a list of excluded IDs. """
+    new_ids, changed_ids, removed_ids = changes
+    print(" >> New: {n}, changed: {c}, removed: {r}".format(
+          n=len(new_ids), c=len(changed_ids), r=len(removed_ids)))
+    excluded = ledger.lookup("EXCLUDED", default=[])
+    if not (new_ids or changed_ids or removed_ids):
+        return excluded
 
-    raw_data.set_index_name('ID')
-    raw_data.set_datetime("Date", "%d/%m/%Y")
-    add_info_column(raw_data)
+    # Returns are matched within groups of rows sharing the same info
+    # and amount, so groups touched by new, changed and removed rows
+    # are processed again. Old versions of rows give their old groups.
+    classified = Statements("classified")
+    replaced_ids = changed_ids + removed_ids
+    previous = classified.filter(classified.index().isin(replaced_ids))
+    delta_ids = new_ids + changed_ids
+    delta_ids.extend(get_return_groups(raw_data, delta_ids, previous))
+    stale_ids = delta_ids + removed_ids
+    stale = set(stale_ids)
+    excluded = [id for id in excluded if id not in stale]
 
-    if not is_numeric_dtype(raw_data.get_attr("Amount")):
-        raise ValueError('"Amount" column contains non-numeric values.')
+    removed = classified.filter(classified.index().isin(stale_ids))
+    drop_existing_rows(classified, stale_ids)
+    delta = Excel(df=raw_data.filter(raw_data.index().isin(delta_ids)))
+    if delta.is_blank():
+        write_excluded_returns(pd.DataFrame(), stale_ids)
+    else:
+        prepare(delta)
+        excluded.extend(remove_returns(delta, stale_ids))
+        classify(delta, report=True)
+        classified.append(delta.df)
+        classified.sort_index()
+    # Aggregates are only updated where rows changed
+    classified.record_changes(removed, delta.df)
+
+    classified.write()
+    # Rows matched again without changes keep types entered by hand
+    update_unclassified(classified, replaced_ids)
+    show_summary()
+    return excluded
+
+def migrate_chunks(chunksize, report_rss=False):
+    """ Import data from raw.xlsx in chunks of chunksize rows.
+    Each chunk is validated and classified separately and only
+    the columns used by the app are kept. Returns are removed
+    once all chunks are processed. Peak memory is reported
+    for each chunk if report_rss is True. """
+
+    raw_data = Excel("raw")
+    processed = []
+    for number, chunk in enumerate(raw_data.read_chunks(chunksize), 1):
+        chunk_data = Excel(filename=raw_data.filename, df=chunk)
+        chunk_data.post_read_validation()
+        chunk_data.drop_columns(RAW_COLUMNS)
+        prepare(chunk_data)
+        classify(chunk_data)
+        processed.append(chunk_data.df)
+        del chunk, chunk_data
+
+        if report_rss:
+            info = " >> Chunk {n}: {r} rows, peak RSS: {m}"
+            print(info.format(n=number, r=len(processed[-1].index),
+                              m=format_rss(peak_rss())))
+
+    if not processed:
+        print(" >> {} is empty".format(raw_data.filename))
+        return
 
+    raw_data = Excel(filename="raw", df=pd.concat(processed, sort=False))
+    del processed
+    remove_xlsx_files("Excluded returns.xlsx", "unclassified.xlsx",
+                      "classified.xlsx", "ledger.json")
     remove_returns(raw_data)
-    classify(raw_data)
+    write_outputs(raw_data)
+
+def peak_rss():
+    """ Return peak resident set size of the process in bytes.
+    Returns None if it is not available on the platform. """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss*1024
+
+def format_rss(rss):
+    """ Format peak resident set size in MB """
+    if rss is None:
+        return "not available"
+    return "{:.1f} MB".format(rss / 1024**2)
 
+def validate(raw_data):
+    """ Validate and clean input data, remove expense-return
+    transaction pairs and classify each transaction.
+    Returns a list of excluded IDs. """
+
+    prepare(raw_data)
+    excluded = remove_returns(raw_data)
+    classify(raw_data, report=True)
+    write_outputs(raw_data)
+    return excluded
+
+def write_outputs(raw_data):
+    """ Write classified data to classified.xlsx and
+    transactions without type to unclassified.xlsx. Both
+    files are written at the same time if a writer pool is
+    open, so the summary is shown once they are written. """
+    start = time.perf_counter()
+    rows = raw_data.count_rows()
     if not raw_data.is_blank():
         raw_data.write_as(new_name="classified.xlsx", new_type="D")
 
     blank_types = raw_data.get_attr("Type") == ""
-    show_summary(raw_data, blank_types)
     if blank_types.any():
+        index = build_index(raw_data)
         classified_index = raw_data.filter(~blank_types).index.values.tolist()
         raw_data.drop_rows(classified_index)
         raw_data.drop_duplicates(subset="Info")
         raw_data.sort_values(by="Info")
+        add_suggestions(raw_data, index)
         raw_data.write_as(new_name="unclassified.xlsx", new_type="D")
+        rows += raw_data.count_rows()
 
-def show_summary(raw_data, blank_types):
+    Writers.wait_for()
+    show_speed("Wrote", rows, start)
+    show_summary()
+
+def prepare(raw_data):
+    """ Convert dates, merge description and extra
+    columns into info, check amounts are numeric and
+    convert data to the compact layout """
+    raw_data.set_index_name('ID')
+    raw_data.set_datetime("Date", "%d/%m/%Y")
+    add_info_column(raw_data)
+
+    if not is_numeric_dtype(raw_data.get_attr("Amount")):
+        raise ValueError('"Amount" column contains non-numeric values.')
+    raw_data.compact()
+
+def show_summary():
     """ Print the number of unclassified and
     classified transactions found """
     total, classified, unclassified = get_transactions_summary("Classified")
@@ -64,13 +203,47 @@ def add_info_column(raw_data):
     raw_data.get_attr("Extra").fillna("", inplace=True)
     raw_data.merge_columns("Description", "Extra", "Info", True)
 
-def classify(raw_data):
-    """ Classify transactions and assign their
-    type to a new "Type" column. """
-    categories = Jdict("u_cmappings")
-    types = raw_data.get_attr("Info").apply(
-        lambda x: categories.lookup(x, default=""))
-    raw_data.set_values("Type", types)
+def classify(raw_data, report=False):
+    """ Classify transactions and assign their type to a new
+    "Type" column. Exact mappings from u_cmappings.json are
+    used first and keyword rules from u_crules.json are used
+    for the rest. Classification speed is shown if report
+    is True. """
+    categories = Mappings("u_cmappings")
+    start = time.perf_counter()
+    raw_data.map_column("Info", categories, "Type", default="")
+
+    rules = get_rules()
+    unmatched = raw_data.get_attr("Type") == ""
+    if rules and unmatched.any():
+        info = raw_data.get_attr("Info")[unmatched]
+        types = rules.lookup_all(info, default="")
+        raw_data.df.loc[unmatched, "Type"] = types
+    if report:
+        show_speed("Classified", raw_data.count_rows(), start)
+
+def get_rules():
+    """ Return keyword rules from u_crules.json. Rules
+    are compiled once and reused until the file changes. """
+    rules_file = File("u_crules.json", system_file=True)
+    try:
+        signature = File.file_signature(rules_file.file_pointer())
+    except FileNotFoundError:
+        return None
+
+    if compiled_rules.get("signature") != signature:
+        rules = Jdict("u_crules")
+        compiled_rules["rules"] = KeywordRules(rules.dict)
+        compiled_rules["signature"] = signature
+    return compiled_rules["rules"]
+
+def show_speed(action, rows, start):
+    """ Print the number of rows processed since
+    start and the number of rows per second """
+    elapsed = time.perf_counter() - start
+    speed = rows / elapsed if elapsed > 0 else float("inf")
+    info = " >> {a} {n} rows in {t:.3f}s ({s:,.0f} rows/sec)"
+    print(info.format(a=action, n=rows, t=elapsed, s=speed))
 
 def drop_blacklisted_transactions(raw_data):
     """ Remove transactions that have type 'BLACKLIST' """
@@ -78,39 +251,312 @@ def drop_blacklisted_transactions(raw_data):
     black_index = raw_data.filter(black).index
     raw_data.drop_rows(black_index)
 
-def remove_returns(raw_data):
+def remove_returns(raw_data, stale_ids=None):
     """ Find pairs of transactions with the same, but
     negative amounts. This indicates an item being returned:
-    net spending of 0. Remove these transaction pairs. """
+    net spending of 0. Remove these transaction pairs.
+    Returns a list of removed IDs. If stale_ids is given,
+    excluded returns replace rows with those IDs in the
+    existing file and its other rows are kept. """
 
     negative_amounts = raw_data.get_attr("Amount") < 0
     returns_df = raw_data.filter(negative_amounts)
-    if returns_df.empty:
-        return
+    if "Type" in returns_df.columns:
+        # Data might be classified already when imported in chunks
+        returns_df.drop(columns="Type", inplace=True)
+
+    removed_ids = []
+    if not returns_df.empty:
+        matches = match_returns(raw_data.df)
+        pairs = matches.dropna(subset=["Buy"])
+        removed_ids = pairs.index.tolist() + pairs.Buy.astype(int).tolist()
+        if removed_ids:
+            raw_data.drop_rows(removed_ids)
+        listed = returns_df.index.isin(matches.index[matches.Listed])
+        returns_df = returns_df[listed]
+
+    write_excluded_returns(returns_df, stale_ids)
+    return removed_ids
 
+def write_excluded_returns(returns_df, stale_ids=None):
+    """ Write returns to Excluded returns.xlsx. If stale_ids
+    is given, rows with those IDs are dropped from the
+    existing file and its other rows are kept. The file is
+    deleted if no returns are left. """
     returns = Excel(filename="Excluded returns", df=returns_df)
+    if stale_ids is not None:
+        previous = read_excluded_returns()
+        drop_existing_rows(previous, stale_ids)
+        returns.append(previous.df)
+        returns.sort_index()
+
+    if not returns.is_blank():
+        returns.write()
+    elif stale_ids is not None:
+        returns.delete_file()
+
+def match_returns(df):
+    """ Match each return (negative amount) with the closest past
+    expense with the same info and amount. Returns are matched one
+    by one in the order of the dataframe and each expense can only
+    be matched once. Ties between expenses on the same day go to
+    the first one.
 
-    for return_id in returns.index_values():
-        return_line = returns.filter_by_index(return_id)
-        orig_amount = raw_data.get_attr("Amount") == -1*return_line.Amount
-        orig_desc = raw_data.get_attr("Info") == return_line.Info
-        expenses = raw_data.filter(orig_amount & orig_desc)
+    Returns a dataframe indexed on return IDs. "Buy" column has the
+    matched expense ID or NaN. "Listed" column is True if there
+    were unmatched expenses with the same info and amount left when
+    the return was processed, i.e. it is shown in excluded returns.
 
-        if expenses.empty:
-            returns.df.drop(return_id,inplace=True)
+    Expenses are found with an as-of join on the date within each
+    (info, amount) group. Groups where two returns claim the same
+    expense are matched one return at a time instead. """
+    data = df[["Date", "Amount", "Info"]].copy()
+    data["ID"] = data.index
+    data.index.name = None
+    data["Order"] = np.arange(len(data.index))
+    data["Key"] = data.Amount.abs()
+    by = ["Info", "Key"]
+
+    returns = data[data.Amount < 0]
+    expenses = data[data.Amount > 0]
+    expense_keys = pd.MultiIndex.from_arrays([expenses.Info, expenses.Key])
+    return_keys = pd.MultiIndex.from_arrays([returns.Info, returns.Key])
+    expenses = expenses[expense_keys.isin(return_keys)]
+
+    left = returns.dropna(subset=["Date"]).sort_values("Date")
+    right = expenses.dropna(subset=["Date"])
+    right = right.sort_values(["Date", "Order"], ascending=[True, False])
+    right = right[by + ["Date", "ID"]].rename(columns={"ID": "Buy"})
+    closest = pd.merge_asof(left[by + ["Date", "ID"]], right, on="Date",
+                            by=by, direction="backward")
+    closest = closest.set_index("ID").Buy
+
+    matches = returns[by + ["Date"]].copy()
+    matches["Buy"] = closest.reindex(matches.index)
+    claimed = matches.Buy.notna() & matches.Buy.duplicated(keep=False)
+    conflicts = matches[claimed].set_index(by).index.unique()
+    in_conflict = matches.set_index(by).index.isin(conflicts)
+    if in_conflict.any():
+        matches.loc[in_conflict, "Buy"] = match_conflicts(
+            matches[in_conflict], expenses)
+
+    # Returns are listed while there are expenses left to match
+    keys = pd.MultiIndex.from_arrays([matches.Info, matches.Key])
+    available = expenses.groupby(by).size().reindex(keys).fillna(0).values
+    matched = matches.Buy.notna().astype(int)
+    previous = matched.groupby([matches.Info, matches.Key]).cumsum() - matched
+    matches["Listed"] = previous.values < available
+    return matches[["Buy", "Listed"]]
+
+def match_conflicts(returns, expenses):
+    """ Match returns with expenses one return at a time. Each
+    return takes the latest expense with the same info and amount
+    on or before its date, which is then no longer available.
+    Returns a list of matched expense IDs (or NaN) for each return. """
+    expenses = expenses.dropna(subset=["Date"])
+    expenses = expenses.sort_values(["Info", "Key", "Date", "Order"],
+                                    ascending=[True, True, True, False])
+    # Dates are compared as integers. Missing dates (NaT) are
+    # the smallest integers, so returns without dates never match.
+    available = {}
+    for info, key, date, id in zip(expenses.Info, expenses.Key,
+                                   expenses.Date.values.astype(np.int64),
+                                   expenses.ID):
+        dates, ids = available.setdefault((info, key), ([], []))
+        dates.append(date)
+        ids.append(id)
+
+    buys = []
+    for info, key, date in zip(returns.Info, returns.Key,
+                               returns.Date.values.astype(np.int64)):
+        dates, ids = available.get((info, key), ([], []))
+        position = bisect.bisect_right(dates, date)
+        if position == 0:
+            buys.append(np.nan)
         else:
-            # Find closest expense date compared to return date
-            expenses["Delta"] = (return_line["Date"] - expenses.Date)
-            past_expenses = expenses.Delta.dt.days >= 0
-            if not(past_expenses.any()):
-                continue
+            dates.pop(position - 1)
+            buys.append(ids.pop(position - 1))
+    return buys
 
-            expenses = expenses[past_expenses]
-            buy_id = expenses.Delta.idxmin(axis=0)
-            raw_data.drop_rows([buy_id, return_id])
+def read_excluded_returns():
+    """ Read previously excluded returns
+    from Excluded returns.xlsx """
+    excluded = Excel("Excluded returns", read_file=True)
+    if "ID" in excluded.current_columns():
+        excluded.df.set_index("ID", inplace=True)
+    excluded.compact()
+    return excluded
 
-    if not returns.is_blank():
-        returns.write()
+def get_return_groups(raw_data, ids, previous=None):
+    """ Return IDs of raw data rows which share the same info
+    and absolute amount with rows in ids, if the group of such
+    rows contains at least one return (negative amount). Groups
+    of rows in previous, old versions of changed or removed rows
+    with amounts in cents, are included as well. """
+    raw = raw_data.df
+    if raw.empty or not is_numeric_dtype(raw.Amount):
+        return []
+
+    description = raw.Description.fillna("").astype(str)
+    extra = raw.Extra.fillna("").astype(str)
+    cents = Excel.to_cents(raw.Amount.abs()).astype(float)
+    keys = pd.MultiIndex.from_arrays([description + "|" + extra, cents])
+    in_ids = raw.index.isin(ids)
+    groups = keys[in_ids]
+    if previous is not None and not previous.empty:
+        groups = groups.append(pd.MultiIndex.from_arrays(
+            [previous.Info.astype(object), previous.Amount.abs().astype(float)]))
+    with_returns = keys.isin(keys[(raw.Amount < 0).values])
+    affected = keys.isin(groups) & with_returns & ~in_ids
+    return raw.index[affected].tolist()
+
+def drop_existing_rows(data, ids):
+    """ Drop rows with given IDs if they are present """
+    existing = data.index().isin(ids)
+    if existing.any():
+        data.drop_rows(data.index()[existing].tolist())
+
+def update_unclassified(classified, stale_ids, removed_types=()):
+    """ Add transactions without type in classified data to
+    unclassified.xlsx, the first one for each info, the same
+    way as when all data is imported. Types entered by hand
+    are kept for their info, unless their rows were changed
+    or removed from raw.xlsx, or the types are in removed_types. """
+    unclassified = Statements("unclassified")
+    drop_existing_rows(unclassified, stale_ids)
+    if removed_types:
+        types = unclassified.get_attr("Type")
+        unclassified.set_values("Type", types.where(~types.isin(removed_types)))
+
+    types = classified.get_attr("Type")
+    blank_types = types.isna() | (types == "")
+    new_data = classified.filter(blank_types).drop_duplicates(subset="Info")
+    if unclassified.is_blank():
+        unclassified.update(new_data)
+    else:
+        # Rows already listed are replaced by the first transaction
+        # with the same info, which gets their type
+        info = unclassified.get_attr("Info")
+        types = dict(zip(info, unclassified.get_attr("Type")))
+        new_data["Type"] = new_data.Info.map(types)
+        unclassified.filter(~info.isin(new_data.Info), inplace=True)
+        unclassified.append(new_data)
+
+    if unclassified.is_blank():
+        unclassified.delete_file()
+    else:
+        unclassified.sort_values(by="Info")
+        add_suggestions(unclassified, build_index(classified))
+        unclassified.write()
+
+def remove_categories(categories):
+    """ Remove deleted categories from classified data. Only
+    transactions of those categories are classified again,
+    using the remaining mappings and rules. The ones left
+    without type are added to unclassified.xlsx, where types
+    of deleted categories entered by hand are removed too.
+    Returns the number of transactions classified again. """
+    classified = Statements("classified")
+    if not classified.file_exists(classified.file_pointer()):
+        return 0
+
+    affected = classified.get_attr("Type").isin(categories)
+    if affected.any():
+        reclassify(classified, affected)
+        classified.write()
+    update_unclassified(classified, [], removed_types=categories)
+    return int(affected.sum())
+
+def reclassify(classified, affected):
+    """ Classify rows of classified data selected by affected
+    again, using current mappings and rules. The changes are
+    recorded, so that aggregates are only updated for them. """
+    removed = classified.filter(affected)
+    rows = Excel(df=removed[["Info"]].copy())
+    classify(rows)
+    types = classified.get_attr("Type").astype(object)
+    types[affected] = rows.get_attr("Type")
+    classified.set_values("Type", types.astype("category"))
+    classified.record_changes(removed, classified.filter(affected))
+
+def get_ledger():
+    """ Return the ledger of raw.xlsx rows seen during
+    the last migration. It contains row fingerprints keyed
+    on ID, a list of IDs excluded as returns and signatures
+    of the mappings and rules used to classify the rows. """
+    return Jdict("ledger", "D", system_file=False)
+
+def get_classifiers():
+    """ Return signatures of u_cmappings.json, its journal
+    and u_crules.json keyed on file name, None for missing
+    files. Signatures are lists, as they are kept in JSON. """
+    Mappings.wait()
+    mappings = File("u_cmappings.json", system_file=True).file_pointer()
+    rules = File("u_crules.json", system_file=True).file_pointer()
+    signatures = {}
+    for fp in (mappings, Mappings.journal_pointer(mappings), rules):
+        try:
+            signature = list(File.file_signature(fp))
+        except FileNotFoundError:
+            signature = None
+        signatures[os.path.basename(fp)] = signature
+    return signatures
+
+def classifiers_changed(ledger):
+    """ Check if mappings or rules changed since the rows
+    in the ledger were classified. Returns True/False """
+    return ledger.lookup("CLASSIFIERS") != get_classifiers()
+
+def record_classifiers(ledger):
+    """ Record current mappings and rules in the ledger, once
+    classified data was classified again with them """
+    if ledger.lookup("ROWS"):
+        ledger.update("CLASSIFIERS", get_classifiers())
+        ledger.write()
+
+def get_fingerprints(raw_data):
+    """ Return a fingerprint for each row of raw data keyed on
+    its ID. It is based on Date, Description, Extra, Amount
+    and the position of the row in raw.xlsx """
+    hashes = pd.util.hash_pandas_object(raw_data.df[RAW_COLUMNS], index=True)
+    return {str(k): int(v) for k, v in hashes.items()}
+
+def find_changes(ledger, fingerprints):
+    """ Compare fingerprints with the ledger. Returns lists
+    of new, changed and removed IDs. Returns None if all
+    data has to be processed again: there is no ledger,
+    classified.xlsx is missing, mappings or rules changed
+    since the last migration or a changed row was part
+    of an excluded expense-return pair. """
+    rows = ledger.lookup("ROWS")
+    classified = File("classified.xlsx", "D")
+    if not rows or not File.file_exists(classified.file_pointer()):
+        return None
+    if classifiers_changed(ledger):
+        print(" >> Mappings or rules changed, all rows are classified again")
+        return None
+
+    new_ids, changed_ids = [], []
+    for id, fingerprint in fingerprints.items():
+        previous = rows.get(id)
+        if previous is None:
+            new_ids.append(int(id))
+        elif previous != fingerprint:
+            changed_ids.append(int(id))
+    removed_ids = [int(id) for id in rows if id not in fingerprints]
+
+    excluded = set(ledger.lookup("EXCLUDED", default=[]))
+    if excluded.intersection(changed_ids + removed_ids):
+        return None
+    return new_ids, changed_ids, removed_ids
+
+def update_ledger(ledger, fingerprints, excluded):
+    """ Record fingerprints of processed rows, excluded
+    IDs and current mappings and rules in the ledger """
+    ledger.update("ROWS", fingerprints)
+    ledger.update("EXCLUDED", sorted(set(int(id) for id in excluded)))
+    ledger.update("CLASSIFIERS", get_classifiers())
+    ledger.write()
 
 def remove_xlsx_files(*files):
     """ Remove files that are no longer required """
@@ -118,5 +564,5 @@ def remove_xlsx_files(*files):
         return
 
     for file in files:
-        temp_file = File("Excluded returns.xlsx", "D")
+        temp_file = File(file, "D")
         temp_file.delete_file()
@@ -0,0 +1,103 @@
+import os
+import glob
+import time
+import pandas as pd
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from system.file_management import Excel
+from data import importers
+from data.raw import RAW_COLUMNS
+from data.raw import prepare
+from data.raw import classify
+from data.raw import remove_returns
+from data.raw import write_outputs
+from data.raw import remove_xlsx_files
+
+""" Import bank statements from several files at once,
+e.g. one export per account per month, instead of
+raw.xlsx. Files are read and validated in parallel. """
+
+EXTENSIONS = (".xlsx",) + importers.extensions()
+
+def migrate(sources, workers=None, profile=None):
+    """ Import statements from files, directories or glob
+    patterns in sources. Each file is read and validated in
+    a separate process. The results are combined before
+    returns are removed and transactions are classified.
+    CSV, OFX and QIF files are read using bank profile. """
+    files = find_files(sources)
+    if not files:
+        print(" >> No statement files found")
+        return
+
+    start = time.perf_counter()
+    statements = []
+    for fp, df, elapsed in read_files(files, workers, profile):
+        info = " >> {f}: {r} rows in {t:.2f}s"
+        print(info.format(f=os.path.basename(fp), r=len(df.index), t=elapsed))
+        statements.append(df)
+
+    raw_data = Excel(df=pd.concat(statements, ignore_index=True, sort=False))
+    raw_data.set_index_name("ID")
+    info = " >> Read {r} rows from {n} files in {t:.2f}s"
+    print(info.format(r=raw_data.count_rows(), n=len(files),
+                      t=time.perf_counter() - start))
+
+    remove_xlsx_files("Excluded returns.xlsx", "unclassified.xlsx",
+                      "classified.xlsx", "ledger.json")
+    remove_returns(raw_data)
+    classify(raw_data, report=True)
+    write_outputs(raw_data)
+
+def find_files(sources):
+    """ Return a sorted list of statement files in sources.
+    A source can be a file, a directory or a glob pattern. """
+    files = set()
+    for source in sources:
+        if os.path.isdir(source):
+            paths = [os.path.join(source, f) for f in os.listdir(source)]
+        else:
+            paths = glob.glob(source)
+        files.update(os.path.abspath(p) for p in paths if is_statement(p))
+    return sorted(files)
+
+def is_statement(fp):
+    """ Check if a file can be imported. Excel
+    lock files and hidden files are ignored. """
+    filename = os.path.basename(fp)
+    if filename.startswith(("~$", ".")) or not os.path.isfile(fp):
+        return False
+    return os.path.splitext(filename)[1].lower() in EXTENSIONS
+
+def read_files(files, workers=None, profile=None):
+    """ Read and validate files in a pool of worker processes.
+    Yields (file pointer, dataframe, seconds) in file order. """
+    read = partial(read_statement, profile=profile)
+    if workers == 1 or len(files) == 1:
+        for fp in files:
+            yield read(fp)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(read, files):
+            yield result
+
+def read_statement(fp, profile=None):
+    """ Read and validate a statement file. Returns (file
+    pointer, dataframe, seconds). The dataframe has
+    Date, Amount and Info columns. """
+    start = time.perf_counter()
+    try:
+        if fp.lower().endswith(".xlsx"):
+            # Read directly, as statements are not kept in a
+            # cache or memory like the files of the app
+            statement = Excel(df=pd.read_excel(fp))
+        else:
+            statement = Excel(df=importers.read(fp, profile))
+        statement.post_read_validation(RAW_COLUMNS)
+        statement.drop_columns(RAW_COLUMNS)
+        prepare(statement)
+    except ValueError as error:
+        err = "{f}: {e}".format(f=os.path.basename(fp), e=error)
+        raise ValueError(err)
+    return fp, statement.df, time.perf_counter() - start
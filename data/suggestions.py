@@ -0,0 +1,28 @@
+from system.matching import TokenIndex
+
+""" Suggest categories for unclassified transactions
+based on similar transactions classified already """
+
+SUGGESTION_COLUMNS = ["Suggestion", "Confidence", "Alternatives"]
+
+def build_index(data):
+    """ Build token index from transactions with a type """
+    types = data.get_attr("Type")
+    classified = types.notna() & (types != "")
+    index = TokenIndex()
+    index.add_all(data.get_attr("Info")[classified], types[classified])
+    return index
+
+def add_suggestions(unclassified, index):
+    """ Add suggested categories to unclassified transactions.
+    Previous suggestions are replaced. Nothing is suggested
+    if there are no classified transactions in the index. """
+    current = unclassified.current_columns()
+    old_columns = [col for col in SUGGESTION_COLUMNS if col in current]
+    unclassified.drop_columns(drop_cols=old_columns)
+    if index.documents == 0 or unclassified.is_blank():
+        return
+
+    suggestions = index.suggest_all(unclassified.get_attr("Info"))
+    for column in SUGGESTION_COLUMNS:
+        unclassified.set_values(column, suggestions[column])
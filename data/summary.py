@@ -1,29 +1,38 @@
+import pandas as pd
 from system.file_management import Jdict
+from system.file_management import Excel
 from system.file_management import Statements
+from system.file_management import Aggregates
 
 """ A module for getting information about
 transactions and their summaries"""
 
-def get_categories_summary(ctype="CATEGORIES"):
+def get_categories_summary(ctype="CATEGORIES", summary=None):
     """ Gets information about defined categories.
     Shows their names and a number of transactions
     used with each one. Use ctype="BLACKLIST" to
-    return summary for blacklisted categories"""
-    classified = Statements("classified")
+    return summary for blacklisted categories.
+    Counts are taken from summary if it is given,
+    see get_aggregates. """
     ucategories = Jdict("u_categories")
     categories = ucategories.lookup(ctype)
     if categories is None:
         return None
 
-    cat_count = {k:0 for k in categories}
-    cat_info = Jdict(dict=cat_count)
-    if classified.is_blank():
-        return cat_info
+    if summary is None:
+        summary = get_aggregates()
+    counts = summary["Count"].reindex(categories, fill_value=0)
+    cat_count = {category: int(count) for category, count in counts.items()}
+    return Jdict(dict=cat_count)
 
-    for category in categories:
-        filtered = classified.select_by("Type", category)
-        cat_info.update(category, filtered.count_rows())
-    return cat_info
+def get_aggregates(timeframe=None):
+    """ Return the number of classified transactions of each
+    category, their total, mean, smallest and largest amount,
+    the standard deviation of amounts and the dates of the
+    first and the last one, for each "Month" or "Year" if
+    timeframe is given. They are read from the
+    aggregate cube rather than computed from transactions. """
+    return Aggregates().summarize(timeframe)
 
 def get_transactions_summary(file="Classified", filter="Total"):
     """ Return a number of total, classified and
@@ -42,18 +51,29 @@ def get_transactions_summary(file="Classified", filter="Total"):
         err = "{} invalid filter.\n >> Must be one of {}"
         raise ValueError(err.format(file, ", ".join(ok_files)))
 
-    all_data = Statements(file)
-    if filter == "Unique":
-        all_data.drop_duplicates(subset="Info")
+    # Files are named in lower case
+    all_data = Statements(file.lower())
+    unique = "Info" if filter == "Unique" else None
+    return get_count(all_data, unique)
 
-    total_count, classified_count, unclassified_count = get_count(all_data)
-    return total_count, classified_count, unclassified_count
-
-def get_count(data):
+def get_count(data, unique=None):
     """ Return the number of transactions: all,
-    classified and unclassified."""
-    total_count = data.count_rows()
-    classified_data = data.dropna(subset=["Type"], inplace=False)
-    classified_count = len(classified_data.index)
+    classified and unclassified. Only the first
+    transaction for each value in unique column
+    is counted if unique is specified. """
+    total_count = data.count(unique=unique)
+    classified_count = data.count("Type", unique=unique)
     unclassified_count = total_count - classified_count
     return total_count, classified_count, unclassified_count
+
+def get_memory_summary(file="classified"):
+    """ Return the number of bytes used by each column of
+    a file's data. "Before" column shows the layout used in
+    .xlsx files and "After" the compact layout used by
+    the app. The last row shows the totals. """
+    data = Statements(file)
+    after = data.memory_usage()
+    before = Excel(df=Excel.expand(data.df)).memory_usage()
+    memory = pd.DataFrame({"Before": before, "After": after})
+    memory.loc["Total"] = memory.sum()
+    return memory
@@ -1,15 +1,17 @@
-from data.raw import classify
-from system.file_management import Jdict
+import time
+from data.raw import reclassify
+from data.raw import show_speed
+from data.raw import get_ledger
+from data.raw import classifiers_changed
+from data.raw import record_classifiers
+from system.file_management import Mappings
 from system.file_management import Statements
 from data.summary import get_transactions_summary
 
-categories = Jdict("u_cmappings")
-classified = Statements("classified")
-unclassified = Statements("unclassified")
-
 def process():
     """ Check for any manually classified transactions in
     unclassified.xlsx and update classified.xlsx lines. """
+    unclassified = Statements("unclassified")
     if unclassified.is_blank():
         print(" >> All transactions classified already")
     else:
@@ -18,9 +20,15 @@ def process():
             print(" >> No new classifications available")
         else:
             show_summary()
+            # Rows affected by new mappings are classified again below,
+            # so the next import does not have to classify all rows
+            ledger = get_ledger()
+            changed = classifiers_changed(ledger)
             update_categories_dict(newly_classified)
             update_classified_data(newly_classified)
-            update_unclassified_data(newly_classified)
+            update_unclassified_data(unclassified, newly_classified)
+            if not changed:
+                record_classifiers(ledger)
 
 def show_summary():
     total_count, new_count, unclassified = get_transactions_summary("Unclassified")
@@ -30,12 +38,19 @@ def show_summary():
 def update_classified_data(newly_classified):
     """ Update classified data with newly_classified.
     Also find other similar transactions and classify
-    them as well. """
-    classified.update(newly_classified)
-    classify(classified)
-    classified.write()
+    them as well. Only transactions with the same info
+    as new classifications can change, so only they are
+    classified again. """
+    classified = Statements("classified")
+    start = time.perf_counter()
+    keys = newly_classified["Info"].unique()
+    affected = classified.get_attr("Info").isin(keys)
+    if affected.any():
+        reclassify(classified, affected)
+        show_speed("Classified", int(affected.sum()), start)
+        classified.write()
 
-def update_unclassified_data(newly_classified):
+def update_unclassified_data(unclassified, newly_classified):
     """ Amend or remove unclassified data """
     if unclassified.equal(newly_classified):
         unclassified.delete_file()
@@ -45,6 +60,7 @@ def update_unclassified_data(newly_classified):
 
 def update_categories_dict(newly_classified):
     """ Update categories dictionary with new classifications """
+    categories = Mappings("u_cmappings")
     for id in newly_classified.index:
         line = newly_classified.loc[id]
         categories.update(line.Info, line.Type)
@@ -1,8 +1,10 @@
+import time
+started = time.perf_counter()
 import user_input.parser as parser
 
 def main():
     cmd = parser.init_parser()
-    parser.process_commands(cmd)
+    parser.process_commands(cmd, started)
     
 if __name__ == "__main__":
     main()
@@ -8,7 +8,7 @@ from system.file_management import File
 
 TIMEFRAME = 'YearMonth'
 
-def do_it(main_df):
+def do_it(main_df, ptable):
     """
     Generate a plot capturing monthly changes for each expense
     category. Each plot contains four subplots:
@@ -17,9 +17,11 @@ def do_it(main_df):
         3. Expense category distribution of amount vs date
         4. Two rolling averages for expense category per month
 
+    ptable is a pivot table of monthly totals of each category,
+    see data.classified.get_totals.
     """
+    main_df = stats.to_units(main_df)
     xlabels = generate.date_labels(main_df, TIMEFRAME)
-    ptable = stats.pivotTable(main_df, TIMEFRAME, 'Amount')
     monthly_totals = tidy(stats.totals(ptable))
     monthly_fraction = stats.ratios(ptable)
 
@@ -48,6 +50,7 @@ def do_it(main_df):
         image = File(filename=category + '.png', type="P")
         filepath = image.file_pointer()
         plt.savefig(filepath, bbox_inches='tight')
+        plt.close(f)
         print(' >>',filepath)
         del image
 
@@ -1,31 +1,17 @@
 import pandas as pd
-import numpy as np
-import matplotlib.pylab as plt
 
-def pivotTable(dataFrame, timeframe, values):
-
-        """
-        Create a pivot table out of dataFrame
-
-        Input:
-            values         String specifying values for pivot table
-        Output:
-            ptable         Pivot table:
-                             - index: Transaction types
-                             - columns: Timeframe ('Years' or 'YearMonth')
-                             - values: Amount
-        """
-        dfCols = dataFrame.columns.tolist()
-        ptable = dataFrame.pivot_table(
-            index = ['Type'],
-            columns = [timeframe],
-            values = [values],
-            aggfunc=np.sum
-        )
+def to_units(dataFrame, values='Amount'):
+    """
+    Return a copy of dataFrame with values in integer
+    cents converted to currency units for plotting
 
-        ptable = ptable.fillna(0)
-        ptable.columns = ptable.columns.droplevel(0)
-        return ptable
+    Input:
+        dataFrame      Dataframe in the compact layout
+        values         String specifying values column
+    Output:
+        dataFrame      New dataframe with values in currency units
+    """
+    return dataFrame.assign(**{values: dataFrame[values] / 100})
 
 def totals(ptable):
     """
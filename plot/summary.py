@@ -9,7 +9,7 @@ from system.file_management import File
 
 TIMEFRAME = 'Year'
 
-def do_it(main_df):
+def do_it(main_df, ptable):
     """
     Generate a plot capturing yearly changes for each expense
     category. Each plot contains four subplots:
@@ -17,8 +17,11 @@ def do_it(main_df):
         2. (Expense category / total expenses) ratio for each category
         3. Total spendings per year
         4. Total distribution of spendings per year: amount vs date
+
+    ptable is a pivot table of yearly totals of each category,
+    see data.classified.get_totals.
     """
-    ptable = stats.pivotTable(main_df, TIMEFRAME, 'Amount')
+    main_df = stats.to_units(main_df)
     f, axs = plt.subplots(2, 2, figsize=(20, 10))
 
     # Subplot 1: Annual expenses for each category
@@ -35,6 +38,7 @@ def do_it(main_df):
     image = File(filename='summary.png', type="P")
     filepath = image.file_pointer()
     plt.savefig(filepath, bbox_inches='tight')
+    plt.close(f)
     print(' >>',filepath)
     del image
 
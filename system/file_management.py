@@ -1,297 +1,27 @@
 import os
+import re
+import copy
 import json
+import pickle
+import hashlib
+import sqlite3
+import zipfile
+import datetime
+import xlsxwriter
+import numpy as np
 import pandas as pd
-
-class Path:
-    """ Class for path handling"""
-    def __init__(self, path):
-        self.path = path
-
-    def init_dirs(self):
-        """ Initialise relevant directories """
-        os.makedirs(self.path, exist_ok=True)
-
-    def exists_or_is_creatable(self):
-        """ Check if path exists of is creatable"""
-        if not isinstance(self.path, str) or not self.path:
-            return False
-        try:
-            exists = os.path.exists(self.path)
-            creatable = os.access(os.path.dirname(self.path), os.W_OK)
-            return exists or creatable
-        except OSError:
-            return False
-
-class File:
-    """ Class for initialising and handling user files """
-    types = {'D': "Data", "P": "Plot"}
-
-    def __init__(self, filename=None, type='', system_file=False):
-        self.expected_extension = None
-        self.system_file = system_file
-        self.filename = filename
-        self.subfolders = ''
-        self.type = type
-        self.init_file()
-
-    def init_file(self):
-        """ Initialise file if filename is specified
-        and parse it into filename, subfolders and type.
-        It also creates relevant directories if required. """
-        if self.filename is not None:
-            self.parse_inputs(self.filename, self.type)
-            fp = self.file_pointer(with_file=False)
-            path = Path(fp)
-            path.init_dirs()
-
-    def get_type_name(self):
-        """ Return type name based on code. """
-        return File.types.get(self.type, '')
-
-    def parse_inputs(self, filename, type_code):
-        """ Process filename and type_code. It parses
-        the data into filename, subfolders and type """
-        self.subfolders, self.filename = os.path.split(filename)
-        self.type = File.types.get(type_code, "")
-
-    def base_path(self):
-        """ Return base path for the output depending on
-        whether this is a file used by the source code or
-        a file amendable/viewable by the user. """
-        if self.system_file:
-            return os.path.join(os.getcwd(), "system", "configuration")
-        else:
-            config = Jdict("u_paths")
-            return config.lookup("COMMON")
-
-    def file_pointer(self, with_file=True):
-        """ Return full file pointer to the file """
-        base = self.base_path()
-        fp = os.path.join(base, self.type, self.subfolders)
-        if with_file and (self.filename is None or not self.filename):
-            raise ValueError("Filename not specified")
-        elif with_file:
-            return os.path.join(fp, self.filename)
-        else:
-            return fp
-
-    def delete_file(self):
-        """ Delete file """
-        fp = self.file_pointer()
-        try:
-            os.remove(fp)
-        except FileNotFoundError:
-            pass
-
-    def rename(self, new_name=None, new_type=""):
-        """ Change file name and type"""
-        if new_name is not None:
-            self.subfolders, self.filename = os.path.split(new_name)
-        if new_type:
-            self.type = File.types.get(new_type, "")
-
-    @staticmethod
-    def file_exists(fp):
-        """ Check if file exists. Returns True/False."""
-        return os.path.isfile(fp)
-
-    @classmethod
-    def overwrite_check(cls, fp):
-        """ Raise IOError exception if the file already
-        exists. It can be used as a check before the file
-        is created."""
-        if cls.file_exists(fp):
-            filename = os.path.basename(fp)
-            error = " >> {} already exists. File was not overwritten."
-            raise IOError(error.format(filename))
-
-    def validate_file_extension(self):
-        """ Validate filename and extension based on logic below:
-        1) File name or expected extension is None
-            - Do nothing
-        2) File name doesn't have an extension.
-            - Add it to filename
-        3) File name has the same extension as expected extension
-            - Do nothing
-        3) File name has extension, but different to expected extension:
-            - Raise an exception """
-
-        if self.filename is None or self.expected_extension is None:
-            return
-
-        extension = os.path.splitext(self.filename)[1]
-        if extension == self.expected_extension:
-            pass
-        elif extension == '':
-            self.filename += self.expected_extension
-        else:
-            err = "File {f} must have {e} extension"
-            error = err.format(f=self.filename, e=self.expected_extension)
-            raise ValueError(error)
-
-class Jdict(File):
-    """ Class for manipulating JSON files and dictionaries """
-
-    def __init__(self, Filename=None, Type='', dict=None, system_file=True):
-        super().__init__(filename=Filename, type=Type, system_file=system_file)
-        self.dict = dict
-        self.init_jdict()
-
-    def init_jdict(self):
-        """ Initialise file """
-        self.pre_read_validation()
-        self.read()
-
-    def pre_read_validation(self):
-        """ Do validation before file is read. """
-        self.expected_extension = ".json"
-        self.validate_file_extension()
-
-    def read(self):
-        """ Read categories from .json file. Set up empty
-        dictionary if file does not exist. Don't read if
-        dict attribute is not None or if the filename is
-        not specified. """
-        if self.dict is not None or self.filename is None:
-            return
-        try:
-            fp = self.file_pointer()
-            with open(fp, "r") as file:
-                self.dict = json.load(file)
-        except FileNotFoundError:
-            self.dict = {}
-
-    def write(self):
-        """ Write categories to .json file. """
-        fp = self.file_pointer()
-        with open(fp, "w+") as file:
-            json.dump(self.dict, file, indent=4, sort_keys=True)
-
-    def update(self, id, value):
-        """ Update value in dictionary. """
-        self.dict[id] = value
-
-    def append(self, id, value):
-        """ It will append value to the list keyed on id.
-        It will create a list of values if and when needed """
-        current_values = self.dict.get(id, None)
-        if current_values is None:
-            self.dict[id] = value
-        elif isinstance(current_values, list):
-            self.dict[id].append(value)
-        else:
-            self.dict[id] = [current_values, value]
-
-    def extend(self, id, value):
-        """ Extends the list and add a value keyed on id. """
-        current_values = self.dict.get(id, None)
-        if current_values is None:
-            self.dict[id] = value
-        elif isinstance(current_values, list):
-            self.dict[id].extend(value)
-        else:
-            self.dict[id] = [current_values, value]
-
-    def is_blank(self):
-        """ Returns True if dict attribute is None"""
-        return self.dict == None
-
-    def show(self, pad='', level=None):
-        """ Print the contents of categories dictionary.
-        It will show each category and its keywords in
-        pad XXXXX | ['YYYYY', 'ZZZZZ', ...] format. It
-        adds padding at the end to each XXXXX in order
-        to make the bars align for all categories. It
-        prints None if dict attribute is None """
-
-        if level is None:
-            use_dict = self.dict
-        else:
-            use_dict = self.lookup(level)
-
-        if use_dict is None:
-            print(pad, None, " | ",  None)
-            return
-
-        max_length = 0
-        for id in use_dict.keys():
-            if max_length < len(id):
-                max_length = len(id)
-        for id, val in use_dict.items():
-            padded_id = pad + id + (max_length - len(id))*' '
-            print(padded_id, ' | ', val)
-
-    def lookup(self, *keys, default=None):
-        """ Look up a value in dictionary based on key.
-        By providing multiple keys, it will get the values
-        from nested dictionaries. If there are no nested
-        dictionaries or the value against the key is not
-        present, it will return the value specified in
-        default.
-        If a tuple is passed in via keys[0], it will
-        iterate through it rather than keys as a whole."""
-        if isinstance(keys[0], tuple) or isinstance(keys[0], list):
-            if len(keys) == 1 and len(keys[0]) > 1 :
-                # Iterable variable was passed in.
-                # Iterate through it instead rather than keys
-                keys = keys[0]
-
-        new_level = self.dict
-        for key in keys:
-            if not isinstance(new_level, dict):
-                return default
-            new_level = new_level.get(key, default)
-        return new_level
-
-    def transpose(self):
-        """ Swap key-value pairs in self.dict.
-        E.g. convert {A:[a1, a2, ...], B:[b1, b2, ...]}
-        dictionary to {a1:A, a2:A, ..., b1:B, b2:B, ...}
-        and vice versa.
-
-        It does not work with nested lists. It will raise
-        and exception if it comes across a dictionary
-        like {A:[[...], [...], ...], B:b1, ...} """
-        old_dict = self.dict
-        old_keys = old_dict.keys()
-        self.dict = {}
-        frequencies = {}
-
-        for id in old_keys:
-            values = old_dict[id]
-            if not isinstance(values, list):
-                values = [values]
-
-            for value in values:
-                if isinstance(value, list):
-                    err_txt = "Nested lists not supported:" + str(values)
-                    raise TypeError(err_txt)
-
-                val_frequency = frequencies.get(value, 0)
-                if val_frequency == 0:
-                    self.dict[value] = id
-                    frequencies[value] = 1
-
-                elif val_frequency == 1:
-                    self.dict[value] = [self.dict[value], id]
-                    frequencies[value] += 1
-
-                elif val_frequency > 1:
-                    self.dict[value].append(id)
-                    frequencies[value] += 1
-
-    def pop(self, key, default=None):
-        """ Delete key from dictionary """
-        self.dict.pop(key, default)
-
-    def keys(self):
-        return self.dict.keys()
-
-    def items(self):
-        return self.dict.items()
-
-    def values(self):
-        return self.dict.values()
+import xml.etree.ElementTree as ET
+from contextlib import closing
+from contextlib import suppress
+from pandas.api.types import is_bool_dtype
+from pandas.api.types import is_datetime64_any_dtype
+from pandas.api.types import is_integer_dtype
+from pandas.api.types import is_numeric_dtype
+from system.files import Path
+from system.files import File
+from system.files import Jdict
+from system.files import Mappings
+from system.files import Session
 
 class Excel(File):
     """ A class for working with .xlsx files.
@@ -299,10 +29,16 @@ class Excel(File):
     manipulation and combines xlsxwriter for file I/O """
 
     mandatory_columns = ("Date", "Amount")
+    cents_columns = ("Amount",)
+    category_columns = ("Type",)
 
     def __init__(self, filename=None, type='D', df=None, read_file=False):
         super().__init__(filename=filename, type=type)
         self.df = df
+        # Signature of the file when it was read and rows removed
+        # and added since then, see record_changes
+        self.read_signature = None
+        self.row_changes = None
         self.init_excel(mand_cols=None, read_file=read_file)
 
     def init_excel(self, mand_cols=None, read_file=False):
@@ -324,11 +60,170 @@ class Excel(File):
         does not exist. """
         try:
             fp = super().file_pointer()
-            self.df = pd.read_excel(fp, sheet_name=sheet)
+            Writers.wait_for(fp)
+            self.read_signature = self.file_signature(fp)
+            df = self.read_memory(fp, sheet)
+            if df is not None:
+                self.df = df
+                return
+            df = self.read_cache(fp, sheet)
+            if df is None:
+                df = pd.read_excel(fp, sheet_name=sheet)
+                self.df = df
+                self.write_cache(fp, sheet)
+            else:
+                self.df = df
+            self.write_memory(fp, sheet)
         except FileNotFoundError:
+            self.read_signature = None
             cols = {col: [] for col in Excel.mandatory_columns}
             self.df = pd.DataFrame(cols)
 
+    def read_chunks(self, chunksize=10000, sheet="Sheet1"):
+        """ Read .xlsx file in chunks of chunksize rows. It
+        yields dataframes indexed by row position, the same
+        way as the whole sheet would be read. Nothing is
+        yielded if the file does not exist. """
+        try:
+            fp = super().file_pointer()
+            stream = XlsxStream(fp, sheet)
+        except FileNotFoundError:
+            return
+        for chunk in stream.chunks(chunksize):
+            yield chunk
+
+    @staticmethod
+    def cache_pointer(fp):
+        """ Return file pointer to the binary cache of .xlsx
+        file. Caches are kept in a folder of the user rather
+        than next to the files, which can be in folders shared
+        with others, as loading a cache could run code. It
+        raises OSError if the folder cannot be used. """
+        key = hashlib.sha1(os.path.abspath(fp).encode()).hexdigest()[:16]
+        filename = "{}.{}.cache".format(os.path.basename(fp), key)
+        return os.path.join(Excel.cache_folder(), filename)
+
+    @staticmethod
+    def cache_folder():
+        """ Return the folder of binary caches, creating it if
+        needed. It raises OSError if it can be changed by
+        other users, so that their caches are never loaded. """
+        base = (os.environ.get("XDG_CACHE_HOME") or
+                os.environ.get("LOCALAPPDATA") or
+                os.path.join(os.path.expanduser("~"), ".cache"))
+        folder = os.path.join(base, "bank-statements")
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        if hasattr(os, "getuid"):
+            stat = os.stat(folder)
+            if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+                raise PermissionError("{} can be changed by others".format(folder))
+        return folder
+
+    @staticmethod
+    def temp_pointer(fp):
+        """ Return file pointer to the temporary file .xlsx
+        file is written to. It is kept next to the file, so
+        that it can replace the file in one step. """
+        folder, filename = os.path.split(fp)
+        return os.path.join(folder, ".{}.{}.tmp".format(filename, os.getpid()))
+
+    def read_cache(self, fp, sheet="Sheet1"):
+        """ Return dataframe from the binary cache of .xlsx file.
+        Returns None if there is no cache or it is stale: the
+        sheet, size or contents of .xlsx file are different. The
+        contents are only compared if modification time changed.
+        It raises FileNotFoundError if .xlsx file does not exist. """
+        size, mtime = self.file_signature(fp)
+        try:
+            with open(self.cache_pointer(fp), "rb") as file:
+                cache = pickle.load(file)
+        except Exception:
+            # Caches which cannot be loaded, e.g. written with
+            # another version of pandas, are stale
+            return None
+
+        if not isinstance(cache, dict):
+            return None
+        elif cache.get("sheet") != sheet or cache.get("size") != size:
+            return None
+        elif cache.get("mtime") != mtime:
+            if cache.get("hash") != self.file_hash(fp):
+                return None
+            # Same contents, e.g. the file was saved without changes
+            self.write_cache(fp, sheet, cache["df"], cache["hash"])
+        return cache["df"]
+
+    def write_cache(self, fp, sheet="Sheet1", df=None, hash=None):
+        """ Write dataframe to the binary cache of .xlsx file
+        together with file size, modification time and hash.
+        The cache is only an optimisation, so it is not
+        written if it fails. """
+        if df is None:
+            df = self.df
+        try:
+            size, mtime = self.file_signature(fp)
+            cache = {"sheet": sheet, "size": size, "mtime": mtime,
+                     "hash": hash or self.file_hash(fp), "df": df}
+            cache_fp = self.cache_pointer(fp)
+            temp_fp = cache_fp + ".tmp"
+            with open(temp_fp, "wb") as file:
+                pickle.dump(cache, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_fp, cache_fp)
+        except OSError:
+            pass
+
+    def read_memory(self, fp, sheet="Sheet1"):
+        """ Return a copy of dataframe kept in memory for .xlsx
+        file. Returns None if memory is not used or the size or
+        modification time of the file changed since it was read.
+        It raises FileNotFoundError if .xlsx file does not exist. """
+        if File.memory is None:
+            return None
+        signature = self.file_signature(fp)
+        kept = File.memory.get((self.memory_key(fp), sheet))
+        if kept is None or kept[0] != signature:
+            return None
+        return kept[1].copy()
+
+    def write_memory(self, fp, sheet="Sheet1", df=None):
+        """ Keep a copy of dataframe just read from or written to
+        .xlsx file in memory, if memory is used """
+        if File.memory is not None:
+            if df is None:
+                df = self.df
+            key = (self.memory_key(fp), sheet)
+            File.memory[key] = (self.file_signature(fp), df.copy())
+
+    @staticmethod
+    def as_read(df):
+        """ Return a copy of dataframe written to .xlsx file the
+        way pandas would read it back: indexed by row position,
+        with blank cells as NaN and column types inferred again """
+        df = df.reset_index(drop=True)
+        objects = df.select_dtypes(include="object").columns
+        for column in objects:
+            values = df[column].replace("", np.nan)
+            df[column] = values.where(values.notna(), np.nan)
+        return df.infer_objects()
+
+    def delete_cache(self, fp=None):
+        """ Delete the binary cache of .xlsx file """
+        if fp is None:
+            fp = self.file_pointer()
+        try:
+            os.remove(self.cache_pointer(fp))
+        except OSError:
+            pass
+
+    def delete_file(self):
+        """ Delete .xlsx file, its cache and database table """
+        Writers.wait_for(self.file_pointer())
+        super().delete_file()
+        self.delete_cache()
+        name = Database.table_name(self.filename)
+        if name in Database.tables:
+            Database().drop_table(name)
+
     def post_read_validation(self, mand_cols=None):
         """ Check if dataframe meets expected format.
         It must have all mandatory columns including the ones
@@ -356,82 +251,126 @@ class Excel(File):
             # Throw exception if file already exists.
             self.overwrite_check(file_pointer)
 
-    def write(self, sheet="Sheet1", file_pointer=None, overwrite_check=False):
-        """ Write dataframe to .xlsx file if it isn't None """
+    def write(self, sheet="Sheet1", file_pointer=None, overwrite_check=False,
+              chunksize=10000):
+        """ Write dataframe to .xlsx file if it isn't None. The
+        file is written by a process of the writer pool if one
+        is open, otherwise it is written straight away. """
         if file_pointer is None:
             # Get default file pointer if it isn't specified
             file_pointer = self.file_pointer()
 
         self.pre_write_validation(file_pointer, overwrite_check)
-        writer = pd.ExcelWriter(file_pointer, engine="xlsxwriter",
-                                datetime_format='dd mmm yyyy')
-        temp_df = self.reset_index(self.df)
-        temp_df.to_excel(writer, sheet_name=sheet,header=False,
-                         index=False, startrow=1)
-
-        worksheet = writer.sheets[sheet]
-        workbook = writer.book
-        self.apply_styles(temp_df, worksheet, workbook)
-        writer.save()
+        # Writes to the same file are done in order
+        Writers.wait_for(file_pointer)
+        self.delete_cache(file_pointer)
+        pool = Writers.current
+        if pool is None or not pool.submit(self, file_pointer, sheet, chunksize):
+            self.write_xlsx(file_pointer, sheet, chunksize)
+            self.finish_write(file_pointer, sheet)
+
+    def write_xlsx(self, file_pointer, sheet="Sheet1", chunksize=10000):
+        """ Write dataframe to .xlsx file. Rows are converted to
+        the .xlsx layout and written chunksize rows at a time, so
+        memory use does not depend on the number of rows written.
+        The file is written to a temporary file first, which then
+        replaces it, so it is never left half written. """
+        temp_pointer = self.temp_pointer(file_pointer)
+        columns = self.reset_index(self.expand(self.df.iloc[:0])).columns
+        try:
+            with XlsxWriter(temp_pointer, sheet) as writer:
+                self.apply_styles(columns, writer)
+                for start in range(0, len(self.df), chunksize):
+                    chunk = self.df.iloc[start:start + chunksize]
+                    writer.write_rows(self.reset_index(self.expand(chunk)))
+            os.replace(temp_pointer, file_pointer)
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(temp_pointer)
+
+    def finish_write(self, file_pointer, sheet="Sheet1"):
+        """ Update the database table, binary cache and memory of
+        .xlsx file once it has been written. The dataframe is
+        kept the way it would be read back, so that the next
+        command does not have to read the file again. """
+        self.update_database(file_pointer)
+        temp_df = self.as_read(self.reset_index(self.expand(self.df)))
+        self.write_cache(file_pointer, sheet, temp_df)
+        self.write_memory(file_pointer, sheet, temp_df)
+
+    def update_database(self, fp):
+        """ Copy dataframe to the database table of the file,
+        if the file has one. The table records the size and
+        modification time of the file just written. """
+        name = Database.table_name(fp)
+        if name in Database.tables:
+            signature = self.file_signature(fp)
+            if name == Aggregates.source:
+                Aggregates().update_table(self, signature)
+            Database().write_table(name, self.df, signature)
 
     def write_as(self, new_name=None, new_type=None):
         """ Rename the file and write to it. """
         self.rename(new_name, new_type)
         self.write()
 
-    def apply_styles(self, df, wsheet, wbook):
-        """ Apply styles to xlsx spreadsheet. """
-        wsheet.autofilter(0, 0, 0, len(df.columns)-1)
+    def apply_styles(self, columns, writer):
+        """ Apply styles to xlsx spreadsheet and write the header
+        row. It must be called before any other rows are written. """
+        wsheet = writer.worksheet
+        wsheet.autofilter(0, 0, 0, len(columns)-1)
         wsheet.freeze_panes(1, 0)
         excel_config = Jdict("o_xlsx")
-        self.apply_header_styles(df, excel_config, wsheet, wbook)
-        self.apply_column_styles(df, excel_config, wsheet, wbook)
-        self.apply_data_validation(df, excel_config, wsheet)
+        self.apply_header_styles(columns, excel_config, writer)
+        self.apply_column_styles(columns, excel_config, writer)
+        self.apply_data_validation(columns, excel_config, wsheet)
 
-    def apply_data_validation(self, df, config, wsheet):
+    def apply_data_validation(self, columns, config, wsheet):
         """ Applies data validation to cell based on config.json.
         It checks "source" tag for "CATEGORIES" string. It will
-        replace it with the list of categories if it finds one """
+        replace it with the list of categories if it finds one.
+        Validation only covers the rows of the dataframe, so
+        that it does not make the file bigger than needed. """
         categories_config = Jdict("u_categories")
         categories = [cat for cats in categories_config.values() for cat in cats]
         categories.sort()
         lookup_dropdown = ["STYLING", "COLUMN"]
+        last_row = max(len(self.df), 1)
 
-        for col_num, name in enumerate(df.columns.values):
+        for col_num, name in enumerate(columns):
             do_lookup = list(lookup_dropdown)
             do_lookup.extend([name, "data_validation"])
-            data_val = Jdict(dict=config.lookup(do_lookup))
-            if data_val.is_blank():
+            options = config.lookup(do_lookup)
+            if options is None:
                 continue
-            elif data_val.lookup("source") == "CATEGORIES":
+            # Copied, so that the cached configuration is not changed
+            data_val = Jdict(dict=dict(options))
+            if data_val.lookup("source") == "CATEGORIES":
                 data_val.update("source", categories)
 
             wsheet.data_validation(first_row=1, first_col=col_num,
-                                   last_row=1000000, last_col=col_num,
+                                   last_row=last_row, last_col=col_num,
                                    options=data_val.dict)
 
-    def apply_column_styles(self, df, excel_config, wsheet, wbook):
+    def apply_column_styles(self, columns, excel_config, writer):
         """ Apply column styles based on config.json. """
         col_styles = excel_config.lookup("STYLING", "COLUMN", default={})
-        for col_num, name in enumerate(df.columns.values):
+        for col_num, name in enumerate(columns):
             col_opts = col_styles.get(name)
             if col_opts is None:
                 # Skip column if configuration not implemented
                 continue
             width = float(col_opts.get("width", 20))
-            cell_format = col_opts.get("cell_format", {})
-            col_format = wbook.add_format(cell_format)
-            wsheet.set_column(first_col=col_num, last_col=col_num,
-                              width=width, cell_format=col_format)
+            col_format = writer.format(col_opts.get("cell_format", {}))
+            writer.worksheet.set_column(first_col=col_num, last_col=col_num,
+                                        width=width, cell_format=col_format)
 
-    def apply_header_styles(self, df, excel_config, wsheet, wbook):
+    def apply_header_styles(self, columns, excel_config, writer):
         """ Apply header style based on config.json. It will apply
         default configuration if it is not specified. """
         dheader = {"bold": True, "text_wrap": True, "valign": "top", "border": 1}
         header_style = excel_config.lookup("STYLING", "HEADER", default=dheader)
-        header_format = wbook.add_format(header_style)
-        for col_num, name in enumerate(df.columns.values):
-            wsheet.write(0, col_num, name, header_format)
+        writer.write_row(columns, writer.format(header_style))
 
     def reset_index(self, df=None):
         """ Reset index for an input dataframe. It is
@@ -475,6 +414,14 @@ class Excel(File):
             last_col_loc = len(self.current_columns())
             self.df.insert(last_col_loc, new_col, value)
 
+    def map_column(self, column, mapping, new_column=None, default=None):
+        """ Map values in a column using a Jdict mapping and
+        assign the results to new_column (or column itself) """
+        if new_column is None:
+            new_column = column
+        values = mapping.lookup_all(self.df[column], default=default)
+        self.set_values(new_column, values)
+
     def rename_columns(self, rename_columns=None):
         """ Rename column labels. For changes to take
         place, existing column names must be present in
@@ -514,6 +461,20 @@ class Excel(File):
                 err = err_txt.format(ids=drop_index.values, file=self.filename)
                 raise ValueError(err)
 
+    def record_changes(self, removed=None, added=None):
+        """ Record rows removed from and added to the dataframe
+        since the file was read, so that the aggregates of the
+        file are only updated where they changed when it is
+        written. Changed rows are removed and added again. All
+        changes must be recorded, otherwise the aggregates are
+        built from all rows. """
+        if self.row_changes is None:
+            self.row_changes = ([], [])
+        for rows, changes in ((removed, self.row_changes[0]),
+                              (added, self.row_changes[1])):
+            if rows is not None and not rows.empty:
+                changes.append(rows)
+
     def drop_columns(self, mandatory_cols=None, drop_cols=None):
         """ Drop columns. mandatory_cols and drop_cols
         are mutually exclusive. It will drop any columns
@@ -568,11 +529,26 @@ class Excel(File):
 
     def update(self, new_df):
         """ Update dataframe with data from
-        a new dataframe """
+        a new dataframe. Integer columns stay
+        integer if there are no blank values. """
+        if self.is_blank():
+            self.df = new_df
+            return
+
+        dtypes = self.df.dtypes
+        self.df.update(new_df)
+        for column, dtype in dtypes.items():
+            values = self.df[column]
+            if (is_integer_dtype(dtype) and values.dtype != dtype
+                    and values.notna().all()):
+                self.df[column] = values.astype(dtype)
+
+    def append(self, new_df):
+        """ Append rows from a new dataframe """
         if self.is_blank():
             self.df = new_df
         else:
-            self.df.update(new_df)
+            self.df = pd.concat([self.df, new_df], sort=False)
 
     def equal(self, new_df):
         """ Return True if new_df is the same
@@ -592,19 +568,97 @@ class Excel(File):
     def sort_values(self, by, axis=0, ascending=True):
         self.df.sort_values(by, axis=axis, ascending=ascending, inplace=True)
 
+    def sort_index(self, ascending=True):
+        self.df.sort_index(ascending=ascending, inplace=True)
+
     def drop_duplicates(self, subset=None, keep="first"):
         self.df.drop_duplicates(subset=subset, keep=keep, inplace=True)
 
     def dropna(self, axis=0, subset=None, how='all', inplace=True):
         return self.df.dropna(axis=axis, how=how, subset=subset, inplace=inplace)
 
+    def compact(self):
+        """ Convert dataframe read from a file to the compact
+        layout used by the app: amounts in integer cents,
+        categorical types and the smallest integer type that
+        fits other integer columns. Amounts in files are in
+        currency units, so it must only be done once. """
+        for column in self.current_columns():
+            values = self.df[column]
+            if column in Excel.cents_columns:
+                if is_numeric_dtype(values):
+                    self.df[column] = self.to_cents(values)
+            elif column in Excel.category_columns:
+                self.df[column] = values.astype("category")
+        self.downcast()
+
+    def downcast(self, columns=None):
+        """ Convert integer columns to the smallest integer type
+        that fits their values. Amounts in cents are not changed. """
+        if columns is None:
+            columns = self.current_columns()
+        for column in columns:
+            values = self.df[column]
+            if column in Excel.cents_columns or is_bool_dtype(values):
+                continue
+            elif is_integer_dtype(values):
+                self.df[column] = pd.to_numeric(values, downcast="integer")
+
+    @staticmethod
+    def to_cents(values):
+        """ Convert amounts in currency units to integer cents.
+        Cents stay as floats if there are blank amounts. """
+        cents = (values*100).round()
+        if cents.notna().all():
+            return cents.astype(np.int64)
+        return cents
+
+    @staticmethod
+    def expand(df):
+        """ Return a copy of dataframe with amounts in currency
+        units and plain columns instead of categorical ones,
+        the layout used in .xlsx files """
+        columns = {}
+        for column in df.columns:
+            if column in Excel.cents_columns and is_numeric_dtype(df[column]):
+                columns[column] = df[column] / 100
+            elif df[column].dtype.name == "category":
+                columns[column] = df[column].astype(object)
+        return df.assign(**columns)
+
+    def memory_usage(self):
+        """ Return a Series with the number of bytes used
+        by the index and each column of the dataframe """
+        return self.df.memory_usage(index=True, deep=True)
+
 class Statements(Excel):
-    """ A class for working with bank statements """
+    """ A class for working with bank statements. The file
+    is only read when the dataframe is first used, so that
+    creating Statements objects costs nothing. Until then,
+    selections and counts use the database instead. """
     mandatory_columns = ("ID", "Type")
 
-    def __init__(self, filename=None, type='D', df=None):
+    def __init__(self, filename=None, type='D', df=None, read_file=False):
+        self._df = None
         super().__init__(filename=filename, type=type, df=df)
-        self.init_statements()
+        if read_file or df is not None:
+            self.init_statements()
+
+    @property
+    def df(self):
+        """ Dataframe of the statements. The file is
+        read the first time it is accessed. """
+        if self._df is None and self.filename is not None:
+            self.init_statements()
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+
+    def is_loaded(self):
+        """ Return True if the dataframe has been read """
+        return self._df is not None
 
     def init_statements(self):
         """ Initialise Statements"""
@@ -613,14 +667,15 @@ class Statements(Excel):
 
     def read(self, Sheet="Sheet1"):
         """ Read the .xlsx file. If the dataframe is not
-        initialised, it will read the dataframe from file
-        and add mandatory columns. """
-        if self.df is None and self.filename is not None:
+        initialised, it will read the dataframe from file,
+        add mandatory columns and make it compact. """
+        if self._df is None and self.filename is not None:
             super().read(sheet=Sheet)
             current_columns = self.df.columns.values.tolist()
             for col in Statements.mandatory_columns:
                 if col not in current_columns:
                     self.df[col] = None
+            self.compact()
 
     def post_read_validation(self, mand_cols=None):
         """ Check if statements xlsx file meets the expected format.
@@ -630,19 +685,745 @@ class Statements(Excel):
         super().post_read_validation(mand_cols)
         self.df.set_index("ID", inplace=True)
 
+    def load(self):
+        """ Read the file if it has not been read yet """
+        if not self.is_loaded():
+            self.init_statements()
+
+    def use_database(self):
+        """ Return True if the database table of the file can
+        be used instead of reading the file: data has not been
+        read yet and the table is up to date with the file. If
+        the table is out of date, the file is read and the
+        table is updated, so it can be used next time. """
+        if self.is_loaded() or self.filename is None:
+            return False
+
+        name = Database.table_name(self.filename)
+        fp = self.file_pointer()
+        Writers.wait_for(fp)
+        if name not in Database.tables or not self.file_exists(fp):
+            self.load()
+            return False
+
+        database = Database()
+        signature = self.file_signature(fp)
+        if database.signature(name) == signature:
+            return True
+        self.load()
+        database.write_table(name, self.df, signature)
+        return False
+
     def select_by(self, column, value=None, statement=True):
         """ Select transactions by a given column and value.
         It raises ValueError exception if a column is not in
         a statement. It will return a Statements object if
         statement is set to True and Pandas dataframe object
         otherwise"""
-        if column not in self.df.columns.values:
-            error = "{c} column not in {f}".format(c=column, f=self.filename)
-            raise ValueError(error)
+        if self.use_database():
+            name = Database.table_name(self.filename)
+            self.validate_column(column, Database().columns(name))
+            where = "{} = ?".format(Database.quote(column))
+            return self.select_rows(where, (value,), statement)
 
+        self.validate_column(column, self.df.columns.values)
         get_results = self.get_attr(column) == value
         selection = self.filter(get_results)
         if statement:
             return Statements(df=selection.reset_index())
         else:
             return selection
+
+    def select_dates(self, start=None, end=None, statement=True):
+        """ Select transactions dated between start and end,
+        inclusive. Either of them can be None. It will return
+        a Statements object if statement is set to True and
+        Pandas dataframe object otherwise """
+        if self.use_database():
+            conditions, params = [], []
+            if start is not None:
+                conditions.append("Date >= ?")
+                params.append(pd.Timestamp(start))
+            if end is not None:
+                conditions.append("Date <= ?")
+                params.append(pd.Timestamp(end))
+            return self.select_rows(" AND ".join(conditions), params, statement)
+
+        dates = self.get_attr("Date")
+        selected = dates.notna()
+        if start is not None:
+            selected &= dates >= pd.Timestamp(start)
+        if end is not None:
+            selected &= dates <= pd.Timestamp(end)
+        selection = self.filter(selected)
+        if statement:
+            return Statements(df=selection.reset_index())
+        else:
+            return selection
+
+    def select_rows(self, where, params, statement=True):
+        """ Select rows from the database table """
+        name = Database.table_name(self.filename)
+        selection = Database().read_table(name, where, params)
+        if statement:
+            return Statements(df=selection)
+        else:
+            return selection.set_index("ID")
+
+    def count(self, column=None, unique=None):
+        """ Return the number of transactions, or the number of
+        transactions with a value in column. Only the first
+        transaction for each value in unique column is counted
+        if unique is specified. """
+        if self.use_database():
+            name = Database.table_name(self.filename)
+            return Database().count(name, column, unique)
+
+        df = self.df
+        if unique is not None:
+            df = df.drop_duplicates(subset=unique)
+        if column is None:
+            return len(df.index)
+        return int(df[column].notna().sum())
+
+    def validate_column(self, column, columns):
+        """ Raise ValueError exception if column is not in columns """
+        if column not in columns:
+            error = "{c} column not in {f}".format(c=column, f=self.filename)
+            raise ValueError(error)
+
+class Database(File):
+    """ A class for keeping statements in a SQLite database.
+    Each statements file has a table with the same name and
+    columns, indexed on Date, Type and Info, so selections and
+    counts do not need to read the whole file. Each table
+    records the size and modification time of its file, so
+    it can be checked against the file before it is used. """
+
+    tables = ("classified", "unclassified")
+    indexed_columns = ("Date", "Type", "Info")
+    date_format = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, filename="statements.db", type="D"):
+        super().__init__(filename=filename, type=type)
+
+    @staticmethod
+    def table_name(filename):
+        """ Return table name for a file """
+        name = os.path.splitext(os.path.basename(filename))[0]
+        return name.lower()
+
+    @staticmethod
+    def quote(name):
+        """ Quote table or column name for SQL """
+        return '"{}"'.format(name.replace('"', '""'))
+
+    def connect(self):
+        """ Open connection to the database and
+        create the table of tables if needed """
+        connection = sqlite3.connect(self.file_pointer())
+        connection.execute("CREATE TABLE IF NOT EXISTS statement_files "
+                           "(name TEXT PRIMARY KEY, size INTEGER, "
+                           "mtime INTEGER, dtypes TEXT)")
+        return connection
+
+    def signature(self, name):
+        """ Return (size, modification time) of the file
+        the table was written from. Returns None if there
+        is no such table. """
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT size, mtime FROM statement_files "
+                                     "WHERE name = ?", (name,)).fetchone()
+        return None if row is None else tuple(row)
+
+    def dtypes(self, name):
+        """ Return a dictionary of column types in a table """
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT dtypes FROM statement_files "
+                                     "WHERE name = ?", (name,)).fetchone()
+        return {} if row is None else json.loads(row[0])
+
+    def columns(self, name):
+        """ Return a list of columns in a table """
+        return list(self.dtypes(name).keys())
+
+    def write_table(self, name, df, signature):
+        """ Replace table with dataframe in a single transaction.
+        Index is written as a column if it has a name. Rows are
+        kept in the same order as in the dataframe. """
+        if df.index.name is not None:
+            df = df.reset_index()
+        # Types are read back as categorical, the same as from files
+        dtypes = {col: "category" if col in Excel.category_columns
+                  else str(dtype) for col, dtype in df.dtypes.items()}
+        columns = ", ".join("{} {}".format(self.quote(col), self.sql_type(dtype))
+                            for col, dtype in df.dtypes.items())
+        values = ", ".join("?"*len(df.columns))
+        table = self.quote(name)
+
+        with closing(self.connect()) as connection, connection:
+            connection.execute("DROP TABLE IF EXISTS {}".format(table))
+            connection.execute("CREATE TABLE {} ({})".format(table, columns))
+            connection.executemany("INSERT INTO {} VALUES ({})".format(
+                table, values), self.to_rows(df))
+            for col in self.indexed_columns:
+                if col in dtypes:
+                    index = self.quote("{}_{}".format(name, col))
+                    connection.execute("CREATE INDEX {} ON {} ({})".format(
+                        index, table, self.quote(col)))
+            connection.execute("INSERT OR REPLACE INTO statement_files "
+                               "VALUES (?, ?, ?, ?)",
+                               (name, signature[0], signature[1],
+                                json.dumps(dtypes)))
+
+    def read_table(self, name, where="", params=()):
+        """ Read rows from a table into a dataframe with the
+        same column types as the dataframe written to it.
+        where is an SQL condition with ? placeholders for
+        params. Rows are in the order they were written. """
+        dtypes = self.dtypes(name)
+        if where:
+            where = " WHERE " + where
+        query = "SELECT * FROM {}{} ORDER BY rowid".format(self.quote(name), where)
+        params = [self.to_param(param) for param in params]
+        with closing(self.connect()) as connection:
+            df = pd.read_sql_query(query, connection, params=params)
+
+        for column, dtype in dtypes.items():
+            values = df[column]
+            if dtype.startswith("datetime64"):
+                df[column] = pd.to_datetime(values, format=self.date_format)
+            elif dtype == "object":
+                df[column] = values.where(values.notna(), np.nan)
+            elif dtype == "category" or values.notna().all():
+                df[column] = values.astype(dtype)
+        return df
+
+    def drop_table(self, name):
+        """ Delete table if it exists """
+        if not self.file_exists(self.file_pointer()):
+            return
+        with closing(self.connect()) as connection, connection:
+            connection.execute("DROP TABLE IF EXISTS {}".format(self.quote(name)))
+            connection.execute("DELETE FROM statement_files WHERE name = ?",
+                               (name,))
+
+    def count(self, name, column=None, unique=None):
+        """ Return the number of rows in a table, or the number
+        of rows with a value in column. Only the first row for
+        each value in unique column is counted if unique is
+        specified. """
+        count = "COUNT(*)" if column is None else "COUNT({})".format(
+                self.quote(column))
+        query = "SELECT {} FROM {}".format(count, self.quote(name))
+        if unique is not None:
+            query += " WHERE rowid IN (SELECT MIN(rowid) FROM {} GROUP BY {})"
+            query = query.format(self.quote(name), self.quote(unique))
+        with closing(self.connect()) as connection:
+            return connection.execute(query).fetchone()[0]
+
+    @staticmethod
+    def sql_type(dtype):
+        """ Return SQLite column type for a dataframe column type """
+        if is_bool_dtype(dtype) or is_integer_dtype(dtype):
+            return "INTEGER"
+        elif is_numeric_dtype(dtype):
+            return "REAL"
+        return "TEXT"
+
+    @classmethod
+    def to_param(cls, value):
+        """ Convert a value to a type SQLite can store """
+        if isinstance(value, (datetime.date, np.datetime64)):
+            return pd.Timestamp(value).strftime(cls.date_format)
+        elif isinstance(value, np.generic):
+            return value.item()
+        elif isinstance(value, str) and value == "":
+            # Blank cells are read back from .xlsx files as missing values
+            return None
+        return value
+
+    @classmethod
+    def to_rows(cls, df):
+        """ Yield rows of dataframe as tuples of values SQLite
+        can store. Missing values and blank strings are None. """
+        columns = []
+        for column in df.columns:
+            values = df[column]
+            if is_datetime64_any_dtype(values):
+                values = values.dt.strftime(cls.date_format)
+            values = values.astype(object)
+            stored = values.notna() & (values != "")
+            columns.append(values.where(stored, None).tolist())
+        return zip(*columns)
+
+class Aggregates:
+    """ A class for the aggregate cube of classified transactions.
+    For each category and month it keeps the number of
+    transactions, their total, smallest and largest amount and
+    the sum of squares of amounts, all in cents, and the dates
+    of the first and the last transaction. The cube is kept
+    in a table of the database with the signature of the file,
+    like statements tables. When the file is written, changes
+    recorded with Excel.record_changes are applied to the cells
+    they touch. Otherwise the cube is built from all rows in one
+    pass. Yearly and all time figures are rolled up from months,
+    so reports cost categories x months, not transactions. """
+
+    name = "aggregates"
+    source = "classified"
+    keys = ["Type", "Month"]
+    columns = ["Count", "Total", "Minimum", "Maximum", "Squares",
+               "First", "Last"]
+    sums = ["Count", "Total", "Squares"]
+    # Columns kept as the smallest or the largest value of a cell
+    extremes = [("Minimum", "min"), ("Maximum", "max"),
+                ("First", "min"), ("Last", "max")]
+
+    def __init__(self):
+        self.database = Database()
+
+    @classmethod
+    def build(cls, df):
+        """ Return the cube of transactions in dataframe, indexed
+        by Type and Month. Transactions without type are left out. """
+        types = df["Type"].astype(object)
+        rows = types.notna() & (types != "")
+        amounts = df["Amount"][rows].astype(float).values
+        dates = df["Date"][rows].values.astype("datetime64[ns]")
+        months = dates.astype("datetime64[M]")
+        frame = pd.DataFrame({"Type": types[rows].values,
+                              "Month": months.astype("datetime64[ns]"),
+                              "Date": dates, "Amount": amounts,
+                              "Square": amounts**2})
+        grouped = frame.groupby(cls.keys, sort=True)
+        return pd.DataFrame({"Count": grouped.size(),
+                             "Total": grouped["Amount"].sum(),
+                             "Minimum": grouped["Amount"].min(),
+                             "Maximum": grouped["Amount"].max(),
+                             "Squares": grouped["Square"].sum(),
+                             "First": grouped["Date"].min(),
+                             "Last": grouped["Date"].max()},
+                            columns=cls.columns)
+
+    @classmethod
+    def update(cls, cube, removed, added, df):
+        """ Return cube with rows removed and added. Sums are
+        updated in place of the cells. Cells which lost their
+        smallest or largest amount or their first or last date
+        get them from the rows of those cells in df, the data
+        after the changes. """
+        lost = cls.build(pd.concat(removed, sort=False) if removed else df.iloc[:0])
+        gained = cls.build(pd.concat(added, sort=False) if added else df.iloc[:0])
+        updated = cube[cls.sums].add(gained[cls.sums], fill_value=0)
+        updated = updated.sub(lost[cls.sums], fill_value=0)
+        updated = updated[updated["Count"] > 0]
+
+        stale = np.zeros(len(lost.index), dtype=bool)
+        for column, pick in cls.extremes:
+            values = pd.concat([cube[column], gained[column]], axis=1)
+            updated[column] = getattr(values, pick)(axis=1).reindex(updated.index)
+            kept = cube[column].reindex(lost.index)
+            if pick == "min":
+                stale |= (lost[column] <= kept).values
+            else:
+                stale |= (lost[column] >= kept).values
+        stale = lost.index[stale].intersection(updated.index)
+        if len(stale) > 0:
+            types = df["Type"].astype(object)
+            months = pd.Series(df["Date"].values.astype("datetime64[M]"),
+                               index=df.index).astype("datetime64[ns]")
+            rows = (types.isin(stale.get_level_values("Type")) &
+                    months.isin(stale.get_level_values("Month")))
+            cells = cls.build(df[rows.values]).reindex(stale)
+            for column, pick in cls.extremes:
+                values = cells[column].combine_first(updated[column])
+                updated[column] = values.reindex(updated.index)
+
+        updated["Count"] = updated["Count"].astype(np.int64)
+        return updated[cls.columns]
+
+    def update_table(self, excel, signature):
+        """ Update the cube with changes recorded by excel, which
+        has just been written, or build it from all its rows """
+        changes = excel.row_changes
+        base = self.signature()
+        if (changes is not None and base is not None
+                and base == excel.read_signature):
+            cube = self.update(self.read_table(), changes[0], changes[1], excel.df)
+        else:
+            cube = self.build(excel.df)
+        self.write_table(cube, signature)
+        excel.row_changes = None
+        excel.read_signature = signature
+
+    def signature(self):
+        """ Return signature of the file the cube table was
+        built from. Returns None if there is no table or it
+        does not have all columns of the cube, e.g. it was
+        built by an older version of the app. """
+        if not set(self.columns) <= set(self.database.columns(self.name)):
+            return None
+        return self.database.signature(self.name)
+
+    def write_table(self, cube, signature):
+        """ Replace the database table with the cube """
+        self.database.write_table(self.name, cube.reset_index(), signature)
+
+    def read_table(self):
+        """ Return the cube from the database table """
+        cube = self.database.read_table(self.name)
+        cube["Type"] = cube["Type"].astype(object)
+        return cube.set_index(self.keys)
+
+    def read(self):
+        """ Return the cube of the file. It is built from the
+        file if the table is out of date with the file. """
+        statements = Statements(self.source)
+        fp = statements.file_pointer()
+        Writers.wait_for(fp)
+        if not statements.file_exists(fp):
+            return self.build(statements.df)
+        signature = statements.file_signature(fp)
+        if self.signature() == signature:
+            return self.read_table()
+        cube = self.build(statements.df)
+        self.write_table(cube, signature)
+        return cube
+
+    def summarize(self, timeframe=None, cube=None):
+        """ Return the number of transactions of each category,
+        their total, mean, smallest and largest amount, the
+        standard deviation of amounts and the dates of the first
+        and the last transaction. Amounts are in currency units.
+        They are given for each month or year if timeframe is
+        "Month" or "Year", or for all time. """
+        if cube is None:
+            cube = self.read()
+        frame = cube.reset_index()
+        keys = ["Type"]
+        if timeframe is not None:
+            unit = {"Month": "datetime64[M]", "Year": "datetime64[Y]"}[timeframe]
+            periods = frame["Month"].values.astype(unit)
+            frame[timeframe] = periods.astype("datetime64[ns]")
+            keys.append(timeframe)
+
+        grouped = frame.groupby(keys, sort=True)
+        summary = pd.DataFrame({"Count": grouped["Count"].sum(),
+                                "Total": grouped["Total"].sum(),
+                                "Minimum": grouped["Minimum"].min(),
+                                "Maximum": grouped["Maximum"].max(),
+                                "First": grouped["First"].min(),
+                                "Last": grouped["Last"].max()})
+        squares = grouped["Squares"].sum()
+        count = summary["Count"]
+        summary["Mean"] = summary["Total"] / count
+        deviations = squares - summary["Total"] * summary["Mean"]
+        summary["Std"] = np.sqrt((deviations / (count - 1)).clip(lower=0))
+        for column in ("Total", "Mean", "Minimum", "Maximum", "Std"):
+            summary[column] = summary[column] / 100
+        return summary[["Count", "Total", "Mean", "Minimum", "Maximum", "Std",
+                        "First", "Last"]]
+
+class Writers:
+    """ Pool of processes writing .xlsx files while it is open,
+    so that independent files are written at the same time.
+    Most of the time of a write is spent building the XML of
+    the sheet in Python, which threads could not do at the same
+    time. Dataframes are copied when a write is submitted, so
+    they can be changed straight after. Reading, writing or
+    deleting a file waits until its pending write is done.
+    Pools can be nested, the outermost one does the writes. """
+
+    current = None
+    # Smaller files are written straight away, because sending
+    # them to another process takes longer than writing them
+    min_rows = 5000
+    max_workers = 3
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = min(Writers.max_workers, os.cpu_count() or 1)
+        self.workers = workers
+        self.executor = None
+        self.pending = {}
+        self.owner = False
+
+    def __enter__(self):
+        if Writers.current is None:
+            Writers.current = self
+            self.owner = True
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.owner:
+            try:
+                self.wait()
+            finally:
+                Writers.current = None
+                self.owner = False
+                if self.executor is not None:
+                    self.executor.shutdown()
+        return False
+
+    @classmethod
+    def wait_for(cls, file_pointer=None):
+        """ Wait until file_pointer is written if a pool is
+        open. It waits for all files if it is None. """
+        if cls.current is not None:
+            cls.current.wait(file_pointer)
+
+    def submit(self, excel, file_pointer, sheet="Sheet1", chunksize=10000):
+        """ Write dataframe of excel to file_pointer in a process
+        of the pool. Returns False if it should be written straight
+        away instead, i.e. there is only one worker or the
+        dataframe is small. """
+        if self.workers <= 1 or excel.count_rows() < Writers.min_rows:
+            return False
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        snapshot = copy.copy(excel)
+        snapshot.df = excel.df.copy()
+        future = self.executor.submit(snapshot.write_xlsx, file_pointer,
+                                      sheet, chunksize)
+        key = File.memory_key(file_pointer)
+        self.pending[key] = (snapshot, file_pointer, sheet, future)
+        return True
+
+    def wait(self, file_pointer=None):
+        """ Wait until file_pointer is written. It waits for all
+        files if it is None. Errors raised while writing a file
+        are raised again here. """
+        if file_pointer is None:
+            keys = list(self.pending)
+        else:
+            keys = [File.memory_key(file_pointer)]
+        for key in keys:
+            write = self.pending.pop(key, None)
+            if write is not None:
+                snapshot, fp, sheet, future = write
+                future.result()
+                snapshot.finish_write(fp, sheet)
+
+class XlsxWriter:
+    """ Write rows to .xlsx file with xlsxwriter in constant memory
+    mode. A row is flushed to a temporary file as soon as the next
+    one is started, so memory use does not grow with the number of
+    rows. Rows must be written in order, starting with the header.
+    Formats are created once for each style and reused. """
+
+    datetime_format = "dd mmm yyyy"
+
+    def __init__(self, file_pointer, sheet="Sheet1"):
+        options = {"constant_memory": True}
+        self.workbook = xlsxwriter.Workbook(file_pointer, options)
+        self.worksheet = self.workbook.add_worksheet(sheet)
+        self.formats = {}
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def format(self, style):
+        """ Return workbook format for a style dictionary """
+        key = json.dumps(style, sort_keys=True)
+        if key not in self.formats:
+            self.formats[key] = self.workbook.add_format(style)
+        return self.formats[key]
+
+    def write_rows(self, df):
+        """ Write dataframe rows after the rows written so far """
+        for values in df.itertuples(index=False, name=None):
+            self.write_row(values)
+
+    def write_row(self, values, cell_format=None):
+        """ Write a row of values after the rows written so far """
+        for col_num, value in enumerate(values):
+            self.write_cell(self.rows, col_num, value, cell_format)
+        self.rows += 1
+
+    def write_cell(self, row, col, value, cell_format=None):
+        """ Write a value with the type pandas would use. Blank
+        values, i.e. None, NaN, NaT and "", are not written. """
+        if value is None or value != value or value == "":
+            return
+        elif isinstance(value, (bool, np.bool_)):
+            self.worksheet.write_boolean(row, col, value, cell_format)
+        elif isinstance(value, datetime.date):
+            if cell_format is None:
+                cell_format = self.format({"num_format": self.datetime_format})
+            self.worksheet.write_datetime(row, col, value, cell_format)
+        elif isinstance(value, (int, float, np.number)):
+            self.worksheet.write_number(row, col, value, cell_format)
+        else:
+            self.worksheet.write_string(row, col, str(value), cell_format)
+
+    def close(self):
+        """ Write the workbook to the file """
+        self.workbook.close()
+
+class XlsxStream:
+    """ A class for reading rows from .xlsx files one at a time.
+    It parses worksheet xml incrementally, so memory use depends
+    on the size of a chunk rather than the size of the sheet. """
+
+    main_ns = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+    rel_ns = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+    date_formats = set(range(14, 23)) | set(range(45, 48))
+    excel_epoch = datetime.datetime(1899, 12, 30)
+
+    def __init__(self, file_pointer, sheet="Sheet1"):
+        if not os.path.isfile(file_pointer):
+            raise FileNotFoundError(file_pointer)
+        self.file_pointer = file_pointer
+        self.sheet = sheet
+
+    def chunks(self, chunksize=10000):
+        """ Yield dataframes with up to chunksize rows each.
+        The first row of the sheet is used as a header. """
+        rows = self.rows()
+        header = next(rows, None)
+        if header is None:
+            return
+
+        position = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunksize:
+                yield self.to_frame(chunk, header, position)
+                position += len(chunk)
+                chunk = []
+        if chunk:
+            yield self.to_frame(chunk, header, position)
+
+    @staticmethod
+    def to_frame(rows, header, start):
+        """ Convert a list of rows to a dataframe """
+        width = len(header)
+        data = [row[:width] + [None]*(width - len(row)) for row in rows]
+        index = pd.RangeIndex(start, start + len(rows))
+        return pd.DataFrame(data, columns=header, index=index)
+
+    def rows(self):
+        """ Yield lists of cell values for each row in the sheet.
+        Blank rows between the rows with data are yielded as
+        empty lists. """
+        with zipfile.ZipFile(self.file_pointer) as archive:
+            strings = self.shared_strings(archive)
+            date_styles = self.date_styles(archive)
+            with archive.open(self.sheet_path(archive)) as sheet_xml:
+                last_row = 0
+                sheet_data = None
+                for event, elem in ET.iterparse(sheet_xml, ("start", "end")):
+                    if event == "start":
+                        if elem.tag == self.main_ns + "sheetData":
+                            sheet_data = elem
+                        continue
+                    elif elem.tag != self.main_ns + "row":
+                        continue
+
+                    row_number = int(elem.get("r", last_row + 1))
+                    for _ in range(last_row + 1, row_number):
+                        yield []
+                    last_row = row_number
+                    yield self.parse_row(elem, strings, date_styles)
+                    if sheet_data is not None:
+                        sheet_data.clear()
+
+    def parse_row(self, row, strings, date_styles):
+        """ Return a list of cell values in a row """
+        values = []
+        for cell in row.iter(self.main_ns + "c"):
+            column = self.column_number(cell.get("r"), len(values))
+            values.extend([None]*(column - len(values)))
+            values.append(self.cell_value(cell, strings, date_styles))
+        return values
+
+    def cell_value(self, cell, strings, date_styles):
+        """ Return cell value converted to python type """
+        cell_type = cell.get("t", "n")
+        if cell_type == "inlineStr":
+            return "".join(t.text or "" for t in cell.iter(self.main_ns + "t"))
+
+        value = cell.findtext(self.main_ns + "v")
+        if value is None:
+            return None
+        elif cell_type == "s":
+            return strings[int(value)]
+        elif cell_type == "b":
+            return value == "1"
+        elif cell_type in ("str", "e"):
+            return value
+
+        number = float(value)
+        if int(cell.get("s", 0)) in date_styles:
+            return self.excel_epoch + datetime.timedelta(days=number)
+        elif number.is_integer():
+            return int(number)
+        return number
+
+    @staticmethod
+    def column_number(reference, default):
+        """ Convert cell reference, e.g. "AB12" to a
+        zero-based column number """
+        if reference is None:
+            return default
+        number = 0
+        for letter in re.match("[A-Z]+", reference).group():
+            number = number*26 + ord(letter) - ord("A") + 1
+        return number - 1
+
+    def sheet_path(self, archive):
+        """ Return path to the worksheet xml in the archive """
+        workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+        rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+        for sheet in workbook.iter(self.main_ns + "sheet"):
+            if sheet.get("name") == self.sheet:
+                target = targets[sheet.get(self.rel_ns + "id")]
+                if target.startswith("/"):
+                    return target[1:]
+                return "xl/" + target
+        raise ValueError("Sheet {} not found".format(self.sheet))
+
+    def shared_strings(self, archive):
+        """ Return a list of shared strings in the workbook """
+        try:
+            xml = archive.open("xl/sharedStrings.xml")
+        except KeyError:
+            return []
+        strings = []
+        with xml:
+            for _, elem in ET.iterparse(xml):
+                if elem.tag == self.main_ns + "si":
+                    texts = elem.iter(self.main_ns + "t")
+                    strings.append("".join(t.text or "" for t in texts))
+                    elem.clear()
+        return strings
+
+    def date_styles(self, archive):
+        """ Return a set of cell style IDs that format dates """
+        try:
+            styles = ET.fromstring(archive.read("xl/styles.xml"))
+        except KeyError:
+            return set()
+
+        date_formats = set(self.date_formats)
+        for num_format in styles.iter(self.main_ns + "numFmt"):
+            code = num_format.get("formatCode", "")
+            code = re.sub(r'"[^"]*"|\[.*?\]', "", code)
+            if re.search("[dmy]", code, re.IGNORECASE):
+                date_formats.add(int(num_format.get("numFmtId")))
+
+        cell_formats = styles.find(self.main_ns + "cellXfs")
+        if cell_formats is None:
+            return set()
+        return {i for i, xf in enumerate(cell_formats)
+                if int(xf.get("numFmtId", 0)) in date_formats}
@@ -0,0 +1,737 @@
+import os
+import json
+import hashlib
+import contextlib
+
+""" Path, File, Jdict, Mappings and Session classes for paths,
+user files, JSON config files, category mappings and data
+kept in memory. They do not depend on pandas, so commands
+that only use config files start quickly. """
+
+class Path:
+    """ Class for path handling"""
+    def __init__(self, path):
+        self.path = path
+
+    def init_dirs(self):
+        """ Initialise relevant directories """
+        os.makedirs(self.path, exist_ok=True)
+
+    def exists_or_is_creatable(self):
+        """ Check if path exists of is creatable"""
+        if not isinstance(self.path, str) or not self.path:
+            return False
+        try:
+            exists = os.path.exists(self.path)
+            creatable = os.access(os.path.dirname(self.path), os.W_OK)
+            return exists or creatable
+        except OSError:
+            return False
+
+class File:
+    """ Class for initialising and handling user files """
+    types = {'D': "Data", "P": "Plot"}
+    # Data kept in memory while a Session is open, keyed on
+    # file pointer. It is not used while it is None.
+    memory = None
+
+    def __init__(self, filename=None, type='', system_file=False):
+        self.expected_extension = None
+        self.system_file = system_file
+        self.filename = filename
+        self.subfolders = ''
+        self.type = type
+        self.init_file()
+
+    def init_file(self):
+        """ Initialise file if filename is specified
+        and parse it into filename, subfolders and type.
+        It also creates relevant directories if required. """
+        if self.filename is not None:
+            self.parse_inputs(self.filename, self.type)
+            fp = self.file_pointer(with_file=False)
+            path = Path(fp)
+            path.init_dirs()
+
+    def get_type_name(self):
+        """ Return type name based on code. """
+        return File.types.get(self.type, '')
+
+    def parse_inputs(self, filename, type_code):
+        """ Process filename and type_code. It parses
+        the data into filename, subfolders and type """
+        self.subfolders, self.filename = os.path.split(filename)
+        self.type = File.types.get(type_code, "")
+
+    def base_path(self):
+        """ Return base path for the output depending on
+        whether this is a file used by the source code or
+        a file amendable/viewable by the user. """
+        if self.system_file:
+            return os.path.join(os.getcwd(), "system", "configuration")
+        else:
+            config = Jdict("u_paths")
+            return config.lookup("COMMON")
+
+    def file_pointer(self, with_file=True):
+        """ Return full file pointer to the file """
+        base = self.base_path()
+        fp = os.path.join(base, self.type, self.subfolders)
+        if with_file and (self.filename is None or not self.filename):
+            raise ValueError("Filename not specified")
+        elif with_file:
+            return os.path.join(fp, self.filename)
+        else:
+            return fp
+
+    def delete_file(self):
+        """ Delete file """
+        fp = self.file_pointer()
+        try:
+            os.remove(fp)
+        except FileNotFoundError:
+            pass
+
+    def rename(self, new_name=None, new_type=""):
+        """ Change file name and type"""
+        if new_name is not None:
+            self.subfolders, self.filename = os.path.split(new_name)
+        if new_type:
+            self.type = File.types.get(new_type, "")
+
+    @staticmethod
+    def file_exists(fp):
+        """ Check if file exists. Returns True/False."""
+        return os.path.isfile(fp)
+
+    @staticmethod
+    def file_signature(fp):
+        """ Return (size, modification time) of a file.
+        It raises FileNotFoundError if the file does
+        not exist. """
+        stat = os.stat(fp)
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def file_hash(fp):
+        """ Return SHA-1 hash of the file contents """
+        sha = hashlib.sha1()
+        with open(fp, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    @staticmethod
+    def memory_key(fp):
+        """ Return the key of a file in memory. The same
+        file can be named differently, e.g. in a different
+        case on Windows, so file pointers are normalised. """
+        return os.path.normcase(os.path.abspath(fp))
+
+    @classmethod
+    def overwrite_check(cls, fp):
+        """ Raise IOError exception if the file already
+        exists. It can be used as a check before the file
+        is created."""
+        if cls.file_exists(fp):
+            filename = os.path.basename(fp)
+            error = " >> {} already exists. File was not overwritten."
+            raise IOError(error.format(filename))
+
+    def validate_file_extension(self):
+        """ Validate filename and extension based on logic below:
+        1) File name or expected extension is None
+            - Do nothing
+        2) File name doesn't have an extension.
+            - Add it to filename
+        3) File name has the same extension as expected extension
+            - Do nothing
+        3) File name has extension, but different to expected extension:
+            - Raise an exception """
+
+        if self.filename is None or self.expected_extension is None:
+            return
+
+        extension = os.path.splitext(self.filename)[1]
+        if extension == self.expected_extension:
+            pass
+        elif extension == '':
+            self.filename += self.expected_extension
+        else:
+            err = "File {f} must have {e} extension"
+            error = err.format(f=self.filename, e=self.expected_extension)
+            raise ValueError(error)
+
+class Jdict(File):
+    """ Class for manipulating JSON files and dictionaries.
+
+    Dictionaries read from files are cached for the whole process,
+    keyed on the file pointer. A cached dictionary is used while
+    the size and modification time of its file stay the same.
+    Instances share the cached dictionary until they change it,
+    when they get their own copy. """
+
+    cache = {}
+    cache_stats = {"reads": 0, "hits": 0}
+
+    def __init__(self, Filename=None, Type='', dict=None, system_file=True):
+        super().__init__(filename=Filename, type=Type, system_file=system_file)
+        self.dict = dict
+        self.shared = False
+        self.init_jdict()
+
+    def init_jdict(self):
+        """ Initialise file """
+        self.pre_read_validation()
+        self.read()
+
+    def pre_read_validation(self):
+        """ Do validation before file is read. """
+        self.expected_extension = ".json"
+        self.validate_file_extension()
+
+    def read(self):
+        """ Read categories from .json file. Set up empty
+        dictionary if file does not exist. Don't read if
+        dict attribute is not None or if the filename is
+        not specified. """
+        if self.dict is not None or self.filename is None:
+            return
+        try:
+            fp = os.path.abspath(self.file_pointer())
+            signature = self.file_signature(fp)
+        except FileNotFoundError:
+            self.dict = {}
+            return
+
+        cached = Jdict.cache.get(fp)
+        if cached is not None and cached[0] == signature:
+            Jdict.cache_stats["hits"] += 1
+        else:
+            with open(fp, "r") as file:
+                cached = (signature, json.load(file))
+            Jdict.cache[fp] = cached
+            Jdict.cache_stats["reads"] += 1
+        self.dict = cached[1]
+        self.shared = True
+
+    def write(self):
+        """ Write categories to .json file. The
+        cache is updated with the new contents. """
+        fp = os.path.abspath(self.file_pointer())
+        with open(fp, "w+") as file:
+            json.dump(self.dict, file, indent=4, sort_keys=True)
+        Jdict.cache[fp] = (self.file_signature(fp), self.dict)
+        self.shared = True
+
+    def own_dict(self):
+        """ Copy dictionary shared with the cache, so
+        that it can be changed. Lists in the dictionary
+        are replaced rather than changed in place. """
+        if self.shared:
+            self.dict = dict(self.dict)
+            self.shared = False
+
+    def update(self, id, value):
+        """ Update value in dictionary. """
+        self.own_dict()
+        self.dict[id] = value
+
+    def append(self, id, value):
+        """ It will append value to the list keyed on id.
+        It will create a list of values if and when needed """
+        self.own_dict()
+        current_values = self.dict.get(id, None)
+        if current_values is None:
+            self.dict[id] = value
+        elif isinstance(current_values, list):
+            self.dict[id] = current_values + [value]
+        else:
+            self.dict[id] = [current_values, value]
+
+    def extend(self, id, value):
+        """ Extends the list and add a value keyed on id. """
+        self.own_dict()
+        current_values = self.dict.get(id, None)
+        if current_values is None:
+            self.dict[id] = value
+        elif isinstance(current_values, list):
+            self.dict[id] = current_values + list(value)
+        else:
+            self.dict[id] = [current_values, value]
+
+    def is_blank(self):
+        """ Returns True if dict attribute is None"""
+        return self.dict == None
+
+    def show(self, pad='', level=None):
+        """ Print the contents of categories dictionary.
+        It will show each category and its keywords in
+        pad XXXXX | ['YYYYY', 'ZZZZZ', ...] format. It
+        adds padding at the end to each XXXXX in order
+        to make the bars align for all categories. It
+        prints None if dict attribute is None """
+
+        if level is None:
+            use_dict = self.dict
+        else:
+            use_dict = self.lookup(level)
+
+        if use_dict is None:
+            print(pad, None, " | ",  None)
+            return
+
+        max_length = 0
+        for id in use_dict.keys():
+            if max_length < len(id):
+                max_length = len(id)
+        for id, val in use_dict.items():
+            padded_id = pad + id + (max_length - len(id))*' '
+            print(padded_id, ' | ', val)
+
+    def lookup(self, *keys, default=None):
+        """ Look up a value in dictionary based on key.
+        By providing multiple keys, it will get the values
+        from nested dictionaries. If there are no nested
+        dictionaries or the value against the key is not
+        present, it will return the value specified in
+        default.
+        If a tuple is passed in via keys[0], it will
+        iterate through it rather than keys as a whole."""
+        if isinstance(keys[0], tuple) or isinstance(keys[0], list):
+            if len(keys) == 1 and len(keys[0]) > 1 :
+                # Iterable variable was passed in.
+                # Iterate through it instead rather than keys
+                keys = keys[0]
+
+        new_level = self.dict
+        for key in keys:
+            if not isinstance(new_level, dict):
+                return default
+            new_level = new_level.get(key, default)
+        return new_level
+
+    def lookup_all(self, keys, default=None):
+        """ Look up values for a whole column of keys at once.
+        Keys are dictionary-encoded first, so each distinct key
+        is looked up once and the results are mapped back to the
+        rows by their integer codes. Returns a pandas Series
+        with the same index as keys. """
+        import numpy as np
+        import pandas as pd
+
+        keys = pd.Series(keys)
+        codes, uniques = pd.factorize(keys)
+        values = pd.Series(uniques).map(self.dict or {})
+        values = values.where(values.notna(), default)
+        # Missing keys have code -1, which picks default at the end
+        values = np.append(values.values.astype(object), default)
+        return pd.Series(values[codes], index=keys.index)
+
+    def transpose(self):
+        """ Swap key-value pairs in self.dict.
+        E.g. convert {A:[a1, a2, ...], B:[b1, b2, ...]}
+        dictionary to {a1:A, a2:A, ..., b1:B, b2:B, ...}
+        and vice versa.
+
+        It does not work with nested lists. It will raise
+        and exception if it comes across a dictionary
+        like {A:[[...], [...], ...], B:b1, ...} """
+        old_dict = self.dict
+        old_keys = old_dict.keys()
+        self.dict = {}
+        self.shared = False
+        frequencies = {}
+
+        for id in old_keys:
+            values = old_dict[id]
+            if not isinstance(values, list):
+                values = [values]
+
+            for value in values:
+                if isinstance(value, list):
+                    err_txt = "Nested lists not supported:" + str(values)
+                    raise TypeError(err_txt)
+
+                val_frequency = frequencies.get(value, 0)
+                if val_frequency == 0:
+                    self.dict[value] = id
+                    frequencies[value] = 1
+
+                elif val_frequency == 1:
+                    self.dict[value] = [self.dict[value], id]
+                    frequencies[value] += 1
+
+                elif val_frequency > 1:
+                    self.dict[value].append(id)
+                    frequencies[value] += 1
+
+    def pop(self, key, default=None):
+        """ Delete key from dictionary """
+        self.own_dict()
+        self.dict.pop(key, default)
+
+    def keys(self):
+        return self.dict.keys()
+
+    def items(self):
+        return self.dict.items()
+
+    def values(self):
+        return self.dict.values()
+
+class Mappings(Jdict):
+    """ Class for mappings of transaction info to categories in
+    u_cmappings.json. There can be hundreds of thousands of them,
+    so changes are appended to a journal file next to it rather
+    than rewriting the whole file. The journal is replayed on top
+    of the file when it is read. Once it gets large, it is
+    compacted into the file in a background thread.
+
+    Each line of the journal is a JSON dictionary of changes.
+    Deleted mappings have null values.
+
+    Info of mappings of each category is indexed as well, so
+    that deleting or renaming a category only changes its own
+    mappings. The index is built in one pass when it is first
+    needed and kept up to date as mappings change. """
+
+    extension = ".journal"
+    # Journal is compacted once it is bigger than this
+    # or a quarter of the file, whichever is bigger
+    compact_size = 1 << 16
+    compacting = None
+    lock = None
+    # Number of nested locked blocks in this process
+    lock_depth = 0
+    # Indexes of cached mappings keyed on file pointers,
+    # together with the mappings they were built from
+    indexes = {}
+
+    def __init__(self, Filename="u_cmappings", Type='', dict=None,
+                 system_file=True):
+        # Mappings passed in replace the whole file when written
+        self.changes = {} if dict is None else None
+        # Signature of the file and journal when they were read
+        self.loaded = None
+        self.by_category = None
+        self.index_shared = False
+        # Categories whose sets were copied, None if all are owned
+        self.index_copied = None
+        super().__init__(Filename=Filename, Type=Type, dict=dict,
+                         system_file=system_file)
+
+    @classmethod
+    def get_lock(cls):
+        """ Return the lock held while files are read or
+        written, so that they are not read half written """
+        if cls.lock is None:
+            import threading
+            cls.lock = threading.RLock()
+        return cls.lock
+
+    @classmethod
+    @contextlib.contextmanager
+    def locked(cls, fp, shared=False):
+        """ Hold the lock while mappings in file fp are read or
+        written. Other processes are locked out as well with
+        a lock file where fcntl is available, so that they do
+        not append to the journal while it is compacted. Only
+        the outermost block of a process takes the lock file. """
+        with cls.get_lock():
+            file = None
+            if cls.lock_depth == 0:
+                file = cls.open_lock_file(fp)
+            if file is not None:
+                import fcntl
+                fcntl.flock(file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            cls.lock_depth += 1
+            try:
+                yield
+            finally:
+                cls.lock_depth -= 1
+                if file is not None:
+                    # Closing the file releases the lock
+                    file.close()
+
+    @staticmethod
+    def open_lock_file(fp):
+        """ Return the open lock file of file fp. Returns None
+        if processes cannot be locked out, i.e. there is no
+        fcntl or the lock file cannot be created. """
+        try:
+            import fcntl
+        except ImportError:
+            return None
+        try:
+            return open(os.path.splitext(fp)[0] + ".lock", "a")
+        except OSError:
+            return None
+
+    @classmethod
+    def journal_pointer(cls, fp):
+        """ Return file pointer to the journal of file fp """
+        return os.path.splitext(fp)[0] + cls.extension
+
+    @classmethod
+    def signature(cls, fp):
+        """ Return signatures of the file and its journal.
+        Signature is None if the file does not exist. """
+        signatures = []
+        for pointer in (fp, cls.journal_pointer(fp)):
+            try:
+                signatures.append(cls.file_signature(pointer))
+            except FileNotFoundError:
+                signatures.append(None)
+        return tuple(signatures)
+
+    def read(self):
+        """ Read mappings from .json file and replay the journal
+        on top. Mappings are cached the same way as by Jdict,
+        until the file or the journal change. """
+        if self.dict is not None or self.filename is None:
+            return
+        fp = os.path.abspath(self.file_pointer())
+        with self.locked(fp, shared=True):
+            signature = self.signature(fp)
+            cached = Jdict.cache.get(fp)
+            if cached is not None and cached[0] == signature:
+                Jdict.cache_stats["hits"] += 1
+            else:
+                cached = (signature, self.load(fp))
+                Jdict.cache[fp] = cached
+                Jdict.cache_stats["reads"] += 1
+        self.dict = cached[1]
+        self.shared = True
+        self.loaded = cached[0]
+
+    def load(self, fp):
+        """ Return mappings from file fp with the changes from
+        its journal applied. A line cut short, e.g. by a crash
+        while it was written, ends the journal. """
+        try:
+            with open(fp, "r") as file:
+                mappings = json.load(file)
+        except FileNotFoundError:
+            mappings = {}
+
+        try:
+            with open(self.journal_pointer(fp), "r") as file:
+                for line in file:
+                    try:
+                        changes = json.loads(line)
+                    except ValueError:
+                        break
+                    for key, value in changes.items():
+                        if value is None:
+                            mappings.pop(key, None)
+                        else:
+                            mappings[key] = value
+        except FileNotFoundError:
+            pass
+        return mappings
+
+    def write(self):
+        """ Append changes made since the last write to the
+        journal, or write the whole file if mappings were
+        replaced. The cache is updated with the new contents.
+        If others wrote mappings since they were read, they
+        are read again with the changes from the journal. """
+        fp = os.path.abspath(self.file_pointer())
+        with self.locked(fp):
+            if self.changes is None:
+                self.replace(fp, self.dict)
+            else:
+                stale = self.signature(fp) != self.loaded
+                if self.changes:
+                    with open(self.journal_pointer(fp), "a") as file:
+                        file.write(json.dumps(self.changes) + "\n")
+                if stale:
+                    self.dict = self.load(fp)
+                    self.by_category = None
+                    self.index_shared = False
+            self.loaded = self.signature(fp)
+            Jdict.cache[fp] = (self.loaded, self.dict)
+            if self.by_category is not None:
+                Mappings.indexes[fp] = (self.dict, self.by_category)
+                self.index_shared = True
+        self.changes = {}
+        self.shared = True
+        if self.is_compaction_due(fp):
+            self.compact_in_background(fp)
+
+    def replace(self, fp, mappings):
+        """ Write all mappings to the file and delete the
+        journal. The file is written to a temporary file
+        first, so that it is never left half written. """
+        temp_pointer = fp + ".tmp"
+        with open(temp_pointer, "w+") as file:
+            json.dump(mappings, file, indent=4, sort_keys=True)
+        os.replace(temp_pointer, fp)
+        try:
+            os.remove(self.journal_pointer(fp))
+        except FileNotFoundError:
+            pass
+
+    def is_compaction_due(self, fp):
+        """ Check if the journal is big enough to be compacted """
+        base, journal = self.signature(fp)
+        if journal is None:
+            return False
+        base_size = 0 if base is None else base[0]
+        return journal[0] > max(Mappings.compact_size, base_size // 4)
+
+    def compact(self, fp):
+        """ Write mappings with all changes from the journal to
+        the file and delete the journal. Mappings written since
+        compaction was started are included, also when they
+        were appended by another process. """
+        with self.locked(fp):
+            signature = self.signature(fp)
+            cached = Jdict.cache.get(fp)
+            if cached is None or cached[0] != signature:
+                cached = (signature, self.load(fp))
+            self.replace(fp, cached[1])
+            Jdict.cache[fp] = (self.signature(fp), cached[1])
+
+    def compact_in_background(self, fp):
+        """ Compact the journal in a background thread. The
+        app waits for it to finish before it exits. """
+        import threading
+        Mappings.wait()
+        thread = threading.Thread(target=self.compact, args=(fp,))
+        Mappings.compacting = thread
+        thread.start()
+
+    @classmethod
+    def wait(cls):
+        """ Wait until the journal being compacted is compacted """
+        if cls.compacting is not None:
+            cls.compacting.join()
+            cls.compacting = None
+
+    def index(self):
+        """ Return dictionary of categories to sets of info of
+        their mappings. Index of cached mappings is shared by
+        instances until they change it, like the mappings. """
+        if self.by_category is not None:
+            return self.by_category
+        fp = None
+        if self.filename is not None:
+            fp = os.path.abspath(self.file_pointer())
+        kept = Mappings.indexes.get(fp)
+        if kept is not None and kept[0] is self.dict:
+            self.by_category = kept[1]
+            self.index_shared = True
+            return self.by_category
+
+        self.by_category = {}
+        for info, categories in self.dict.items():
+            if not isinstance(categories, list):
+                categories = [categories]
+            for category in categories:
+                self.by_category.setdefault(category, set()).add(info)
+        self.index_copied = None
+        if self.shared and fp is not None:
+            Mappings.indexes[fp] = (self.dict, self.by_category)
+            self.index_shared = True
+        return self.by_category
+
+    def reindex(self, info, old, new):
+        """ Move info from old to new categories in the index,
+        if it was built. Sets shared with the cache are copied
+        before they are changed. """
+        if self.by_category is None or old == new:
+            return
+        if self.index_shared:
+            self.by_category = dict(self.by_category)
+            self.index_shared = False
+            self.index_copied = set()
+
+        old = [] if old is None else old if isinstance(old, list) else [old]
+        new = [] if new is None else new if isinstance(new, list) else [new]
+        for category in set(old) ^ set(new):
+            infos = self.by_category.get(category, set())
+            if self.index_copied is not None and category not in self.index_copied:
+                infos = set(infos)
+                self.index_copied.add(category)
+            if category in new:
+                infos.add(info)
+            else:
+                infos.discard(info)
+            if infos:
+                self.by_category[category] = infos
+            else:
+                self.by_category.pop(category, None)
+
+    def infos(self, category):
+        """ Return info of mappings to category """
+        return set(self.index().get(category, ()))
+
+    def delete_category(self, category):
+        """ Delete mappings to category. Returns their number. """
+        infos = self.infos(category)
+        for info in infos:
+            self.pop(info)
+        return len(infos)
+
+    def update(self, id, value):
+        """ Update mapping and record the change """
+        old = self.dict.get(id)
+        super().update(id, value)
+        self.record(id, old)
+
+    def pop(self, key, default=None):
+        """ Delete mapping and record the change """
+        old = self.dict.get(key)
+        super().pop(key, default)
+        self.record(key, old)
+
+    def append(self, id, value):
+        old = self.dict.get(id)
+        super().append(id, value)
+        self.record(id, old)
+
+    def extend(self, id, value):
+        old = self.dict.get(id)
+        super().extend(id, value)
+        self.record(id, old)
+
+    def transpose(self):
+        """ Swap key-value pairs. The whole file is
+        written next time, as every mapping changed. """
+        super().transpose()
+        self.changes = None
+        self.by_category = None
+        self.index_shared = False
+
+    def record(self, key, old=None):
+        """ Record the current value of a mapping as a change
+        and move it to its new category in the index """
+        value = self.dict.get(key)
+        if self.changes is not None:
+            self.changes[key] = value
+        self.reindex(key, old, value)
+
+class Session:
+    """ Keep data read from and written to files in memory
+    while the session is open. Later steps of a command, or
+    later commands run in the same process, get dataframes
+    written before without reading the files again. A file
+    is read again if it was changed outside the session.
+    Sessions can be nested, the outermost one keeps the data. """
+
+    def __init__(self):
+        self.owner = False
+
+    def __enter__(self):
+        if File.memory is None:
+            File.memory = {}
+            self.owner = True
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.owner:
+            File.memory = None
+            self.owner = False
+        return False
@@ -0,0 +1,212 @@
+import re
+import math
+import numpy as np
+import pandas as pd
+
+""" A module for matching transaction info against many
+keywords at once. It is used for rule based classification
+of transactions that do not have an exact mapping. """
+
+class Automaton:
+    """ Aho-Corasick automaton. It finds all occurrences of
+    many keywords in a string in a single pass over it,
+    regardless of the number of keywords. """
+
+    def __init__(self, keywords=None):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.keywords = []
+        for keyword in keywords or []:
+            self.add(keyword)
+        self.build()
+
+    def add(self, keyword):
+        """ Add keyword to the trie. Returns keyword ID.
+        build() must be called after keywords are added. """
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        keyword_id = len(self.keywords)
+        self.keywords.append(keyword)
+        self.output[state].append(keyword_id)
+        return keyword_id
+
+    def build(self):
+        """ Set up failure links with breadth first search
+        and merge outputs of states linked by them """
+        queue = list(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = (self.output[next_state] +
+                                           self.output[self.fail[next_state]])
+
+    def find(self, text):
+        """ Yield (start, keyword ID) for every
+        keyword occurrence found in text """
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for keyword_id in self.output[state]:
+                start = position - len(self.keywords[keyword_id]) + 1
+                yield start, keyword_id
+
+class KeywordRules:
+    """ Rules for classifying transactions by keywords in their
+    info. Rules are defined for each category as
+    {category: {"contains": [...], "prefix": [...]}}. Keywords
+    are case insensitive. "contains" keywords can be anywhere in
+    the info and "prefix" keywords must be at the start of it.
+
+    If several rules match, the longest keyword wins. Then prefix
+    rules win over contains rules, then the keyword found first
+    and then the category that comes first alphabetically. """
+
+    kinds = {"prefix": 0, "contains": 1}
+    start_marker = "\x02"
+
+    def __init__(self, rules=None):
+        self.rules = []
+        keywords = []
+        for category, category_rules in sorted((rules or {}).items()):
+            for kind, rank in KeywordRules.kinds.items():
+                for keyword in category_rules.get(kind, []):
+                    if not keyword:
+                        continue
+                    self.rules.append((category, rank, len(keyword)))
+                    keyword = keyword.upper()
+                    if kind == "prefix":
+                        keyword = KeywordRules.start_marker + keyword
+                    keywords.append(keyword)
+        self.automaton = Automaton(keywords)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def lookup(self, text, default=None):
+        """ Return the category of the best rule
+        matching text or default if none match """
+        if not isinstance(text, str):
+            return default
+
+        best = None
+        text = KeywordRules.start_marker + text.upper()
+        for start, rule_id in self.automaton.find(text):
+            category, rank, length = self.rules[rule_id]
+            candidate = (-length, rank, start, category)
+            if best is None or candidate < best:
+                best = candidate
+        return default if best is None else best[3]
+
+    def lookup_all(self, keys, default=None):
+        """ Look up categories for a whole column of keys.
+        Each distinct key is matched once. Returns a pandas
+        Series with the same index as keys. """
+        keys = pd.Series(keys)
+        codes, uniques = pd.factorize(keys)
+        values = [self.lookup(key, default) for key in uniques]
+        # Missing keys have code -1, which picks default at the end
+        values = np.array(values + [default], dtype=object)
+        return pd.Series(values[codes], index=keys.index)
+
+class TokenIndex:
+    """ Inverted index from info tokens to the categories of
+    classified transactions containing them. It is used to
+    suggest categories for unclassified transactions. A lookup
+    only visits postings of tokens found in the query, so it
+    does not depend on the number of classified transactions.
+
+    Tokens are words and character trigrams of words, so
+    similar descriptions with different reference numbers or
+    terminal suffixes share most of their tokens. """
+
+    word_pattern = re.compile("[A-Z][A-Z0-9&']*")
+    ngram = 3
+
+    def __init__(self):
+        self.postings = {}
+        self.documents = 0
+
+    @classmethod
+    def tokens(cls, text):
+        """ Return a set of tokens in text """
+        if not isinstance(text, str):
+            return set()
+        tokens = set()
+        for word in cls.word_pattern.findall(text.upper()):
+            tokens.add(word)
+            for i in range(len(word) - cls.ngram + 1):
+                tokens.add("#" + word[i:i + cls.ngram])
+        return tokens
+
+    def add(self, text, category):
+        """ Add classified info to the index """
+        self.documents += 1
+        for token in self.tokens(text):
+            categories = self.postings.setdefault(token, {})
+            categories[category] = categories.get(category, 0) + 1
+
+    def add_all(self, texts, categories):
+        """ Add a column of classified info with their categories.
+        Each distinct (info, category) pair is added once. """
+        pairs = pd.DataFrame({"Info": list(texts), "Type": list(categories)})
+        pairs = pairs.dropna().drop_duplicates()
+        for text, category in zip(pairs.Info, pairs.Type):
+            self.add(text, category)
+
+    def weight(self, token):
+        """ Return inverse document frequency of a token """
+        frequency = sum(self.postings.get(token, {}).values())
+        return math.log((self.documents + 1) / (frequency + 1)) + 1
+
+    def suggest(self, text, k=3):
+        """ Return up to k (category, confidence) pairs for text, with
+        the most likely category first. Confidence is the weighted
+        share of tokens in text that point to the category. """
+        scores = {}
+        total = 0
+        # Sorted, so that scores are the same in every process
+        for token in sorted(self.tokens(text)):
+            weight = self.weight(token)
+            total += weight
+            categories = self.postings.get(token, {})
+            frequency = sum(categories.values())
+            for category, count in categories.items():
+                score = scores.get(category, 0)
+                scores[category] = score + weight*count/frequency
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(category, score/total) for category, score in ranked[:k]]
+
+    def suggest_all(self, texts, k=3):
+        """ Return a dataframe with suggestions for a column of
+        info. It has "Suggestion" and "Confidence" columns for the
+        best category and "Alternatives" column for the rest. Each
+        distinct info is looked up once. """
+        texts = pd.Series(texts)
+        suggestions = {text: self.suggest(text, k) for text in texts.unique()}
+        rows = []
+        for text in texts:
+            ranked = suggestions[text]
+            best, confidence = ranked[0] if ranked else (None, None)
+            alternatives = ", ".join("{} ({:.0%})".format(category, score)
+                                     for category, score in ranked[1:])
+            rows.append((best, confidence, alternatives))
+        columns = ["Suggestion", "Confidence", "Alternatives"]
+        return pd.DataFrame(rows, columns=columns, index=texts.index)
@@ -6,6 +6,11 @@ from unit_tests.mocks import (
     MockUser
 )
 
+@pytest.fixture(autouse=True)
+def cache_folder(monkeypatch, tmpdir):
+    """ Keep binary caches of .xlsx files in the test directory """
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir.join("cache")))
+
 @pytest.fixture
 def mock_user(monkeypatch, tmpdir):
     monkeypatch.chdir(tmpdir)
@@ -0,0 +1,49 @@
+import pytest
+import pandas as pd
+
+import data.classified
+from system.file_management import Excel, Jdict
+
+
+@pytest.fixture
+def classified(mock_file):
+    Jdict("u_categories", dict={"CATEGORIES": ["Groceries", "Transport"],
+                                "BLACKLIST": ["BLACKLIST"]}).write()
+    df = pd.DataFrame({"ID": [0, 1, 2, 3, 4],
+                       "Date": pd.to_datetime(["2019-01-05", "2019-01-20",
+                                               "2019-02-03", "2019-02-10",
+                                               "2019-03-01"]),
+                       "Amount": [100, 200, 300, 400, 500],
+                       "Info": ["Shop|", "Bus|", "Shop|", "Tax|", "Bus|"],
+                       "Type": ["Groceries", "Transport", "Groceries",
+                                "BLACKLIST", None]})
+    Excel(filename="classified", df=df.set_index("ID")).write()
+    yield
+
+
+class TestClassified:
+
+    @staticmethod
+    @pytest.mark.parametrize("start,end,ids", [
+        (None, None, [0, 1, 2, 3]),
+        ("2019-01-20", None, [1, 2, 3]),
+        (None, "2019-02-03", [0, 1, 2]),
+        ("2019-01-06", "2019-02-09", [1, 2])])
+    def test_fx_get_classified(classified, start, end, ids):
+        selection = data.classified.get_classified(start, end)
+        assert selection.index().tolist() == ids
+
+    @staticmethod
+    def test_fx_get_totals(classified):
+        totals = data.classified.get_totals("Month")
+        assert totals.loc["Groceries"].tolist() == [1, 3]
+        assert totals.loc["Transport"].tolist() == [2, 0]
+        assert "BLACKLIST" not in totals.index
+
+        selection = data.classified.get_classified("2019-01-10", None)
+        data.classified.remove_blacklist(selection)
+        totals = data.classified.get_totals("Month", selection)
+        assert totals.loc["Groceries"].tolist() == [0, 3]
+        assert totals.loc["Transport"].tolist() == [2, 0]
+        assert totals.columns.tolist() == list(pd.to_datetime(
+            ["2019-01-01", "2019-02-01"]))
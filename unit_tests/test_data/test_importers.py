@@ -0,0 +1,89 @@
+import os
+import pytest
+import pandas as pd
+
+from data import importers
+from data.raw import RAW_COLUMNS
+from data.sources import read_statement
+from system.file_management import Jdict
+
+FILES = os.path.join(os.path.dirname(__file__), "files")
+BANK_PROFILE = {"columns": {"Description": "Payee", "Extra": None,
+                            "Amount": "Paid out"},
+                "credit": "Paid in",
+                "date_format": "%Y-%m-%d",
+                "delimiter": ";",
+                "decimal": ",",
+                "thousands": ".",
+                "skiprows": 1}
+
+
+def statement(extra=("", "", "")):
+    """ Return transactions in the fixture files as in raw.xlsx,
+    with spending positive """
+    return pd.DataFrame({"Date": ["02/01/2019", "05/01/2019", "07/01/2019"],
+                         "Description": ["Tesco", "Salary", "Shell"],
+                         "Extra": list(extra),
+                         "Amount": [12.5, -1000, 40]})
+
+
+def fixture(filename):
+    return os.path.join(FILES, filename)
+
+
+@pytest.fixture
+def bank_profile(mock_file):
+    Jdict("u_banks", dict={"bank": BANK_PROFILE}).write()
+    yield "bank"
+
+
+class TestImporters:
+
+    @staticmethod
+    @pytest.mark.parametrize("filename,profile,extra", [
+        ("statement.csv", None, ("Store 1", None, "Fuel")),
+        ("bank.csv", "bank", ("", "", "")),
+        ("statement.ofx", None, ("", "", "")),
+        ("statement.qif", None, ("", "", ""))])
+    def test_fx_read(bank_profile, filename, profile, extra):
+        df = importers.read(fixture(filename), profile)
+        expected = statement(extra)
+        expected["Date"] = pd.to_datetime(expected.Date, format="%d/%m/%Y")
+        assert df.columns.tolist() == RAW_COLUMNS
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+    @staticmethod
+    @pytest.mark.parametrize("filename,profile,extra", [
+        ("statement.csv", None, ("Store 1", "", "Fuel")),
+        ("bank.csv", "bank", ("", "", "")),
+        ("statement.ofx", None, ("", "", "")),
+        ("statement.qif", None, ("", "", ""))])
+    def test_fx_read_as_raw_xlsx(bank_profile, tmpdir, filename, profile, extra):
+        fp = str(tmpdir.join("statement.xlsx"))
+        statement(extra).to_excel(fp, index=False)
+        expected = read_statement(fp)[1]
+        df = read_statement(fixture(filename), profile)[1]
+        pd.testing.assert_frame_equal(df, expected)
+
+    @staticmethod
+    def test_fx_get_profile(bank_profile):
+        profile = importers.get_profile(".csv", "bank")
+        assert profile["columns"] == {"Date": "Date", "Description": "Payee",
+                                      "Extra": None, "Amount": "Paid out"}
+        assert profile["encoding"] == "utf-8"
+        # Defaults are not changed by profiles
+        default = importers.get_profile(".csv")
+        assert default["columns"]["Description"] == "Description"
+        assert default["credit"] is None
+
+    @staticmethod
+    def test_fx_get_profile_unknown(bank_profile):
+        with pytest.raises(ValueError, match="other not found"):
+            importers.get_profile(".csv", "other")
+        with pytest.raises(ValueError, match="other not found"):
+            read_statement(fixture("statement.csv"), "other")
+
+    @staticmethod
+    def test_fx_read_unknown_extension(tmpdir):
+        with pytest.raises(ValueError, match="Cannot import .txt files"):
+            importers.read(str(tmpdir.join("statement.txt")))
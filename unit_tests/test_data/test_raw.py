@@ -0,0 +1,223 @@
+import os
+import pytest
+import numpy as np
+import pandas as pd
+
+import data.raw
+from system.file_management import Excel, Jdict, Statements, Aggregates
+
+OUTPUTS = ["classified", "unclassified", "Excluded returns"]
+
+
+def raw_rows(rows=80, seed=0):
+    """ Return raw.xlsx rows with groups of expenses and returns
+    sharing the same info and amount """
+    random = np.random.RandomState(seed)
+    days = random.randint(1, 29, rows)
+    months = random.randint(1, 4, rows)
+    amounts = random.choice([5, 12.5, 20], rows)
+    signs = random.choice([1, 1, -1], rows)
+    return pd.DataFrame({"Date": ["{:02d}/{:02d}/2019".format(d, m)
+                                  for d, m in zip(days, months)],
+                         "Description": random.choice(["Cafe", "Shop", "Bus"], rows),
+                         "Extra": "",
+                         "Amount": amounts * signs})
+
+
+def write_raw(df):
+    df.to_excel(Excel(filename="raw").file_pointer(), index=False)
+
+
+def read_outputs():
+    """ Return output files as read by pandas, None if missing """
+    outputs = {}
+    for filename in OUTPUTS:
+        fp = Excel(filename=filename).file_pointer()
+        outputs[filename] = pd.read_excel(fp) if os.path.exists(fp) else None
+    return outputs
+
+
+def full_rebuild():
+    """ Import raw.xlsx again without the ledger """
+    os.remove(Jdict("ledger", "D", system_file=False).file_pointer())
+    data.raw.migrate()
+    return read_outputs()
+
+
+def assert_same_outputs(incremental, full):
+    for filename in OUTPUTS:
+        if full[filename] is None:
+            assert incremental[filename] is None, filename
+        else:
+            pd.testing.assert_frame_equal(incremental[filename], full[filename])
+
+
+@pytest.fixture(params=[0, 3])
+def imported(mock_file, capsys, request):
+    Jdict("u_cmappings", dict={"Bus|": "Transport"}).write()
+    raw = raw_rows(seed=request.param)
+    write_raw(raw)
+    data.raw.migrate()
+    capsys.readouterr()
+    yield raw
+
+
+def kept_ids(raw):
+    """ Return IDs of rows which were not excluded as expense-return
+    pairs. Changing or removing excluded rows imports all rows. """
+    excluded = Jdict("ledger", "D", system_file=False).lookup("EXCLUDED")
+    return [id for id in raw.index if id not in excluded]
+
+
+def changed_rows(raw):
+    """ Change two rows in groups with returns """
+    ids = [id for id in kept_ids(raw) if raw.Description[id] == "Cafe"]
+    raw = raw.copy()
+    raw.loc[ids[0], "Amount"] = -raw.loc[ids[0], "Amount"]
+    raw.loc[ids[1], "Description"] = "Shop"
+    return raw
+
+
+def removed_rows(raw):
+    """ Remove the last three rows """
+    return raw.drop(kept_ids(raw)[-3:])
+
+
+@pytest.mark.parametrize("change", [
+    lambda raw: pd.concat([raw, raw_rows(rows=8, seed=1)], ignore_index=True),
+    changed_rows,
+    removed_rows,
+    lambda raw: removed_rows(changed_rows(raw))],
+    ids=["appended", "changed", "removed", "changed and removed"])
+def test_incremental_equals_full_rebuild(imported, capsys, change):
+    write_raw(change(imported))
+    data.raw.migrate()
+    assert " >> New:" in capsys.readouterr().out
+    incremental = read_outputs()
+    # Cells of the aggregate cube are updated where rows changed
+    cube = Aggregates().read_table()
+    classified = Statements("classified", read_file=True)
+    pd.testing.assert_frame_equal(cube, Aggregates.build(classified.df))
+    assert_same_outputs(incremental, full_rebuild())
+
+
+def test_incremental_keeps_types_entered_by_hand(mock_file, capsys):
+    raw = pd.DataFrame({"Date": ["01/01/2019", "03/01/2019", "04/01/2019"],
+                        "Description": ["Cafe", "Cafe", "Cafe"],
+                        "Extra": "", "Amount": [5, 5, -5]})
+    write_raw(raw)
+    data.raw.migrate()
+    fp = Excel(filename="unclassified").file_pointer()
+    unclassified = pd.read_excel(fp)
+    assert unclassified.ID.tolist() == [0]
+    unclassified["Type"] = "Food"
+    unclassified.to_excel(fp, index=False)
+
+    # A return without earlier expense is not matched, but the
+    # group of unclassified expense 0 is matched again
+    new_row = pd.DataFrame({"Date": ["31/12/2018"], "Description": ["Cafe"],
+                            "Extra": "", "Amount": [-5]})
+    write_raw(pd.concat([raw, new_row], ignore_index=True))
+    data.raw.migrate()
+    unclassified = pd.read_excel(fp)
+    assert unclassified.ID.tolist() == [0]
+    assert unclassified.Type.tolist() == ["Food"]
+    excluded = pd.read_excel(Excel(filename="Excluded returns").file_pointer())
+    assert excluded.ID.tolist() == [2, 3]
+
+
+def match_returns_loop(df):
+    """ Match returns one by one as remove_returns did before
+    match_returns, as the reference for the grouped matching """
+    data = df.copy()
+    buys, listed = [], []
+    for return_id, line in df[df.Amount < 0].iterrows():
+        expenses = data[(data.Amount == -line.Amount) & (data.Info == line.Info)]
+        listed.append(not expenses.empty)
+        delta = line.Date - expenses.Date
+        past = delta.dt.days >= 0
+        if not past.any():
+            buys.append(np.nan)
+            continue
+        buy_id = delta[past].idxmin()
+        data = data.drop([buy_id, return_id])
+        buys.append(buy_id)
+    index = df.index[df.Amount < 0]
+    return pd.DataFrame({"Buy": buys, "Listed": listed}, index=index)
+
+
+def transactions(dates, amounts, infos=None):
+    infos = infos or ["Cafe|"] * len(dates)
+    return pd.DataFrame({"Date": pd.to_datetime(dates, dayfirst=True),
+                         "Amount": amounts, "Info": infos})
+
+
+def random_transactions(seed):
+    random = np.random.RandomState(seed)
+    rows = 60
+    dates = pd.Series(pd.to_datetime("2019-01-01")
+                      + pd.to_timedelta(random.randint(0, 10, rows), unit="D"))
+    dates[random.rand(rows) < 0.1] = pd.NaT
+    amounts = random.choice([5, 20], rows) * random.choice([1, 1, -1], rows)
+    infos = random.choice(["Cafe|", "Shop|"], rows)
+    return pd.DataFrame({"Date": dates, "Amount": amounts, "Info": infos})
+
+
+@pytest.mark.parametrize("df", [
+    # Expenses on the same day go to the first one
+    transactions(["01/01/2019", "02/01/2019", "02/01/2019", "05/01/2019"],
+                 [5, 5, 5, -5]),
+    # Missing dates never match
+    transactions([None, "02/01/2019", None, "03/01/2019"], [5, 5, -5, -5]),
+    transactions([None, "03/01/2019"], [5, -5]),
+    # Both returns claim the expense of 03/01
+    transactions(["01/01/2019", "03/01/2019", "05/01/2019", "04/01/2019"],
+                 [5, 5, -5, -5]),
+    transactions(["01/01/2019", "03/01/2019", "05/01/2019", "04/01/2019",
+                  "02/01/2019", "06/01/2019"],
+                 [5, 5, -5, -5, 5, -5]),
+    # Returns are listed while unmatched expenses are left
+    transactions(["05/01/2019", "01/01/2019", "06/01/2019", "07/01/2019"],
+                 [5, -5, -5, -5]),
+    transactions(["01/01/2019", "02/01/2019", "03/01/2019"], [5, -5, -20],
+                 ["Cafe|", "Cafe|", "Shop|"]),
+    transactions(["01/01/2019", "02/01/2019", "03/01/2019", "04/01/2019"],
+                 [5, -5, -5, 5]),
+    random_transactions(0),
+    random_transactions(1),
+    random_transactions(2)],
+    ids=["ties", "NaT", "NaT return", "conflict", "conflict and others",
+         "listed", "not listed", "listed before expense",
+         "random 0", "random 1", "random 2"])
+def test_match_returns_as_loop(df):
+    df = df.rename_axis("ID")
+    matches = data.raw.match_returns(df)
+    expected = match_returns_loop(df)
+    pd.testing.assert_series_equal(matches.Buy.astype(float),
+                                   expected.Buy.astype(float),
+                                   check_names=False)
+    assert matches.Listed.tolist() == expected.Listed.tolist()
+    assert matches.index.tolist() == expected.index.tolist()
+
+
+def test_changed_rules_classify_all_rows(imported, capsys):
+    Jdict("u_crules", dict={"Food": {"contains": ["cafe"]}}).write()
+    data.raw.migrate()
+    assert "all rows are classified again" in capsys.readouterr().out
+    classified = read_outputs()["classified"]
+    cafe = classified.Info == "Cafe|"
+    assert (classified.Type[cafe] == "Food").all()
+    assert_same_outputs(read_outputs(), full_rebuild())
+
+
+def test_classify_keeps_incremental_import(imported, capsys):
+    import data.unclassified
+    fp = Excel(filename="unclassified").file_pointer()
+    unclassified = pd.read_excel(fp)
+    unclassified.loc[unclassified.Info == "Shop|", "Type"] = "Groceries"
+    unclassified.to_excel(fp, index=False)
+    data.unclassified.process()
+    write_raw(pd.concat([imported, raw_rows(rows=8, seed=1)], ignore_index=True))
+    data.raw.migrate()
+    assert " >> New: 8" in capsys.readouterr().out
+    assert_same_outputs(read_outputs(), full_rebuild())
@@ -0,0 +1,89 @@
+import os
+import shutil
+import pytest
+import pandas as pd
+
+from data import sources
+
+FILES = os.path.join(os.path.dirname(__file__), "files")
+
+
+@pytest.fixture
+def statements(mock_file, tmpdir):
+    """ Directory with statements in each format and files
+    which are not statements """
+    directory = tmpdir.mkdir("statements")
+    for filename in ["statement.csv", "statement.ofx", "statement.qif"]:
+        shutil.copy(os.path.join(FILES, filename), str(directory))
+    pd.DataFrame({"Date": ["09/01/2019"], "Description": ["Zara"],
+                  "Extra": [""], "Amount": [30]}).to_excel(
+        str(directory.join("statement.xlsx")), index=False)
+    directory.join("notes.txt").write("Not a statement")
+    directory.join("~$statement.xlsx").write("")
+    directory.join(".hidden.csv").write("")
+    directory.mkdir("old.csv")
+    yield directory
+
+
+def paths(directory, *filenames):
+    return [str(directory.join(filename)) for filename in filenames]
+
+
+def break_file(directory):
+    """ Add a CSV file without Amount column """
+    directory.join("broken.csv").write("Date,Description\n01/01/2019,Tesco\n")
+
+
+class TestSources:
+
+    @staticmethod
+    def test_fx_find_files(statements):
+        expected = paths(statements, "statement.csv", "statement.ofx",
+                         "statement.qif", "statement.xlsx")
+        assert sources.find_files([str(statements)]) == expected
+        # Files found twice are read once
+        pattern = str(statements.join("*.csv"))
+        assert sources.find_files([pattern, str(statements)]) == expected
+        assert sources.find_files([pattern]) == expected[:1]
+        assert sources.find_files(expected[-1:]) == expected[-1:]
+        assert sources.find_files([str(statements.join("notes.txt"))]) == []
+
+    @staticmethod
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_fx_read_files(statements, workers):
+        files = sources.find_files([str(statements)])
+        results = list(sources.read_files(files, workers))
+        assert [fp for fp, df, elapsed in results] == files
+        rows = [len(df.index) for fp, df, elapsed in results]
+        assert rows == [3, 3, 3, 1]
+        for fp, df, elapsed in results:
+            assert df.index.name == "ID"
+            assert {"Date", "Amount", "Info"} <= set(df.columns)
+            assert str(df.Date.dtype).startswith("datetime64")
+        assert results[-1][1].Info.tolist() == ["Zara|"]
+
+    @staticmethod
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_fx_read_files_unreadable(statements, workers):
+        break_file(statements)
+        files = sources.find_files([str(statements)])
+        with pytest.raises(ValueError, match="^broken.csv: "):
+            list(sources.read_files(files, workers))
+
+    @staticmethod
+    def test_fx_read_statement(statements):
+        fp = str(statements.join("statement.qif"))
+        result = sources.read_statement(fp)
+        assert result[0] == fp
+        # Amounts are kept in cents
+        assert result[1].Amount.tolist() == [1250, -100000, 4000]
+        assert result[1].Info.tolist() == ["Tesco|", "Salary|", "Shell|"]
+
+    @staticmethod
+    def test_fx_read_statement_no_cache(statements, tmpdir):
+        fp = str(statements.join("statement.xlsx"))
+        result = sources.read_statement(fp)
+        assert result[1].Info.tolist() == ["Zara|"]
+        # Statements are not cached, unlike files of the app
+        assert not tmpdir.join("cache").check()
+        assert not any(f.endswith(".cache") for f in os.listdir(str(statements)))
@@ -5,7 +5,11 @@ import datetime
 
 from unittest.mock import Mock, patch
 
-from system.file_management import Path, File, Jdict
+from system.file_management import Path, File, Jdict, Excel, XlsxStream
+from system.file_management import Mappings
+from system.file_management import XlsxWriter
+from system.file_management import Statements, Database, Session, Writers
+from system.file_management import Aggregates
 from unit_tests.sample import SampleFile, SamplePath
 
 
@@ -104,7 +108,7 @@ class TestFile:
         assert file_object.get_type_name() == type_name
 
     @staticmethod
-    @patch("system.file_management.Path")
+    @patch("system.files.Path")
     @pytest.mark.parametrize("filename", SampleFile.FILENAMES + [None])
     @pytest.mark.parametrize("type_code,type_name", SampleFile.type_dict())
     def test_fx_init_file(path_mock, monkeypatch, mock_file,
@@ -263,3 +267,712 @@ class TestFile:
         filename = None if file is None else os.path.splitext(file)[0]
         run_test(filename, extension)
 
+
+class TestJdict:
+
+    @staticmethod
+    @pytest.mark.parametrize("default", ["", None])
+    def test_fx_lookup_all(mock_file, default):
+        import pandas as pd
+        mappings = Jdict(dict={"Shop|": "Groceries", "Bus|": "Transport"})
+        keys = pd.Series(["Bus|", "Shop|", "Cafe|", "Bus|"], index=[4, 3, 2, 1])
+        values = mappings.lookup_all(keys, default=default)
+        expected = [mappings.lookup(key, default=default) for key in keys]
+        assert values.tolist() == expected
+        assert values.index.equals(keys.index)
+
+    @staticmethod
+    def test_fx_lookup_all_blank(mock_file):
+        values = Jdict(dict={}).lookup_all(["a", "b"], default="")
+        assert values.tolist() == ["", ""]
+
+    @staticmethod
+    def write_config(contents, filename="u_test"):
+        config = Jdict(filename)
+        for key, value in contents.items():
+            config.update(key, value)
+        config.write()
+        return config.file_pointer()
+
+    @staticmethod
+    def test_fx_read_cache(mock_file):
+        TestJdict.write_config({"A": [1, 2]})
+        hits = Jdict.cache_stats["hits"]
+        first = Jdict("u_test")
+        second = Jdict("u_test")
+        assert first.dict is second.dict
+        assert Jdict.cache_stats["hits"] == hits + 2
+
+    @staticmethod
+    def test_fx_read_cache_file_changed(mock_file):
+        fp = TestJdict.write_config({"A": 1})
+        Jdict("u_test")
+        with open(fp, "w") as file:
+            file.write('{"A": 22}')
+        assert Jdict("u_test").lookup("A") == 22
+
+    @staticmethod
+    def test_fx_copy_on_write(mock_file):
+        TestJdict.write_config({"A": [1, 2], "B": 1})
+        changed = Jdict("u_test")
+        changed.append("A", 3)
+        changed.extend("A", [4])
+        changed.update("C", 1)
+        changed.pop("B")
+        unchanged = Jdict("u_test")
+        assert unchanged.dict == {"A": [1, 2], "B": 1}
+        assert changed.dict == {"A": [1, 2, 3, 4], "C": 1}
+
+        changed.write()
+        assert Jdict("u_test").dict == changed.dict
+
+
+class TestMappings:
+
+    @staticmethod
+    def write_mappings(contents):
+        Mappings("u_test", dict=contents).write()
+        fp = Mappings("u_test").file_pointer()
+        return fp, Mappings.journal_pointer(fp)
+
+    @staticmethod
+    def test_fx_journal(mock_file):
+        fp, jp = TestMappings.write_mappings({"Shop|": "Groceries", "Bus|": "Transport"})
+        assert not os.path.isfile(jp)
+        with open(fp) as file:
+            contents = file.read()
+
+        mappings = Mappings("u_test")
+        mappings.update("Cafe|", "Food")
+        mappings.pop("Bus|")
+        mappings.write()
+        with open(fp) as file:
+            assert file.read() == contents
+        with open(jp) as file:
+            assert file.read() == '{"Cafe|": "Food", "Bus|": null}\n'
+
+        expected = {"Shop|": "Groceries", "Cafe|": "Food"}
+        assert Mappings("u_test").dict == expected
+        Jdict.cache.clear()
+        replayed = Mappings("u_test")
+        assert replayed.dict == expected
+        assert replayed.lookup("Bus|", default="") == ""
+
+    @staticmethod
+    def test_fx_journal_written_by_others(mock_file):
+        TestMappings.write_mappings({"Shop|": "Groceries"})
+        mappings = Mappings("u_test")
+        other = Mappings("u_test")
+        assert other.infos("Groceries") == {"Shop|"}
+        mappings.update("Cafe|", "Food")
+        mappings.write()
+        other.update("Bus|", "Transport")
+        other.write()
+
+        expected = {"Shop|": "Groceries", "Cafe|": "Food", "Bus|": "Transport"}
+        assert other.dict == expected
+        assert other.infos("Food") == {"Cafe|"}
+        assert Mappings("u_test").dict == expected
+        Jdict.cache.clear()
+        assert Mappings("u_test").dict == expected
+
+    @staticmethod
+    def test_fx_journal_line_cut_short(mock_file):
+        fp, jp = TestMappings.write_mappings({"Shop|": "Groceries"})
+        with open(jp, "w") as file:
+            file.write('{"Cafe|": "Food"}\n{"Bus|": "Tra')
+        assert Mappings("u_test").dict == {"Shop|": "Groceries", "Cafe|": "Food"}
+
+    @staticmethod
+    def test_fx_compaction(mock_file, monkeypatch):
+        import json
+        monkeypatch.setattr(Mappings, "compact_size", 0)
+        fp, jp = TestMappings.write_mappings({"Shop|": "Groceries"})
+        mappings = Mappings("u_test")
+        mappings.update("Cafe|", "Food")
+        mappings.write()
+        Mappings.wait()
+        assert not os.path.isfile(jp)
+        with open(fp) as file:
+            assert json.load(file) == {"Shop|": "Groceries", "Cafe|": "Food"}
+        reads = Jdict.cache_stats["reads"]
+        assert Mappings("u_test").dict == mappings.dict
+        assert Jdict.cache_stats["reads"] == reads
+
+    @staticmethod
+    def test_fx_compaction_locks_other_processes(mock_file, monkeypatch):
+        import sys
+        import subprocess
+        pytest.importorskip("fcntl")
+        fp, jp = TestMappings.write_mappings({"Shop|": "Groceries"})
+        mappings = Mappings("u_test")
+        mappings.update("Cafe|", "Food")
+        mappings.write()
+
+        # Another process writes a mapping while the journal is compacted
+        root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        code = ("import sys\nsys.path.insert(0, {!r})\n"
+                "from system.files import Mappings\n"
+                "mappings = Mappings('u_test')\n"
+                "mappings.update('Bus|', 'Transport')\n"
+                "mappings.write()").format(root)
+        processes = []
+        load = Mappings.load
+
+        def load_while_writing(self, fp):
+            process = subprocess.Popen([sys.executable, "-c", code])
+            processes.append(process)
+            with pytest.raises(subprocess.TimeoutExpired):
+                process.wait(1)
+            return load(self, fp)
+
+        Jdict.cache.clear()
+        monkeypatch.setattr(Mappings, "load", load_while_writing)
+        mappings.compact(os.path.abspath(fp))
+        monkeypatch.setattr(Mappings, "load", load)
+        assert processes[0].wait(10) == 0
+        Jdict.cache.clear()
+        assert Mappings("u_test").dict == {"Shop|": "Groceries", "Cafe|": "Food",
+                                           "Bus|": "Transport"}
+
+    @staticmethod
+    def test_fx_transpose_rewrites_file(mock_file):
+        import json
+        fp, jp = TestMappings.write_mappings({"Shop|": "Groceries"})
+        mappings = Mappings("u_test")
+        mappings.transpose()
+        mappings.write()
+        assert not os.path.isfile(jp)
+        with open(fp) as file:
+            assert json.load(file) == {"Groceries": "Shop|"}
+
+    @staticmethod
+    def test_fx_index_shared(mock_file):
+        TestMappings.write_mappings({"Shop|": "Groceries", "Cafe|": "Groceries",
+                                     "Bus|": "Transport"})
+        mappings = Mappings("u_test")
+        assert mappings.infos("Groceries") == {"Shop|", "Cafe|"}
+        index = mappings.index()
+
+        other = Mappings("u_test")
+        assert other.index() is index
+        other.update("Bus|", "Groceries")
+        assert other.infos("Groceries") == {"Shop|", "Cafe|", "Bus|"}
+        assert other.infos("Transport") == set()
+        assert mappings.infos("Groceries") == {"Shop|", "Cafe|"}
+        assert mappings.infos("Transport") == {"Bus|"}
+
+    @staticmethod
+    def test_fx_delete_category(mock_file):
+        TestMappings.write_mappings({"Shop|": "Groceries", "Cafe|": "Groceries",
+                                     "Bus|": "Transport"})
+        mappings = Mappings("u_test")
+        assert mappings.delete_category("Groceries") == 2
+        assert mappings.delete_category("Food") == 0
+        mappings.write()
+        assert Mappings("u_test").dict == {"Bus|": "Transport"}
+        assert Mappings("u_test").infos("Groceries") == set()
+        Jdict.cache.clear()
+        assert Mappings("u_test").infos("Transport") == {"Bus|"}
+
+
+class TestExcel:
+
+    @staticmethod
+    def write_sample(filename="sample"):
+        import pandas as pd
+        df = pd.DataFrame({"Date": ["01/01/2019"], "Amount": [1.5]})
+        excel_object = Excel(filename=filename, df=df)
+        excel_object.write()
+        return excel_object.file_pointer()
+
+    @staticmethod
+    def test_fx_read_writes_cache(mock_file):
+        fp = TestExcel.write_sample()
+        excel_object = Excel(filename="sample", read_file=True)
+        assert os.path.isfile(Excel.cache_pointer(fp))
+        assert excel_object.read_cache(fp).equals(excel_object.df)
+
+    @staticmethod
+    def test_fx_read_cache_stale(mock_file):
+        fp = TestExcel.write_sample()
+        Excel(filename="sample", read_file=True)
+        os.remove(Excel.cache_pointer(fp))
+        TestExcel.write_sample()
+        assert os.path.isfile(Excel.cache_pointer(fp))
+
+        Excel(filename="sample", read_file=True)
+        with open(fp, "ab") as file:
+            file.write(b"edited")
+        assert Excel(filename="sample").read_cache(fp) is None
+
+    @staticmethod
+    def test_fx_write_cache(mock_file):
+        import pandas as pd
+        fp = TestExcel.write_sample()
+        expected = pd.read_excel(fp)
+        cached = Excel(filename="sample").read_cache(fp)
+        pd.testing.assert_frame_equal(cached, expected)
+
+    @staticmethod
+    def test_fx_read_cache_same_contents(mock_file):
+        fp = TestExcel.write_sample()
+        Excel(filename="sample", read_file=True)
+        size, mtime = File.file_signature(fp)
+        os.utime(fp, ns=(mtime + 10**9, mtime + 10**9))
+        assert Excel(filename="sample").read_cache(fp) is not None
+
+    @staticmethod
+    def test_fx_cache_folder(mock_file, tmpdir):
+        fp = TestExcel.write_sample()
+        cache_fp = Excel.cache_pointer(fp)
+        assert os.path.dirname(cache_fp) == str(tmpdir.join("cache", "bank-statements"))
+        assert not any(name.endswith(".cache") for name in os.listdir(os.path.dirname(fp)))
+        assert os.stat(os.path.dirname(cache_fp)).st_mode & 0o077 == 0
+
+        # Caches in folders other users can change are not used
+        os.chmod(os.path.dirname(cache_fp), 0o777)
+        with pytest.raises(PermissionError):
+            Excel.cache_pointer(fp)
+        assert Excel(filename="sample").read_cache(fp) is None
+        assert not Excel(filename="sample", read_file=True).df.empty
+
+    @staticmethod
+    @pytest.mark.parametrize("contents", [
+        b"garbage",
+        # Not a dictionary
+        b"\x80\x04K\x01.",
+        # Loading raises ValueError, as caches of other pandas versions can
+        b"\x80\x02cbuiltins\nint\nX\x01\x00\x00\x00aK\x05\x86R."])
+    def test_fx_read_cache_broken(mock_file, contents):
+        fp = TestExcel.write_sample()
+        with open(Excel.cache_pointer(fp), "wb") as file:
+            file.write(contents)
+        assert Excel(filename="sample").read_cache(fp) is None
+        assert len(Excel(filename="sample", read_file=True).df.index) == 1
+
+    @staticmethod
+    def test_fx_read_cache_missing_file(mock_file):
+        fp = os.path.join(mock_file.common(), "Data", "missing.xlsx")
+        with pytest.raises(FileNotFoundError):
+            Excel(filename="missing").read_cache(fp)
+
+    @staticmethod
+    def test_fx_read_memory(mock_file, monkeypatch):
+        monkeypatch.setattr(File, "memory", {})
+        fp = TestExcel.write_sample()
+        excel_object = Excel(filename="sample", read_file=True)
+        amount = excel_object.df.Amount[0]
+        excel_object.df.loc[0, "Amount"] = 99
+        assert Excel(filename="sample", read_file=True).df.Amount[0] == amount
+
+        with open(fp, "ab") as file:
+            file.write(b"edited")
+        assert Excel(filename="sample").read_memory(fp) is None
+
+    @staticmethod
+    def test_fx_read_memory_not_used(mock_file):
+        fp = TestExcel.write_sample()
+        Excel(filename="sample", read_file=True)
+        assert File.memory is None
+        assert Excel(filename="sample").read_memory(fp) is None
+
+    @staticmethod
+    def test_fx_write_memory(mock_file, monkeypatch):
+        import pandas as pd
+        import system.file_management as file_management
+        with Session():
+            fp = TestExcel.write_sample()
+            monkeypatch.setattr(file_management.pd, "read_excel", None)
+            excel_object = Excel(filename="sample", read_file=True)
+        monkeypatch.undo()
+        assert File.memory is None
+        expected = pd.read_excel(fp)
+        pd.testing.assert_frame_equal(excel_object.df, expected)
+
+    @staticmethod
+    def test_fx_as_read(mock_file):
+        import pandas as pd
+        df = pd.DataFrame({"Info": ["A", "", None], "Type": ["", "", ""],
+                           "Amount": [1, 2, 3]}, index=[5, 7, 9])
+        df = Excel.as_read(df)
+        assert df.index.tolist() == [0, 1, 2]
+        assert df.Info.isna().tolist() == [False, True, True]
+        assert df.Type.dtype == "float64"
+        assert df.Amount.dtype == "int64"
+
+    @staticmethod
+    def test_fx_compact(mock_file):
+        import pandas as pd
+        df = pd.DataFrame({"Amount": [1.1, -20.05, 0.29],
+                           "Type": ["A", None, "A"],
+                           "Week": [1, 52, 3]})
+        excel_object = Excel(df=df)
+        excel_object.compact()
+        assert excel_object.df.Amount.tolist() == [110, -2005, 29]
+        assert excel_object.df.Amount.dtype == "int64"
+        assert excel_object.df.Type.dtype.name == "category"
+        assert excel_object.df.Week.dtype == "int8"
+
+        expanded = Excel.expand(excel_object.df)
+        assert expanded.Amount.tolist() == [1.1, -20.05, 0.29]
+        assert expanded.Type.dtype == object
+        assert excel_object.df.Amount.dtype == "int64"
+
+    @staticmethod
+    def test_fx_compact_blank_amounts(mock_file):
+        import pandas as pd
+        excel_object = Excel(df=pd.DataFrame({"Amount": [1.5, None]}))
+        excel_object.compact()
+        assert excel_object.df.Amount.iloc[0] == 150
+        assert excel_object.df.Amount.isna().iloc[1]
+
+    @staticmethod
+    def test_fx_update_keeps_integers(mock_file):
+        import pandas as pd
+        df = pd.DataFrame({"Amount": [100, 250], "Type": [None, None]})
+        excel_object = Excel(df=df)
+        excel_object.update(pd.DataFrame({"Type": ["A"]}, index=[1]))
+        assert excel_object.df.Amount.dtype == "int64"
+        assert excel_object.df.Type.tolist() == [None, "A"]
+
+    @staticmethod
+    def test_fx_write_expands_amounts(mock_file):
+        import pandas as pd
+        excel_object = Excel(filename="cents", df=pd.DataFrame({
+            "Date": [datetime.datetime(2019, 1, 1)], "Amount": [1050]}))
+        excel_object.write()
+        assert Excel(filename="cents", read_file=True).df.Amount[0] == 10.5
+
+    @staticmethod
+    @pytest.mark.parametrize("rows", [0, 1, 25])
+    def test_fx_write_chunks(mock_file, rows):
+        import pandas as pd
+        df = pd.DataFrame({
+            "Date": pd.date_range("2019-01-01", periods=rows),
+            "Amount": [150 + row for row in range(rows)],
+            "Info": ["x{}".format(row % 3) if row % 4 else "" for row in range(rows)]})
+        df.index.name = "ID"
+        excel_object = Excel(filename="chunks", df=df)
+        excel_object.write(chunksize=10)
+        expected = Excel.as_read(Excel.reset_index(None, Excel.expand(df)))
+        written = pd.read_excel(excel_object.file_pointer())
+        assert written.columns.tolist() == ["ID", "Date", "Amount", "Info"]
+        if rows:
+            pd.testing.assert_frame_equal(written, expected)
+
+    @staticmethod
+    def test_fx_data_validation_rows(mock_file):
+        import pandas as pd
+        config = Jdict(dict={"STYLING": {"COLUMN": {"Type": {
+            "data_validation": {"validate": "list", "source": "CATEGORIES"}}}}})
+        wsheet = Mock()
+        excel_object = Excel(filename="validation", df=pd.DataFrame(
+            {"Amount": [1, 2, 3], "Type": ["", "", ""]}))
+        excel_object.apply_data_validation(["ID", "Amount", "Type"], config, wsheet)
+        options = wsheet.data_validation.call_args[1]
+        assert (options["first_row"], options["last_row"]) == (1, 3)
+        assert options["first_col"] == options["last_col"] == 2
+        assert config.lookup("STYLING", "COLUMN", "Type", "data_validation",
+                             "source") == "CATEGORIES"
+
+
+class TestDatabase:
+
+    @staticmethod
+    def write_classified():
+        import pandas as pd
+        df = pd.DataFrame({"ID": [3, 1, 2],
+                           "Date": pd.to_datetime(["2019-01-03", "2019-01-01",
+                                                   "2019-02-01"]),
+                           "Amount": [150, -250, 300],
+                           "Info": ["Shop|", "Bus|", "Shop|"],
+                           "Type": ["Groceries", "", "Groceries"]})
+        excel_object = Excel(filename="classified", df=df.set_index("ID"))
+        excel_object.write()
+        return excel_object
+
+    @staticmethod
+    def test_fx_write_updates_table(mock_file):
+        excel_object = TestDatabase.write_classified()
+        database = Database()
+        signature = File.file_signature(excel_object.file_pointer())
+        assert database.signature("classified") == signature
+
+        df = database.read_table("classified")
+        assert df.ID.tolist() == [3, 1, 2]
+        assert df.Amount.dtype == "int64"
+        assert df.Type.dtype.name == "category"
+        assert df.Type.isna().tolist() == [False, True, False]
+
+        excel_object.delete_file()
+        assert database.signature("classified") is None
+
+    @staticmethod
+    def test_fx_read_table_where(mock_file):
+        TestDatabase.write_classified()
+        df = Database().read_table("classified", "Amount > ?", [200])
+        assert df.ID.tolist() == [2]
+
+    @staticmethod
+    @pytest.mark.parametrize("read_file", [True, False])
+    def test_fx_statements_queries(mock_file, read_file):
+        TestDatabase.write_classified()
+        statements = Statements("classified", read_file=read_file)
+        assert statements.count() == 3
+        assert statements.count("Type") == 2
+        assert statements.count(unique="Info") == 2
+
+        selection = statements.select_by("Info", "Shop|", statement=False)
+        assert selection.index.tolist() == [3, 2]
+        selection = statements.select_dates("2019-01-02", "2019-01-31")
+        assert selection.index().tolist() == [3]
+        selection = statements.select_dates(end="2019-01-03", statement=False)
+        assert selection.index.tolist() == [3, 1]
+        assert statements.is_loaded() == read_file
+
+    @staticmethod
+    def test_fx_statements_stale_table(mock_file):
+        import pandas as pd
+        fp = TestDatabase.write_classified().file_pointer()
+        df = pd.read_excel(fp)
+        df.loc[1, "Type"] = "Transport"
+        df.to_excel(fp, index=False)
+
+        statements = Statements("classified")
+        assert statements.count("Type") == 3
+        assert statements.is_loaded()
+        assert Database().signature("classified") == File.file_signature(fp)
+
+    @staticmethod
+    def test_fx_statements_missing_column(mock_file):
+        TestDatabase.write_classified()
+        with pytest.raises(ValueError):
+            Statements("classified").select_by("Missing", 1)
+
+
+class TestSession:
+
+    @staticmethod
+    def test_fx_nested(mock_file):
+        with Session():
+            memory = File.memory
+            with Session():
+                assert File.memory is memory
+            assert File.memory is memory
+        assert File.memory is None
+
+    @staticmethod
+    def test_fx_file_changed(mock_file):
+        import pandas as pd
+        with Session():
+            fp = TestExcel.write_sample()
+            pd.DataFrame({"Date": ["02/01/2019"], "Amount": [2]}).to_excel(
+                fp, index=False)
+            assert Excel(filename="sample", read_file=True).df.Amount[0] == 2
+
+
+class TestAggregates:
+
+    @staticmethod
+    def classified_df():
+        import pandas as pd
+        return pd.DataFrame({"ID": [1, 2, 3, 4, 5],
+                             "Date": pd.to_datetime(["2019-01-03", "2019-01-20",
+                                                     "2019-02-01", "2019-01-05",
+                                                     "2020-03-01"]),
+                             "Amount": [150, 250, 300, 1000, 400],
+                             "Info": ["Shop|", "Shop|", "Shop|", "Bus|", "Shop|"],
+                             "Type": ["Groceries", "Groceries", "Groceries",
+                                      None, "Groceries"]}).set_index("ID")
+
+    @staticmethod
+    def test_fx_summarize(mock_file):
+        cube = Aggregates.build(TestAggregates.classified_df())
+        assert cube.Count.tolist() == [2, 1, 1]
+        summary = Aggregates().summarize(cube=cube)
+        assert summary.Count["Groceries"] == 4
+        assert summary.Total["Groceries"] == 11
+        assert summary.Minimum["Groceries"] == 1.5
+        assert summary.Maximum["Groceries"] == 4
+        assert abs(summary.Std["Groceries"] - 1.0408330) < 1e-6
+        assert str(summary.First["Groceries"].date()) == "2019-01-03"
+        assert str(summary.Last["Groceries"].date()) == "2020-03-01"
+        yearly = Aggregates().summarize("Year", cube=cube)
+        assert yearly.Total.tolist() == [7, 4]
+        assert [str(date.date()) for date in yearly.Last] == [
+            "2019-02-01", "2020-03-01"]
+
+    @staticmethod
+    def test_fx_write_updates_cells(mock_file, monkeypatch):
+        df = TestAggregates.classified_df()
+        Statements(filename="classified", df=df.reset_index()).write()
+
+        classified = Statements("classified")
+        removed = classified.filter(classified.index().isin([1, 3]))
+        classified.drop_rows([1, 3])
+        added = TestAggregates.classified_df().loc[[2]].rename(index={2: 6})
+        added["Amount"] = 50
+        classified.append(added)
+        classified.record_changes(removed, added)
+        original = Aggregates.build
+        build = Mock(wraps=original)
+        monkeypatch.setattr(Aggregates, "build", build)
+        classified.write()
+        # Only removed and added rows and the cell which lost its minimum
+        sizes = [len(call[0][0]) for call in build.call_args_list]
+        assert sizes == [2, 1, 2]
+        monkeypatch.setattr(Aggregates, "build", original)
+
+        cube = Aggregates().read_table()
+        expected = Aggregates.build(Statements("classified", read_file=True).df)
+        assert cube.equals(expected)
+        assert cube.Minimum.tolist() == [50, 400]
+        assert [str(date.date()) for date in cube.First] == [
+            "2019-01-20", "2020-03-01"]
+
+    @staticmethod
+    def test_fx_table_without_dates(mock_file):
+        df = TestAggregates.classified_df()
+        Statements(filename="classified", df=df.reset_index()).write()
+        # Table of an older version, without first and last dates
+        aggregates = Aggregates()
+        signature = aggregates.database.signature(Aggregates.name)
+        cube = Aggregates.build(df).drop(columns=["First", "Last"])
+        aggregates.database.write_table(Aggregates.name, cube.reset_index(),
+                                        signature)
+        assert aggregates.signature() is None
+        summary = aggregates.summarize()
+        assert str(summary.First["Groceries"].date()) == "2019-01-03"
+
+    @staticmethod
+    def test_fx_read_stale_table(mock_file):
+        import pandas as pd
+        df = TestAggregates.classified_df()
+        fp = Statements(filename="classified", df=df.reset_index()).file_pointer()
+        Statements(filename="classified", df=df.reset_index()).write()
+        changed = pd.read_excel(fp)
+        changed.loc[3, "Type"] = "Transport"
+        changed.to_excel(fp, index=False)
+
+        summary = Aggregates().summarize()
+        assert summary.Count.to_dict() == {"Groceries": 4, "Transport": 1}
+
+
+class TestWriters:
+
+    @staticmethod
+    def test_fx_write_in_pool(mock_file, monkeypatch):
+        import pandas as pd
+        monkeypatch.setattr(Writers, "min_rows", 0)
+        df = pd.DataFrame({"Date": ["01/01/2019"], "Amount": [150]})
+        with Writers(2) as pool:
+            excel_object = Excel(filename="pooled", df=df)
+            excel_object.write()
+            assert len(pool.pending) == 1
+            excel_object.df.loc[0, "Amount"] = 990
+            read = Excel(filename="pooled", read_file=True)
+            assert not pool.pending
+        assert Writers.current is None
+        assert read.df.Amount[0] == 1.5
+
+    @staticmethod
+    def test_fx_small_files_not_pooled(mock_file):
+        with Writers(2) as pool:
+            TestExcel.write_sample()
+            assert not pool.pending and pool.executor is None
+        with Writers(1) as pool:
+            assert not pool.submit(Excel(filename="sample", read_file=True),
+                                   "sample.xlsx")
+
+    @staticmethod
+    def test_fx_nested(mock_file):
+        with Writers(2) as pool:
+            with Writers(2):
+                assert Writers.current is pool
+            assert Writers.current is pool
+        assert Writers.current is None
+
+    @staticmethod
+    def test_fx_error_raised_on_wait(mock_file, monkeypatch):
+        import pandas as pd
+        monkeypatch.setattr(Writers, "min_rows", 0)
+        excel_object = Excel(filename="error", df=pd.DataFrame(
+            {"Date": ["01/01/2019"], "Amount": [1]}))
+        missing = os.path.join(str(mock_file.common()), "missing", "error.xlsx")
+        with pytest.raises(Exception, match="No such file"):
+            with Writers(2):
+                excel_object.write(file_pointer=missing)
+        assert Writers.current is None
+
+    @staticmethod
+    def test_fx_failed_write_keeps_file(mock_file, monkeypatch):
+        fp = TestExcel.write_sample()
+        with open(fp, "rb") as file:
+            contents = file.read()
+
+        def fail(self, df):
+            raise ValueError("Failed")
+
+        monkeypatch.setattr(XlsxWriter, "write_rows", fail)
+        with pytest.raises(ValueError):
+            TestExcel.write_sample()
+        with open(fp, "rb") as file:
+            assert file.read() == contents
+        assert os.listdir(os.path.dirname(fp)) == [os.path.basename(fp)]
+
+
+class TestXlsxWriter:
+
+    @staticmethod
+    def test_fx_format_cached(tmpdir):
+        writer = XlsxWriter(os.path.join(tmpdir, "formats.xlsx"))
+        bold = writer.format({"bold": True, "border": 1})
+        assert writer.format({"border": 1, "bold": True}) is bold
+        assert writer.format({"bold": False}) is not bold
+        writer.close()
+
+    @staticmethod
+    def test_fx_write_row(tmpdir):
+        import numpy as np
+        import pandas as pd
+        fp = os.path.join(tmpdir, "rows.xlsx")
+        writer = XlsxWriter(fp)
+        writer.write_row(["Date", "Amount", "Info", "Flag"])
+        writer.write_row([pd.Timestamp("2019-01-02"), np.int64(5), "a", True])
+        writer.write_row([pd.NaT, np.nan, "", None])
+        writer.write_row([None, 1.5, "b", np.bool_(False)])
+        writer.close()
+        assert writer.rows == 4
+
+        df = pd.read_excel(fp)
+        assert df.Date[0] == pd.Timestamp("2019-01-02")
+        assert df.Amount.tolist()[::2] == [5, 1.5]
+        assert df.Info.isna().tolist() == [False, True, False]
+        assert df.Flag.tolist()[::2] == [True, False]
+        assert df.iloc[1].isna().all()
+
+
+class TestXlsxStream:
+
+    @staticmethod
+    @pytest.mark.parametrize("chunksize", [1, 2, 10])
+    def test_fx_chunks(tmpdir, chunksize):
+        import pandas as pd
+        fp = os.path.join(tmpdir, "stream.xlsx")
+        df = pd.DataFrame({"Date": ["01/01/2019", None, "03/01/2019"],
+                           "Description": ["a", "b", None],
+                           "Amount": [1.5, -2.25, 3.0]})
+        df.to_excel(fp, index=False)
+
+        chunks = list(XlsxStream(fp).chunks(chunksize))
+        assert all(len(chunk.index) <= chunksize for chunk in chunks)
+        streamed = pd.concat(chunks)
+        expected = pd.read_excel(fp)
+        assert streamed.index.equals(expected.index)
+        assert streamed.fillna("").equals(expected.fillna(""))
+
+    @staticmethod
+    def test_fx_missing_file(tmpdir):
+        with pytest.raises(FileNotFoundError):
+            XlsxStream(os.path.join(tmpdir, "missing.xlsx"))
@@ -0,0 +1,85 @@
+import pytest
+
+from system.matching import Automaton, KeywordRules, TokenIndex
+
+
+class TestAutomaton:
+
+    @staticmethod
+    @pytest.mark.parametrize("text", ["", "ushers", "she sells", "hishe", "xyz"])
+    def test_fx_find(text):
+        keywords = ["he", "she", "his", "hers", "s"]
+        automaton = Automaton(keywords)
+        found = sorted((start, automaton.keywords[kid])
+                       for start, kid in automaton.find(text))
+        expected = sorted((i, k) for k in keywords for i in range(len(text))
+                          if text.startswith(k, i))
+        assert found == expected
+
+
+class TestKeywordRules:
+    RULES = {
+        "Groceries": {"contains": ["tesco"], "prefix": ["aldi"]},
+        "Transport": {"contains": ["tesco petrol", "uber"]},
+        "Eating out": {"contains": ["uber"], "prefix": ["uber eats"]},
+    }
+
+    @staticmethod
+    @pytest.mark.parametrize("text,category", [
+        ("TESCO STORES 123|", "Groceries"),
+        ("TESCO PETROL 99|", "Transport"),
+        ("ALDI 1|", "Groceries"),
+        ("CARD ALDI|", ""),
+        ("UBER EATS|", "Eating out"),
+        ("UBER TRIP|", "Eating out"),
+        ("Unknown|", ""),
+        (None, ""),
+    ])
+    def test_fx_lookup(text, category):
+        rules = KeywordRules(TestKeywordRules.RULES)
+        assert rules.lookup(text, default="") == category
+
+    @staticmethod
+    def test_fx_lookup_all():
+        rules = KeywordRules(TestKeywordRules.RULES)
+        keys = ["ALDI|", "x|", "ALDI|"]
+        assert rules.lookup_all(keys, default="").tolist() == \
+               ["Groceries", "", "Groceries"]
+
+
+class TestTokenIndex:
+
+    @staticmethod
+    def sample_index():
+        index = TokenIndex()
+        index.add_all(["TESCO STORES 1234|", "TESCO STORES 9876|", "SHELL 55|"],
+                      ["Groceries", "Groceries", "Transport"])
+        return index
+
+    @staticmethod
+    def test_fx_tokens():
+        tokens = TokenIndex.tokens("Tesco 1234|x")
+        assert {"TESCO", "#TES", "#ESC", "#SCO", "X"} == tokens
+
+    @staticmethod
+    @pytest.mark.parametrize("text,category", [
+        ("TESCO STORES 5555|", "Groceries"),
+        ("SHELL 77|", "Transport"),
+    ])
+    def test_fx_suggest(text, category):
+        suggestions = TestTokenIndex.sample_index().suggest(text)
+        best, confidence = suggestions[0]
+        assert best == category
+        assert 0 < confidence <= 1
+
+    @staticmethod
+    def test_fx_suggest_unknown():
+        assert TestTokenIndex.sample_index().suggest("1234|") == []
+
+    @staticmethod
+    def test_fx_suggest_all():
+        index = TestTokenIndex.sample_index()
+        suggestions = index.suggest_all(["SHELL 1|", "NOTHING|"], k=2)
+        assert suggestions.Suggestion.tolist() == ["Transport", None]
+        assert list(suggestions.columns) == ["Suggestion", "Confidence",
+                                             "Alternatives"]
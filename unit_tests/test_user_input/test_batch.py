@@ -0,0 +1,60 @@
+import argparse
+import pytest
+
+import user_input.commands.batch as batch_cmd
+from system.file_management import File
+
+
+class TestBatch:
+
+    @staticmethod
+    def test_parse():
+        lines = ["# nightly job\n", "\n", "data -i\n", "  info -a  \n",
+                 "--timing categories -s\n"]
+        steps = batch_cmd.parse(lines)
+        assert [line for line, commands in steps] == [
+            "data -i", "info -a", "--timing categories -s"]
+        assert steps[0][1].migrate
+        assert steps[2][1].timing
+
+    @staticmethod
+    @pytest.mark.parametrize("line", ["data --bad", "unknown", "info 'a"])
+    def test_parse_invalid(line):
+        with pytest.raises(ValueError, match="Line 2: .* not a valid command"):
+            batch_cmd.parse(["info -p", line])
+
+    @staticmethod
+    @pytest.mark.parametrize("line", ["batch steps.txt", "serve", "--timing"])
+    def test_parse_not_allowed(line):
+        with pytest.raises(ValueError, match="cannot be run in a batch"):
+            batch_cmd.parse([line])
+
+    @staticmethod
+    def test_process(mock_file, monkeypatch, tmpdir, capsys):
+        sessions = []
+        import user_input.parser as parser
+        process_commands = parser.process_commands
+
+        def run(commands):
+            sessions.append(File.memory)
+            process_commands(commands)
+
+        monkeypatch.setattr(parser, "process_commands", run)
+        fp = tmpdir.join("steps.txt")
+        fp.write("info -p\ninfo -p\n")
+        batch_cmd.process(argparse.Namespace(file=str(fp)))
+
+        output = capsys.readouterr().out
+        assert output.count("$ info -p") == 2
+        assert output.count(mock_file.common()) == 2
+        assert sessions[0] is not None and sessions[0] is sessions[1]
+        assert File.memory is None
+
+    @staticmethod
+    def test_process_stops_on_invalid_line(mock_file, tmpdir, capsys):
+        fp = tmpdir.join("steps.txt")
+        fp.write("info -p\ninfo --bad\n")
+        batch_cmd.process(argparse.Namespace(file=str(fp)))
+        output = capsys.readouterr().out
+        assert "Line 2" in output
+        assert mock_file.common() not in output
@@ -0,0 +1,264 @@
+import os
+import sys
+import subprocess
+import argparse
+import importlib
+import pytest
+
+from system.file_management import Excel, Jdict
+
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib"]
+LIGHT_MODULES = ["user_input.parser",
+                 "user_input.commands.info",
+                 "user_input.commands.setup",
+                 "user_input.commands.categories",
+                 "user_input.commands.plots"]
+COMMAND_MODULES = ["user_input.parser",
+                   "user_input.commands.info",
+                   "user_input.commands.setup",
+                   "user_input.commands.categories",
+                   "user_input.commands.data",
+                   "data.classified",
+                   "data.unclassified",
+                   "data.raw",
+                   "data.sources"]
+# Commands which only use config files. setup is run
+# for a common path which has raw.xlsx already
+LIGHT_COMMANDS = [["info", "-p"],
+                  ["categories", "-a", "Fun,Rent"],
+                  ["setup", "-p", "{common}"]]
+
+
+@pytest.fixture
+def workbook_reads(monkeypatch):
+    """ Record files read by Excel.read instead of reading them """
+    reads = []
+
+    def read(self, sheet="Sheet1"):
+        reads.append(self.filename)
+        raise AssertionError("{} was read".format(self.filename))
+
+    monkeypatch.setattr(Excel, "read", read)
+    yield reads
+
+
+@pytest.fixture
+def unload_modules():
+    """ Remove app modules from sys.modules, so they are imported
+    again. The original modules are put back after the test. """
+    def app_modules():
+        return [name for name in sys.modules
+                if name.split(".")[0] in ("data", "plot", "user_input")]
+
+    saved = {name: sys.modules.pop(name) for name in app_modules()}
+    yield
+    for name in app_modules():
+        del sys.modules[name]
+    sys.modules.update(saved)
+
+
+class TestImports:
+
+    @staticmethod
+    @pytest.mark.parametrize("module", COMMAND_MODULES)
+    def test_import_reads_no_workbooks(mock_file, workbook_reads,
+                                       unload_modules, module):
+        importlib.import_module(module)
+        assert workbook_reads == []
+
+    @staticmethod
+    def test_plots_import_reads_no_workbooks(mock_file, workbook_reads,
+                                             unload_modules):
+        pytest.importorskip("matplotlib")
+        importlib.import_module("user_input.commands.plots")
+        assert workbook_reads == []
+
+    @staticmethod
+    def test_commands_import_no_heavy_modules():
+        root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        code = "import sys\n{}\nprint([m for m in {} if m in sys.modules])"
+        imports = "\n".join("import " + module for module in LIGHT_MODULES)
+        output = subprocess.check_output(
+            [sys.executable, "-c", code.format(imports, HEAVY_MODULES)],
+            cwd=root, universal_newlines=True)
+        assert output.strip() == "[]"
+
+    @staticmethod
+    @pytest.mark.parametrize("args", LIGHT_COMMANDS)
+    def test_run_commands_no_heavy_modules(mock_file, tmpdir, args):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        code = ("import sys\n"
+                "import user_input.parser as parser\n"
+                "parser.process_commands(parser.init_parser({}))\n"
+                "print([m for m in {} if m in sys.modules])")
+        os.makedirs(os.path.join(mock_file.common(), "Data"))
+        open(os.path.join(mock_file.common(), "Data", "raw.xlsx"), "w").close()
+        args = [arg.format(common=mock_file.common()) for arg in args]
+        # Commands run in the app directory of mock_file
+        env = dict(os.environ, PYTHONPATH=root)
+        output = subprocess.check_output(
+            [sys.executable, "-c", code.format(args, HEAVY_MODULES)],
+            cwd=str(tmpdir), env=env, universal_newlines=True)
+        assert output.splitlines()[-1] == "[]"
+
+
+class TestCommands:
+
+    @staticmethod
+    def run(**kwargs):
+        import user_input.parser as parser
+        options = {"cache_stats": False, "timing": False}
+        options.update(kwargs)
+        commands = argparse.Namespace(**options)
+        parser.process_commands(commands)
+
+    @staticmethod
+    def test_info_path(mock_file, workbook_reads, capsys):
+        TestCommands.run(parser="info", all=False, categories=False,
+                         path=True, transactions=False)
+        assert mock_file.common() in capsys.readouterr().out
+        assert workbook_reads == []
+
+    @staticmethod
+    def test_timing(mock_file, workbook_reads, capsys):
+        TestCommands.run(parser="info", all=False, categories=False,
+                         path=True, transactions=False, timing=True)
+        output = capsys.readouterr().out
+        assert "Startup:" in output
+        assert "Work:" in output
+
+    @staticmethod
+    def test_categories_show(mock_file, monkeypatch, capsys):
+        import pandas as pd
+        categories = Jdict("u_categories")
+        categories.update("CATEGORIES", ["Groceries", "Transport"])
+        categories.update("BLACKLIST", ["BLACKLIST"])
+        categories.write()
+        df = pd.DataFrame({"ID": [0, 1], "Date": pd.to_datetime(["2019-01-01"]*2),
+                           "Amount": [100, 200], "Info": ["Shop|", "Bus|"],
+                           "Type": ["Groceries", "Groceries"]})
+        Excel(filename="classified", df=df.set_index("ID")).write()
+
+        reads = []
+        monkeypatch.setattr(Excel, "read",
+                            lambda self, sheet="Sheet1": reads.append(self))
+        TestCommands.run(parser="categories", show=True, add=None,
+                         delete=None, bad=False)
+        output = capsys.readouterr().out
+        assert "Groceries  |  2" in output
+        assert "Transport  |  0" in output
+        assert reads == []
+
+    @staticmethod
+    def write_categories():
+        import pandas as pd
+        categories = Jdict("u_categories")
+        categories.update("CATEGORIES", ["Groceries", "Transport"])
+        categories.update("BLACKLIST", ["BLACKLIST"])
+        categories.write()
+        Jdict("u_cmappings", dict={"Shop|": "Groceries", "Bus|": "Transport"}).write()
+        Jdict("u_crules", dict={"Groceries": {"contains": ["CAFE"]},
+                                "Transport": {"prefix": ["TRAIN"]}}).write()
+        df = pd.DataFrame({"ID": [0, 1, 2, 3],
+                           "Date": pd.to_datetime(["2019-01-01"]*4),
+                           "Amount": [100, 200, 300, 400],
+                           "Info": ["Shop|", "Bus|", "Cafe|", "Train|"],
+                           "Type": ["Groceries", "Transport", "Groceries", "Transport"]})
+        Excel(filename="classified", df=df.set_index("ID")).write()
+        unclassified = df.iloc[:0].assign(ID=[5], Info=["Tea|"], Type=["Groceries"])
+        Excel(filename="unclassified", df=unclassified.set_index("ID")).write()
+
+    @staticmethod
+    def test_categories_delete(mock_file, capsys):
+        from system.file_management import Statements, Mappings
+        TestCommands.write_categories()
+        TestCommands.run(parser="categories", show=False, add=None,
+                         delete=["Groceries"], bad=False)
+        assert "Transactions updated: 2" in capsys.readouterr().out
+
+        classified = Statements("classified", read_file=True)
+        types = classified.get_attr("Type").astype(object)
+        assert types.where(types.notna(), None).tolist() == [
+            None, "Transport", None, "Transport"]
+        unclassified = Statements("unclassified", read_file=True)
+        assert sorted(unclassified.get_attr("Info")) == ["Cafe|", "Shop|", "Tea|"]
+        assert unclassified.get_attr("Type").isna().all()
+        assert Mappings("u_cmappings").dict == {"Bus|": "Transport"}
+        assert list(Jdict("u_crules").keys()) == ["Transport"]
+
+    @staticmethod
+    def test_categories_add_changes_config_only(mock_file, workbook_reads):
+        TestCommands.run(parser="categories", show=False, add=["Fun,Rent"],
+                         delete=None, bad=False)
+        assert Jdict("u_categories").lookup("CATEGORIES") == ["Fun", "Rent"]
+        assert workbook_reads == []
+
+    @staticmethod
+    def test_categories_coalesced(mock_file, monkeypatch, capsys):
+        import data.raw
+        TestCommands.write_categories()
+        calls = []
+        monkeypatch.setattr(data.raw, "remove_categories",
+                            lambda categories: calls.append(categories) or 0)
+        TestCommands.run(parser="categories", show=False, add=["Fun"],
+                         delete=["Groceries", "Transport"], bad=False)
+        assert calls == [["Groceries", "Transport"]]
+        assert Jdict("u_categories").lookup("CATEGORIES") == ["Fun"]
+
+    @staticmethod
+    def test_data_import_reads_raw_only(mock_file, monkeypatch, capsys):
+        import pandas as pd
+        Jdict("u_cmappings", dict={"Shop|": "Groceries"}).write()
+        fp = Excel(filename="raw").file_pointer()
+        pd.DataFrame({"Date": ["01/01/2019", "02/01/2019", "03/01/2019"],
+                      "Description": ["Shop", "Bus", "Cafe"],
+                      "Extra": ["", "", ""],
+                      "Amount": [1.5, 2.5, 3.5]}).to_excel(fp, index=False)
+
+        reads = []
+        read = Excel.read
+        def count_reads(self, sheet="Sheet1"):
+            fp = self.file_pointer()
+            if Excel.read_memory(self, fp, sheet) is None:
+                reads.append(self.filename)
+            read(self, sheet)
+        monkeypatch.setattr(Excel, "read", count_reads)
+
+        TestCommands.run(parser="data", migrate=True, classify=False,
+                         sources=None, workers=None, write_workers=1,
+                         profile=None, chunksize=None, report_rss=False,
+                         memory_report=False)
+        assert reads == ["raw.xlsx"]
+        assert "Classified: 1/3" in capsys.readouterr().out
+
+    @staticmethod
+    def test_data_classify_matching_rows(mock_file, capsys):
+        import pandas as pd
+        from system.file_management import Statements, Aggregates
+        df = pd.DataFrame({"ID": [0, 1, 2, 3],
+                           "Date": pd.to_datetime(["2019-01-01"]*4),
+                           "Amount": [100, 200, 300, 400],
+                           "Info": ["Shop|", "Cafe|", "Bus|", "Cafe|"],
+                           "Type": ["Groceries", None, None, None]})
+        Excel(filename="classified", df=df.set_index("ID")).write()
+        unclassified = df.iloc[1:3].assign(Type=["Food", None])
+        Excel(filename="unclassified", df=unclassified.set_index("ID")).write()
+
+        TestCommands.run(parser="data", migrate=False, classify=True,
+                         sources=None, workers=None, write_workers=1,
+                         profile=None, chunksize=None, report_rss=False,
+                         memory_report=False)
+        assert "Classified 2 rows" in capsys.readouterr().out
+        classified = Statements("classified", read_file=True)
+        types = classified.get_attr("Type").astype(object)
+        assert types.where(types.notna(), None).tolist() == [
+            "Groceries", "Food", None, "Food"]
+        assert Aggregates().summarize().Count.to_dict() == {
+            "Food": 2, "Groceries": 1}
+
+    @staticmethod
+    def test_setup(mock_file, workbook_reads, tmpdir):
+        common = str(tmpdir.join("new_common"))
+        TestCommands.run(parser="setup", path=[common])
+        assert Jdict("u_paths").lookup("COMMON") == common
+        assert workbook_reads == []
@@ -0,0 +1,133 @@
+import os
+import stat
+import time
+import argparse
+import threading
+import pytest
+
+import user_input.commands.serve as serve_cmd
+import user_input.commands.batch as batch_cmd
+
+pytestmark = pytest.mark.skipif(not serve_cmd.supported(),
+                                reason="Unix sockets not available")
+
+INFO_PATH = {"parser": "info", "all": False, "categories": False,
+             "path": True, "transactions": False,
+             "cache_stats": False, "timing": False}
+
+
+@pytest.fixture
+def no_chmod(monkeypatch):
+    """ Leave file permissions as they were created """
+    monkeypatch.setattr(os, "chmod", lambda fp, mode: None)
+
+
+@pytest.fixture
+def socket_folder(monkeypatch, tmpdir):
+    """ Keep sockets in a folder of the user in tmpdir """
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setenv("TMPDIR", str(tmpdir))
+    yield tmpdir.join("bank-statements-{}".format(os.getuid()))
+
+
+@pytest.fixture
+def daemon(mock_file):
+    """ Run the daemon in a thread until the test finishes """
+    thread = threading.Thread(target=serve_cmd.serve)
+    thread.start()
+    for _ in range(100):
+        try:
+            serve_cmd.send({"ping": True}, timeout=1)
+            break
+        except OSError:
+            time.sleep(0.05)
+    yield mock_file
+    serve_cmd.stop()
+    thread.join(5)
+
+
+class TestServe:
+
+    @staticmethod
+    def test_forward_without_daemon(mock_file):
+        commands = argparse.Namespace(**INFO_PATH)
+        assert not serve_cmd.forward(commands)
+
+    @staticmethod
+    def test_forward_serve(mock_file):
+        commands = argparse.Namespace(parser="serve", stop=True)
+        assert not serve_cmd.forward(commands)
+
+    @staticmethod
+    def test_run_commands(daemon):
+        reply = serve_cmd.send({"commands": INFO_PATH}, timeout=5)
+        assert daemon.common() in reply["output"]
+
+    @staticmethod
+    def test_run_commands_error(daemon):
+        reply = serve_cmd.send({"commands": {"parser": "info"}}, timeout=5)
+        assert "AttributeError" in reply["output"]
+
+    @staticmethod
+    def test_stop(daemon, capsys):
+        serve_cmd.stop()
+        assert "Daemon stopped" in capsys.readouterr().out
+        with pytest.raises(OSError):
+            serve_cmd.send({"ping": True}, timeout=1)
+
+    @staticmethod
+    def test_socket_permissions(no_chmod, daemon):
+        mode = os.stat(serve_cmd.socket_pointer()).st_mode
+        assert stat.S_IMODE(mode) == 0o600
+
+    @staticmethod
+    def test_socket_folder(mock_file, socket_folder):
+        serve_cmd.create_socket_folder()
+        assert os.path.dirname(serve_cmd.socket_pointer()) == str(socket_folder)
+        assert stat.S_IMODE(os.stat(str(socket_folder)).st_mode) == 0o700
+
+        # The daemon does not start if others can use the folder
+        socket_folder.chmod(0o777)
+        with pytest.raises(PermissionError):
+            serve_cmd.create_socket_folder()
+
+    @staticmethod
+    def test_forward_other_user(mock_file, socket_folder, monkeypatch):
+        requests = []
+
+        def send(request, timeout=None):
+            requests.append(request)
+            return {"output": ""}
+
+        monkeypatch.setattr(serve_cmd, "send", send)
+        serve_cmd.create_socket_folder()
+        monkeypatch.setenv("XDG_RUNTIME_DIR", str(socket_folder))
+        socket_folder.join(os.path.basename(serve_cmd.socket_pointer())).write("")
+        assert serve_cmd.forward(argparse.Namespace(**INFO_PATH))
+        # Sockets of other users are never used
+        uid = os.getuid()
+        monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+        assert not serve_cmd.forward(argparse.Namespace(**INFO_PATH))
+        assert len(requests) == 1
+
+    @staticmethod
+    def test_batch_runs_locally(mock_file, socket_folder, monkeypatch, tmpdir, capsys):
+        requests = []
+
+        def send(request, timeout=None):
+            requests.append(request)
+            raise OSError("Daemon is not running")
+
+        serve_cmd.create_socket_folder()
+        socket_folder.join(os.path.basename(serve_cmd.socket_pointer())).write("")
+        monkeypatch.setattr(serve_cmd, "send", send)
+        fp = tmpdir.join("steps.txt")
+        fp.write("info -p\ninfo -p\n")
+        commands = argparse.Namespace(parser="batch", file=str(fp),
+                                      cache_stats=False, timing=False)
+        batch_cmd.process(commands)
+        assert capsys.readouterr().out.count(mock_file.common()) == 2
+        assert requests == []
+        # Commands outside a batch are sent to the daemon
+        assert not serve_cmd.forward(argparse.Namespace(**INFO_PATH))
+        assert len(requests) == 1
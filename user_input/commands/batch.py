@@ -0,0 +1,68 @@
+import os
+import sys
+import shlex
+
+""" Run many commands in one process. Commands are read from
+a file or input, one per line, written the same way as after
+'python main.py'. Empty lines and lines starting with # are
+skipped. Commands share a session, so statements written by
+one command are passed to the next ones in memory instead of
+being read from the files again. They are run in this process
+even if the daemon is running, so that they share it. """
+
+def process(commands=None):
+    """ Run commands for 'batch' subparser """
+    try:
+        steps = parse(read_lines(commands.file))
+    except (OSError, ValueError) as err:
+        print(err)
+        return
+    run(steps)
+
+def read_lines(fp):
+    """ Return lines of file fp or input if fp is '-' """
+    if fp == "-":
+        return sys.stdin.readlines()
+    with open(fp, "r") as file:
+        return file.readlines()
+
+def split(line):
+    """ Split line into arguments the way a shell would.
+    Backslashes are kept on Windows, where they are used
+    in paths rather than for escaping characters. """
+    if os.name == "nt":
+        return [arg.strip('"') for arg in shlex.split(line, posix=False)]
+    return shlex.split(line)
+
+def parse(lines):
+    """ Parse each line into commands. Returns a list of
+    (line, commands). All lines are parsed before any of them
+    are run, so that a mistake does not leave a batch half
+    done. It raises ValueError exception for invalid lines. """
+    import user_input.parser as parser
+
+    steps = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            commands = parser.init_parser(split(line))
+        except (ValueError, SystemExit):
+            err = "Line {}: '{}' is not a valid command"
+            raise ValueError(err.format(number, line))
+        if commands.parser in (None, "batch", "serve"):
+            err = "Line {}: '{}' cannot be run in a batch"
+            raise ValueError(err.format(number, line))
+        steps.append((line, commands))
+    return steps
+
+def run(steps):
+    """ Run parsed commands one after another in one session """
+    import user_input.parser as parser
+    from system.files import Session
+
+    with Session():
+        for line, commands in steps:
+            print("\n$ {}".format(line))
+            parser.process_commands(commands)
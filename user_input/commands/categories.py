@@ -1,26 +1,45 @@
 import sys
-from system.file_management import Jdict
+from system.files import Jdict
+from system.files import Mappings
 from user_input.commands.info import show_categories_summary
-from user_input.commands.info import get_categories_summary
-from user_input.commands.data import migrate as reprocess_raw_data
 
 def process(command=None):
-    """ Run commands for 'categories' subparser """
-
+    """ Run commands for 'categories' subparser. Statements
+    data is updated once, after all categories are deleted
+    and added. Adding categories does not change any data. """
+    deleted = []
     if command.delete:
-        Delete(command.delete, command.bad)
+        deleted = Delete(join(command.delete), command.bad).deleted
     if command.add:
-        Create(command.add, command.bad)
+        Create(join(command.add), command.bad)
+    if deleted:
+        recalculate_data(deleted)
     if command.show:
         show_categories_summary()
 
+def join(params):
+    """ Join categories given with each -a or -d option """
+    if isinstance(params, str):
+        return params
+    return ",".join(params)
+
+def recalculate_data(categories):
+    """ Remove deleted categories from statements data. Only
+    transactions of those categories are processed again. """
+    import data.raw
+
+    print("\nUpdating transactions of deleted categories...")
+    count = data.raw.remove_categories(categories)
+    print(" >> Transactions updated: {}".format(count))
+    if count:
+        data.raw.show_summary()
+
 class AmendCategories:
     """ Base class for amending categories"""
     def __init__(self, params=None, blacklist=False):
         self.existing_categories = None
         self.action_categories = None
         self.blacklist = blacklist
-        self.reprocess_data = True
         self.params = params
         self.config = None
         self.initialise()
@@ -29,7 +48,6 @@ class AmendCategories:
         """ Initialise instance parameters"""
         try:
             self.initialise_existing_categories()
-            self.check_existing_categories()
             self.parse_params()
         except ValueError as error:
             print(error)
@@ -50,13 +68,6 @@ class AmendCategories:
         if not self.action_categories:
             raise ValueError(" >> Invalid categories entered")
 
-    def check_existing_categories(self):
-        """ Check if there are any existing categories. If there
-        aren't any, set reprocess_data data flag to False to
-        avoid raw data being imported"""
-        if not self.existing_categories:
-            self.reprocess_data = False
-
     def show_info(self, action):
         if self.blacklist:
             print("{} blacklisted categories...".format(action))
@@ -73,12 +84,6 @@ class AmendCategories:
         else:
             return "CATEGORIES"
 
-    def recalculate_data(self):
-        """ Reprocess statements data if
-        reprocess flag is set."""
-        if self.reprocess_data:
-            reprocess_raw_data("\nRe-processing raw data...")
-
 class Create(AmendCategories):
     """ Class for creating new categories """
     def __init__(self, params, blacklist):
@@ -91,7 +96,6 @@ class Create(AmendCategories):
             self.validate_new_categories()
             super().show_info("Adding")
             self.update_categories_config()
-            super().recalculate_data()
         except ValueError as error:
             print(error)
 
@@ -116,8 +120,11 @@ class Create(AmendCategories):
         self.config.write()
 
 class Delete(AmendCategories):
-    """ Class for deleting existing categories """
+    """ Class for deleting existing categories. Deleted
+    categories are kept in deleted attribute, so that
+    statements data can be updated afterwards. """
     def __init__(self, params, blacklist):
+        self.deleted = []
         super().__init__(params=params, blacklist=blacklist)
         self.do_it()
 
@@ -127,8 +134,9 @@ class Delete(AmendCategories):
             self.validate_categories_to_delete()
             super().show_info("Deleting")
             self.delete_references_to_mappings()
+            self.delete_references_to_rules()
             self.delete_categories_from_config()
-            super().recalculate_data()
+            self.deleted = list(self.action_categories)
         except ValueError as error:
             print(error)
 
@@ -157,9 +165,17 @@ class Delete(AmendCategories):
     def delete_references_to_mappings(self):
         """ Delete any references to mappings
         from u_cmappings.json """
-        cmappings = Jdict("u_cmappings")
-        cmappings.transpose()
+        cmappings = Mappings("u_cmappings")
         for category in self.action_categories:
-            cmappings.pop(category)
-        cmappings.transpose()
+            cmappings.delete_category(category)
         cmappings.write()
+
+    def delete_references_to_rules(self):
+        """ Delete keyword rules of deleted categories
+        from u_crules.json, if there are any """
+        crules = Jdict("u_crules")
+        deleted = [cat for cat in self.action_categories if cat in crules.dict]
+        for category in deleted:
+            crules.pop(category)
+        if deleted:
+            crules.write()
@@ -1,17 +1,47 @@
 def process(commands=None):
-    """ Run commands for 'data' subparser """
-    if commands.migrate:
-        migrate()
+    """ Run commands for 'data' subparser. Output files
+    are written by a pool of processes at the same time
+    if more than one write worker is given. """
+    from system.file_management import Writers
 
-    if commands.classify:
-        classify()
+    with Writers(commands.write_workers):
+        if commands.migrate and commands.sources:
+            migrate_files(commands.sources, commands.workers,
+                          commands.profile)
+        elif commands.migrate:
+            migrate(chunksize=commands.chunksize,
+                    report_rss=commands.report_rss)
+
+        if commands.classify:
+            classify()
+
+    if commands.memory_report:
+        show_memory_report()
 
 def classify():
     print("Classifying data...")
     import data.unclassified
     data.unclassified.process()
 
-def migrate(txt="Importing data from raw.xlsx..."):
+def migrate(txt="Importing data from raw.xlsx...", chunksize=None,
+            report_rss=False):
     print(txt)
     import data.raw
-    data.raw.migrate()
+    if chunksize:
+        data.raw.migrate_chunks(chunksize, report_rss)
+    else:
+        data.raw.migrate()
+
+def migrate_files(sources, workers=None, profile=None):
+    print("Importing data from statement files...")
+    import data.sources
+    data.sources.migrate(sources, workers, profile)
+
+def show_memory_report():
+    """ Show bytes used by each column of classified
+    data before and after it is made compact """
+    print("\nMemory use by column (bytes)")
+    import data.summary
+    memory = data.summary.get_memory_summary()
+    for line in memory.to_string().splitlines():
+        print(" >>", line)
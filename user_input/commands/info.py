@@ -1,8 +1,4 @@
-import pandas as pd
-from data.summary import get_categories_summary
-from data.summary import get_transactions_summary
-from system.file_management import Jdict
-from system.file_management import Statements
+from system.files import Jdict
 
 def process(commands=None):
     """ Run commands for 'info' subparser """
@@ -25,9 +21,14 @@ def show_common_path():
 
 def show_categories_summary():
     """ Show categories summary"""
+    from data.summary import get_categories_summary
+    from data.summary import get_aggregates
+
+    # Counts of both types are read from the aggregate cube
+    summary = get_aggregates()
     cats = {"CATEGORIES": "Categories", "BLACKLIST": "Blacklisted categories"}
     for code, desc in cats.items():
-        categories_info = get_categories_summary(code)
+        categories_info = get_categories_summary(code, summary)
         print("\n{}".format(desc))
         if categories_info is None:
             print(" >> {} not defined".format(desc))
@@ -36,6 +37,8 @@ def show_categories_summary():
 
 def show_transactions_summary():
     """ Show transactions summary"""
+    from data.summary import get_transactions_summary
+
     total, classified, unclassified = get_transactions_summary()
     txt = "\nTransactions\n >> Total: {}\n >> Classified: {}\n >> Unclassified: {}"
     print(txt.format(total, classified, unclassified))
@@ -1,15 +1,24 @@
-import data.classified
-import plot.monthly
-import plot.summary
-
 def process(cmd):
     if cmd.all:
-        plot_data()
+        plot_data(cmd.since, cmd.until)
+
+def plot_data(since=None, until=None):
+    """ Generate plots of classified transactions dated
+    between since and until, or of all of them """
+    import data.classified
+    import plot.monthly
+    import plot.summary
 
-def plot_data():
     print("Generating plots...")
-    classified = data.classified.get_classified()
+    classified = data.classified.get_classified(since, until)
     data.classified.remove_blacklist(classified)
+    if classified.is_blank():
+        print(" >> No classified transactions to plot")
+        return
     data.classified.add_date_cols(classified)
-    plot.monthly.do_it(classified.df)
-    plot.summary.do_it(classified.df)
+    # Totals of all transactions are kept in the aggregate cube
+    selected = classified if since or until else None
+    plot.monthly.do_it(classified.df,
+                       data.classified.get_totals("Month", selected))
+    plot.summary.do_it(classified.df,
+                       data.classified.get_totals("Year", selected))
@@ -0,0 +1,198 @@
+import os
+import json
+import hashlib
+import contextlib
+
+""" Run the app as a daemon listening on a local Unix socket.
+Other commands are forwarded to the daemon, so they do not
+import pandas and read config and statement files every time.
+The daemon keeps them in memory and reads a file again only
+when its size or modification time changed.
+
+Modules only used by the daemon are imported when it starts,
+so that commands start quickly when it is not running. """
+
+# True in the daemon, so that it does not forward commands to itself
+running = False
+# Commands always run in the process they were started in
+local_commands = ("serve", "batch")
+
+def process(commands=None):
+    """ Run commands for 'serve' subparser """
+    if not supported():
+        print(" >> Daemon needs Unix sockets, which this system does not have")
+    elif commands.stop:
+        stop()
+    else:
+        serve()
+
+def supported():
+    """ Check if Unix sockets are available. Returns True/False """
+    import socket
+    return hasattr(socket, "AF_UNIX")
+
+def socket_pointer():
+    """ Return file pointer to the socket of the app. There is one
+    daemon per app directory, as config files are kept there. """
+    app_id = hashlib.sha1(os.getcwd().encode()).hexdigest()[:12]
+    filename = "bank-statements-{}.sock".format(app_id)
+    return os.path.join(socket_folder(), filename)
+
+def socket_folder():
+    """ Return the folder of sockets. It is the runtime directory of
+    the user or a folder of the user in the temporary directory, as
+    Unix socket paths must be shorter than about 100 characters. """
+    folder = os.environ.get("XDG_RUNTIME_DIR")
+    if folder:
+        return folder
+    # Unix sockets are only used on Unix, so there is no
+    # need to import tempfile to find temporary directory
+    filename = "bank-statements-{}".format(os.getuid())
+    return os.path.join(os.environ.get("TMPDIR", "/tmp"), filename)
+
+def create_socket_folder():
+    """ Create the folder of sockets, so that only the user can
+    use it. It raises OSError if other users can change it. """
+    folder = socket_folder()
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    stat = os.stat(folder)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise PermissionError("{} can be used by others".format(folder))
+
+def owned(fp):
+    """ Check if file exists and belongs to the user, so that
+    commands are never sent to a daemon of another user.
+    Returns True/False """
+    try:
+        return os.stat(fp).st_uid == os.getuid()
+    except OSError:
+        return False
+
+def send(request, timeout=None):
+    """ Send request to the daemon and return its reply. It
+    raises OSError if the daemon is not running. """
+    import socket
+
+    with contextlib.closing(socket.socket(socket.AF_UNIX)) as client:
+        client.settimeout(timeout)
+        client.connect(socket_pointer())
+        client.sendall(json.dumps(request).encode() + b"\n")
+        reply = b"".join(iter(lambda: client.recv(1 << 16), b""))
+    return json.loads(reply.decode())
+
+def forward(commands):
+    """ Run commands in the daemon and show their output.
+    Returns False if the daemon is not running, so that
+    commands must be run in this process. """
+    from system.files import File
+
+    if running or commands.parser in local_commands:
+        return False
+    elif File.memory is not None:
+        # Steps of a batch share the session open in this process
+        return False
+    elif not supported() or not owned(socket_pointer()):
+        return False
+    # Only the time taken by this process is shown
+    request = dict(vars(commands), timing=False)
+    try:
+        reply = send({"commands": request})
+    except OSError:
+        return False
+    print(reply["output"], end="")
+    return True
+
+def stop():
+    """ Stop the daemon """
+    try:
+        send({"stop": True}, timeout=5)
+        print(" >> Daemon stopped")
+    except OSError:
+        print(" >> Daemon is not running")
+
+def serve():
+    """ Run the daemon until it is stopped with Ctrl+C or
+    'serve --stop'. Requests are handled one at a time, so
+    commands changing files never run at the same time. """
+    global running
+    import socketserver
+    from system.files import Session
+
+    class Request(socketserver.StreamRequestHandler):
+        """ Handle a request sent to the daemon. A request is a
+        line of JSON. It is either a ping, a stop request or
+        commands to run. The reply contains their output. """
+
+        def handle(self):
+            request = json.loads(self.rfile.readline().decode())
+            reply = {}
+            if request.get("stop"):
+                self.server.stopping = True
+            elif "commands" in request:
+                reply["output"] = run(request["commands"])
+            self.wfile.write(json.dumps(reply).encode())
+
+    try:
+        create_socket_folder()
+    except OSError as error:
+        print(" >> Daemon cannot start: {}".format(error))
+        return
+    fp = socket_pointer()
+    try:
+        send({"ping": True}, timeout=5)
+        print(" >> Daemon is running already")
+        return
+    except OSError:
+        # Socket left behind by a daemon which did not stop cleanly
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(fp)
+
+    with Session():
+        preload()
+        # Only the user can connect, from the moment the socket exists
+        umask = os.umask(0o177)
+        try:
+            server = socketserver.UnixStreamServer(fp, Request)
+        finally:
+            os.umask(umask)
+        server.stopping = False
+        running = True
+        print("Daemon listening on {}".format(fp))
+        print(" >> Press Ctrl+C or run 'serve --stop' to stop it")
+        try:
+            while not server.stopping:
+                server.handle_request()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(fp)
+            running = False
+
+def preload():
+    """ Import modules used by commands and read statement
+    files, so that the first commands are quick as well """
+    import user_input.commands.info
+    import user_input.commands.categories
+    from system.file_management import Statements
+
+    for filename in ("classified", "unclassified"):
+        Statements(filename).load()
+
+def run(commands):
+    """ Run commands and return their output """
+    import io
+    import argparse
+    import traceback
+    import user_input.parser as parser
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            parser.process_commands(argparse.Namespace(**commands))
+        except SystemExit:
+            pass
+        except Exception:
+            traceback.print_exc(file=output)
+    return output.getvalue()
@@ -1,7 +1,6 @@
-import pandas as pd
-from system.file_management import Excel
-from system.file_management import Jdict
-from system.file_management import Path
+from system.files import File
+from system.files import Jdict
+from system.files import Path
 
 def process(commands=None):
     """ Run commands for 'setup' subparser """
@@ -46,6 +45,9 @@ def setup_files_and_dirs():
 
 def setup_raw_data_template():
     """ Initialise raw data.xlsx file template """
+    import pandas as pd
+    from system.file_management import Excel
+
     cols = ["Date", "Description", "Extra", "Amount"]
     blank_df = pd.DataFrame([[""]*len(cols)], columns=cols)
     return Excel(filename="raw", type="D", df=blank_df)
@@ -54,8 +56,11 @@ def setup_raw_data():
     """ Write raw data.xlsx file template to file. It does
     not overwrite the file if it already exists. It raises
     IOError exception instead"""
-    raw_data = setup_raw_data_template()
     try:
+        # Checked first, so that pandas is only imported
+        # when the template has to be written
+        File.overwrite_check(File("raw.xlsx", type="D").file_pointer())
+        raw_data = setup_raw_data_template()
         raw_data.write(overwrite_check=True)
         print(" >> Created {}".format(raw_data.filename))
     except IOError as error:
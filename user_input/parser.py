@@ -1,17 +1,28 @@
+import time
 import argparse
-from system.file_management import Jdict
+import datetime
+from system.files import Jdict
+from system.files import Session
 
-def init_parser():
+def init_parser(args=None):
     """ Initialise and definte user input commands
-    available in command prompt for the app """
+    available in command prompt for the app. Parse
+    args or command line arguments if args is None """
     parser = argparse.ArgumentParser()
+    parser.add_argument("--cache-stats", action="store_true", default=False,
+                        dest="cache_stats",
+                        help="Show how many config file reads were saved")
+    parser.add_argument("--timing", action="store_true", default=False,
+                        help="Show startup and work time of the command")
     subparsers = parser.add_subparsers(dest="parser")
     setup_parser(subparsers)
     types_parser(subparsers)
     info_parser(subparsers)
     data_parser(subparsers)
     plotting_parser(subparsers)
-    return parser.parse_args()
+    serve_parser(subparsers)
+    batch_parser(subparsers)
+    return parser.parse_args(args)
 
 def setup_parser(subparsers=None):
     """ 'setup' subparser definition """
@@ -30,10 +41,12 @@ def types_parser(subparsers=None):
     parser_types = subparsers.add_parser("categories", help="Amend categories")
     parser_types.add_argument("-s", action="store_true", default=False,
                               dest="show", help="Show current categories")
-    parser_types.add_argument("-a", type=str, dest="add",
-                              help="Add new (comma-delimited) categories")
-    parser_types.add_argument("-d", type=str, dest="delete",
-                              help="Delete (comma-delimited) categories")
+    parser_types.add_argument("-a", type=str, dest="add", action="append",
+                              help="Add new (comma-delimited) categories."
+                                   " It can be given more than once")
+    parser_types.add_argument("-d", type=str, dest="delete", action="append",
+                              help="Delete (comma-delimited) categories."
+                                   " It can be given more than once")
     parser_types.add_argument("--bad", action="store_true", default=False,
                               help="Amend blacklisted categories")
 
@@ -47,6 +60,26 @@ def data_parser(subparsers=None):
                              help='Import raw data', dest="migrate")
     parser_data.add_argument("-c", action="store_true", default=False,
                              help="Classify data", dest="classify")
+    parser_data.add_argument("--source", nargs="+", dest="sources",
+                             help="Import statements from files, directories"
+                                  " or glob patterns instead of raw.xlsx")
+    parser_data.add_argument("--workers", type=int, default=None,
+                             help="Number of processes reading statements")
+    parser_data.add_argument("--write-workers", type=int, default=1,
+                             dest="write_workers",
+                             help="Number of processes writing output files,"
+                                  " one by default")
+    parser_data.add_argument("--profile", type=str, default=None,
+                             help="Bank profile from u_banks.json used to"
+                                  " read CSV, OFX and QIF statements")
+    parser_data.add_argument("--chunksize", type=int, default=None,
+                             help="Import raw data in chunks of N rows")
+    parser_data.add_argument("--rss", action="store_true", default=False,
+                             dest="report_rss",
+                             help="Show peak memory for each chunk")
+    parser_data.add_argument("--memory-report", action="store_true",
+                             default=False, dest="memory_report",
+                             help="Show memory used by each column")
 
 def plotting_parser(subparsers=None):
     """ 'plot' subparser definition """
@@ -56,6 +89,43 @@ def plotting_parser(subparsers=None):
     parser_plot = subparsers.add_parser("plot", help="Generate plots")
     parser_plot.add_argument("-a", action="store_true", default=False,
                              dest="all", help='All')
+    parser_plot.add_argument("--since", type=date, default=None,
+                             help="Only plot transactions on or after"
+                                  " this date, as YYYY-MM-DD")
+    parser_plot.add_argument("--until", type=date, default=None,
+                             help="Only plot transactions on or before"
+                                  " this date, as YYYY-MM-DD")
+
+def date(text):
+    """ Check that text is a date in YYYY-MM-DD format.
+    The text is kept, so that commands can be sent to
+    the daemon as JSON. """
+    try:
+        datetime.datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        err = "{} is not a date in YYYY-MM-DD format".format(text)
+        raise argparse.ArgumentTypeError(err)
+    return text
+
+def serve_parser(subparsers=None):
+    """ 'serve' subparser definition """
+    if subparsers is None:
+        return
+
+    parser_serve = subparsers.add_parser("serve", help="Run as a daemon")
+    parser_serve.add_argument("--stop", action="store_true", default=False,
+                              help="Stop the daemon")
+
+def batch_parser(subparsers=None):
+    """ 'batch' subparser definition """
+    if subparsers is None:
+        return
+
+    parser_batch = subparsers.add_parser("batch", help="Run many commands")
+    parser_batch.add_argument("file", nargs="?", default="-",
+                              help="File with a command on each line."
+                                   " Commands are read from input if it"
+                                   " is '-' or not given")
 
 def info_parser(subparsers=None):
     """ 'info' subparser definition """
@@ -72,14 +142,30 @@ def info_parser(subparsers=None):
     parser_info.add_argument("-t", action="store_true", default=False,
                              dest="transactions", help="Transactions info")
 
-def process_commands(commands=None):
-    """ Process input command and execute a given option """
+def process_commands(commands=None, started=None):
+    """ Process input command and execute a given option.
+    started is the perf_counter() value when the app started,
+    used to show startup time with --timing. """
+    ready = time.perf_counter()
     try:
         pre_process_validation(commands)
     except ValueError as err:
         print(err)
         return
 
+    import user_input.commands.serve as serve_cmd
+    # Commands run by the daemon show its cache stats in their output
+    if not serve_cmd.forward(commands):
+        # Data written by one step is passed to the next in memory
+        with Session():
+            run_commands(commands)
+        if commands.cache_stats:
+            show_cache_stats()
+    if commands.timing:
+        show_timing(ready if started is None else started, ready)
+
+def run_commands(commands):
+    """ Run a given option in this process """
     if commands.parser == "info":
         # Process commands for showing info
         import user_input.commands.info as info_cmd
@@ -105,6 +191,32 @@ def process_commands(commands=None):
         import user_input.commands.plots as plots_cmd
         plots_cmd.process(commands)
 
+    if commands.parser == "serve":
+        # Process commands for running the app as a daemon
+        import user_input.commands.serve as serve_cmd
+        serve_cmd.process(commands)
+
+    if commands.parser == "batch":
+        # Process commands for running many commands in one go
+        import user_input.commands.batch as batch_cmd
+        batch_cmd.process(commands)
+
+def show_cache_stats():
+    """ Show the number of config files read from disk
+    and the number of reads saved by the cache """
+    stats = Jdict.cache_stats
+    info = "\nConfig cache\n >> Files read: {r}\n >> Reads saved: {h}"
+    print(info.format(r=stats["reads"], h=stats["hits"]))
+
+def show_timing(started, ready):
+    """ Show time taken to start the app, i.e. import modules
+    and parse arguments, and time taken to run the command,
+    including modules imported by the command """
+    startup = (ready - started)*1000
+    work = (time.perf_counter() - ready)*1000
+    info = "\nTiming\n >> Startup: {s:.0f} ms\n >> Work: {w:.0f} ms"
+    print(info.format(s=startup, w=work))
+
 def pre_process_validation(commands):
     """ Carry out any validation commands before
     any commands get processed. """